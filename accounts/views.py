@@ -8,6 +8,8 @@ from django.contrib.auth import authenticate
 from django.contrib.auth.models import User
 from django.db import transaction
 from django.db.models import Q
+from ecommerce_api.fieldsets import SparseFieldsetMixin
+from ecommerce_api.timing import ServerTimingMixin
 from .models import UserProfile
 from .serializers import (
     UserSerializer, UserProfileSerializer, UserCreateSerializer,
@@ -15,7 +17,7 @@ from .serializers import (
 )
 
 
-class UserRegistrationView(APIView):
+class UserRegistrationView(ServerTimingMixin, APIView):
     """Separate view for user registration"""
     permission_classes = [AllowAny]
     
@@ -40,7 +42,7 @@ class UserRegistrationView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserLoginView(APIView):
+class UserLoginView(ServerTimingMixin, APIView):
     """Separate view for user login"""
     permission_classes = [AllowAny]
     
@@ -69,7 +71,7 @@ class UserLoginView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(ServerTimingMixin, SparseFieldsetMixin, viewsets.ModelViewSet):
     """
     ViewSet for User model providing full CRUD operations.
     
@@ -84,6 +86,8 @@ class UserViewSet(viewsets.ModelViewSet):
     - PUT /api/users/update_profile/ - Update current user's profile
     - GET /api/users/search/ - Search users
 
+    List, retrieve and search accept ``?fields=`` / ``?exclude=``; leaving
+    out ``profile`` also drops the profile join.
     """
     queryset = User.objects.all()
     serializer_class = UserSerializer
@@ -92,6 +96,7 @@ class UserViewSet(viewsets.ModelViewSet):
     search_fields = ['username', 'email', 'first_name', 'last_name']
     ordering_fields = ['username', 'date_joined']
     ordering = ['username']
+    sparse_fieldset_actions = ('list', 'retrieve', 'search')
     
     def get_permissions(self):
         if self.action in ['create', 'register', 'login']:
@@ -107,9 +112,11 @@ class UserViewSet(viewsets.ModelViewSet):
 
     def get_queryset(self):
         """Filter queryset based on user permissions"""
+        # The nested profile would otherwise be one query per user
+        queryset = User.objects.select_related('profile')
         if self.request.user.is_staff:
-            return User.objects.all()
-        return User.objects.filter(id=self.request.user.id)
+            return queryset
+        return queryset.filter(id=self.request.user.id)
 
     @action(detail=False, methods=['get'])
     def profile(self, request):
@@ -146,12 +153,12 @@ class UserViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_403_FORBIDDEN
             )
         
-        queryset = self.get_queryset().filter(
+        queryset = self.project_queryset(self.get_queryset().filter(
             Q(username__icontains=query) |
             Q(email__icontains=query) |
             Q(first_name__icontains=query) |
             Q(last_name__icontains=query)
-        )
+        ))
         
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -193,7 +200,7 @@ class UserViewSet(viewsets.ModelViewSet):
         })
 
 
-class UserProfileViewSet(viewsets.ModelViewSet):
+class UserProfileViewSet(ServerTimingMixin, viewsets.ModelViewSet):
     """
     ViewSet for UserProfile model providing full CRUD operations.
     
@@ -220,9 +227,10 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         """Filter queryset to show only current user's profile unless admin"""
+        queryset = UserProfile.objects.select_related('user')
         if self.request.user.is_staff:
-            return UserProfile.objects.all()
-        return UserProfile.objects.filter(user=self.request.user)
+            return queryset
+        return queryset.filter(user=self.request.user)
 
     def perform_create(self, serializer):
         """Create a new profile"""
@@ -1,5 +1,6 @@
 from django.contrib import admin
 from django.utils.html import format_html
+from products.rollups import rollup_counts, with_rollups
 from .models import Category
 
 # Constants
@@ -33,15 +34,18 @@ class CategoryAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return with_rollups(super().get_queryset(request))
+
     def products_count(self, obj):
-        count = obj.products.count()
+        count = rollup_counts(obj)['total_products']
         return format_html(
             '<span style="color: {};">{}</span>',
             'green' if count > 0 else 'red',
             count
         )
     products_count.short_description = 'Products'
-    products_count.admin_order_field = 'products__count'
+    products_count.admin_order_field = 'rollup_total_products'
     
     def image_preview(self, obj):
         if obj.image:
@@ -51,6 +55,3 @@ class CategoryAdmin(admin.ModelAdmin):
             )
         return NO_IMAGE_TEXT
     image_preview.short_description = 'Image Preview'
-    
-    def get_queryset(self, request):
-        return super().get_queryset(request).prefetch_related('products')
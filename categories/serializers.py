@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from products.rollups import rollup_counts
 from .models import Category
 
 
@@ -12,7 +13,7 @@ class CategorySerializer(serializers.ModelSerializer):
         read_only_fields = ['slug', 'created_at', 'updated_at']
 
     def get_products_count(self, obj):
-        return obj.products.filter(is_active=True).count()
+        return rollup_counts(obj)['active_products']
 
 
 class CategoryDetailSerializer(serializers.ModelSerializer):
@@ -25,7 +26,7 @@ class CategoryDetailSerializer(serializers.ModelSerializer):
         read_only_fields = ['slug', 'created_at', 'updated_at']
 
     def get_products_count(self, obj):
-        return obj.products.filter(is_active=True).count()
+        return rollup_counts(obj)['active_products']
 
 
 class CategoryCreateUpdateSerializer(serializers.ModelSerializer):
@@ -3,12 +3,19 @@ from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q, Count
+from django.db.models import Q
 from .models import Category
 from .serializers import CategorySerializer, CategoryDetailSerializer
+from ecommerce_api.fieldsets import SparseFieldsetMixin
+from ecommerce_api.timing import ServerTimingMixin
+from products.caching import cached_catalog_response
+from products.conditional import conditional_catalog_response
+from products.models import Product
+from products.pagination import CursorPaginationMixin
+from products.rollups import rollup_counts, with_rollups
 
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ServerTimingMixin, SparseFieldsetMixin, CursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for Category model providing full CRUD operations.
     
@@ -22,6 +29,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
     - GET /api/categories/{slug}/products/ - Get products in a category (public)
     - GET /api/categories/popular/ - Get popular categories (public)
 
+    The ``products`` action accepts ``?pagination=cursor`` for keyset pagination.
+    Anonymous reads are served from the catalog response cache, and list,
+    retrieve, ``products`` and ``popular`` answer conditional requests.
+    List, retrieve and search accept ``?fields=`` / ``?exclude=``.
     """
     queryset = Category.objects.filter(is_active=True)
     serializer_class = CategorySerializer
@@ -32,6 +43,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'created_at', 'updated_at']
     ordering = ['name']
     lookup_field = 'slug'
+    cursor_pagination_actions = ['products']
+    cursor_ordering = '-created_at'
+    sparse_fieldset_actions = ('list', 'retrieve', 'search')
+    sparse_field_columns = {'products_count': []}
 
     def get_permissions(self):
         """Set permissions based on action"""
@@ -45,11 +60,34 @@ class CategoryViewSet(viewsets.ModelViewSet):
         return CategorySerializer
 
     def get_queryset(self):
-        queryset = Category.objects.all()
+        # Product counts come from the category rollups, read in the same query
+        queryset = with_rollups(Category.objects.all())
         if not self.request.user.is_authenticated:
             queryset = queryset.filter(is_active=True)
         return queryset
 
+    @conditional_catalog_response('categories.list')
+    @cached_catalog_response('categories.list')
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @conditional_catalog_response('categories.detail')
+    @cached_catalog_response('categories.detail')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def conditional_querysets(self, slug=None):
+        """Rows a GET response is built from, for ETag / Last-Modified"""
+        # Every category representation counts its active products
+        if self.action in ('retrieve', 'products'):
+            category_id = self.get_queryset().filter(slug=slug).values_list('id', flat=True).first()
+            if category_id is None:
+                return None
+            return [Product.objects.filter(category_id=category_id), Category.objects.filter(id=category_id)]
+        if self.action == 'list':
+            return [Product.objects.all(), self.filter_queryset(self.get_queryset())]
+        return [Product.objects.all(), Category.objects.all()]
+
     def perform_create(self, serializer):
         """Create a new category"""
         serializer.save()
@@ -64,6 +102,8 @@ class CategoryViewSet(viewsets.ModelViewSet):
         instance.save()
 
     @action(detail=True, methods=['get'])
+    @conditional_catalog_response('categories.products')
+    @cached_catalog_response('categories.products')
     def products(self, request, slug=None):
         """Get all products in a specific category"""
         try:
@@ -87,14 +127,14 @@ class CategoryViewSet(viewsets.ModelViewSet):
             )
 
     @action(detail=False, methods=['get'])
+    @conditional_catalog_response('categories.popular')
+    @cached_catalog_response('categories.popular')
     def popular(self, request):
         """Get popular categories based on product count"""
-        popular_categories = self.get_queryset().annotate(
-            product_count=Count('products')
-        ).filter(
-            product_count__gt=0,
+        popular_categories = self.get_queryset().filter(
+            rollup__total_products__gt=0,
             is_active=True
-        ).order_by('-product_count')[:10]
+        ).order_by('-rollup__total_products', 'name')[:10]
         
         serializer = self.get_serializer(popular_categories, many=True)
         return Response(serializer.data)
@@ -109,10 +149,10 @@ class CategoryViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        queryset = self.get_queryset().filter(
+        queryset = self.project_queryset(self.get_queryset().filter(
             Q(name__icontains=query) |
             Q(description__icontains=query)
-        )
+        ))
         
         page = self.paginate_queryset(queryset)
         if page is not None:
@@ -149,16 +189,14 @@ class CategoryViewSet(viewsets.ModelViewSet):
     def stats(self, request, slug=None):
         """Get category statistics"""
         category = self.get_object()
-        total_products = category.products.count()
-        active_products = category.products.filter(is_active=True).count()
-        out_of_stock = category.products.filter(stock_quantity=0, is_active=True).count()
+        counts = rollup_counts(category)
         
         return Response({
             'category': self.get_serializer(category).data,
             'stats': {
-                'total_products': total_products,
-                'active_products': active_products,
-                'out_of_stock': out_of_stock,
-                'in_stock': active_products - out_of_stock
+                'total_products': counts['total_products'],
+                'active_products': counts['active_products'],
+                'out_of_stock': counts['out_of_stock_products'],
+                'in_stock': counts['in_stock_products']
             }
         })
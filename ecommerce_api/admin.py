@@ -1,14 +1,26 @@
+import os
+import re
+
+from django.conf import settings
 from django.contrib import admin
 from django.contrib.admin import AdminSite
 from django.utils.html import format_html
 from django.urls import path
-from django.shortcuts import render
-from django.db.models import Count, Sum, Avg
+from django.contrib import messages
+from django.http import Http404, HttpResponse
+from django.shortcuts import redirect, render
+from django.db.models import Sum, Avg
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from datetime import timedelta
 from accounts.models import UserProfile
 from categories.models import Category
-from products.models import Product
+from products.bitmaps import get_bitmap_index
+from products.models import LOW_STOCK, OUT_OF_STOCK, Product, StockReservation, stock_update_values
+from products import sharded_stock
+from products.rollups import rollup_counts, with_rollups
+from products.signals import products_bulk_updated
+from . import profiling, querybudget, tracing
 from django.contrib.auth.models import User
 
 
@@ -28,6 +40,13 @@ class EcommerceAdminSite(AdminSite):
         urls = super().get_urls()
         custom_urls = [
             path('dashboard/', self.admin_view(self.dashboard_view), name='dashboard'),
+            path('query-report/', self.admin_view(self.query_report_view), name='query-report'),
+            path('traces/', self.admin_view(self.traces_view), name='traces'),
+            path('traces/<str:trace_id>/', self.admin_view(self.trace_detail_view), name='trace-detail'),
+            path('profiler/', self.admin_view(self.profiler_view), name='profiler'),
+            path('profiler/<str:profile_id>/', self.admin_view(self.profile_detail_view), name='profile-detail'),
+            path('profiler/<str:profile_id>/collapsed.txt', self.admin_view(self.profile_collapsed_view), name='profile-collapsed'),
+            path('profiler/<str:profile_id>/flamegraph.svg', self.admin_view(self.profile_flamegraph_view), name='profile-flamegraph'),
         ]
         return custom_urls + urls
 
@@ -37,8 +56,9 @@ class EcommerceAdminSite(AdminSite):
         total_products = Product.objects.count()
         total_categories = Category.objects.count()
         active_products = Product.objects.filter(is_active=True).count()
-        out_of_stock = Product.objects.filter(stock_quantity=0, is_active=True).count()
-        low_stock = Product.objects.filter(stock_quantity__lt=10, stock_quantity__gt=0, is_active=True).count()
+        stock_counts = get_bitmap_index().stock_counts()
+        out_of_stock = stock_counts[OUT_OF_STOCK]
+        low_stock = stock_counts[LOW_STOCK]
         
         # Recent activity
         recent_products = Product.objects.order_by('-created_at')[:5]
@@ -46,12 +66,12 @@ class EcommerceAdminSite(AdminSite):
         
         # Category statistics
         category_stats = Category.objects.annotate(
-            product_count=Count('products')
+            product_count=Coalesce('rollup__total_products', 0)
         ).order_by('-product_count')[:10]
         
         # Stock alerts
         stock_alerts = Product.objects.filter(
-            stock_quantity__lt=10, 
+            stock_bucket__in=[OUT_OF_STOCK, LOW_STOCK],
             is_active=True
         ).order_by('stock_quantity')[:10]
         
@@ -71,6 +91,119 @@ class EcommerceAdminSite(AdminSite):
         }
         return render(request, 'admin/dashboard.html', context)
 
+    def query_report_view(self, request):
+        endpoints, flagged = querybudget.report.snapshot()
+        context = {
+            **self.each_context(request),
+            'endpoints': endpoints,
+            'flagged': flagged,
+            'mode': getattr(settings, 'QUERY_BUDGET_MODE', 'warn'),
+            'default_budget': getattr(settings, 'QUERY_BUDGET_DEFAULT', querybudget.DEFAULT_BUDGET),
+            'threshold': getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', querybudget.DEFAULT_N_PLUS_ONE_THRESHOLD),
+            'title': 'Query report',
+        }
+        return render(request, 'admin/query_report.html', context)
+
+    def traces_view(self, request):
+        traces = tracing.recent_traces()
+        route = request.GET.get('route')
+        if route:
+            traces = [trace for trace in traces if trace.get('route') == route]
+        context = {
+            **self.each_context(request),
+            'traces': traces,
+            'route': route,
+            'slow_ms': getattr(settings, 'TRACE_SLOW_MS', tracing.DEFAULT_SLOW_MS),
+            'sample_rate': getattr(settings, 'TRACE_SAMPLE_RATE', tracing.DEFAULT_SAMPLE_RATE),
+            'title': 'Request traces',
+        }
+        return render(request, 'admin/traces.html', context)
+
+    def trace_detail_view(self, request, trace_id):
+        trace = tracing.find_trace(trace_id)
+        if trace is None:
+            raise Http404('Trace not found; it may have been rotated out')
+        total = trace['duration_ms'] or 1
+        spans = [
+            {
+                **item,
+                'depth': depth,
+                'indent': depth * 16,
+                'offset': item['start_ms'] / total * 100,
+                'width': max((item['duration_ms'] or 0) / total * 100, 0.2),
+            }
+            for depth, item in tracing.span_tree(trace)
+        ]
+        context = {
+            **self.each_context(request),
+            'trace': trace,
+            'spans': spans,
+            'title': f"Trace {trace['method']} {trace['path']}",
+        }
+        return render(request, 'admin/trace_detail.html', context)
+
+    def profiler_view(self, request):
+        if request.method == 'POST':
+            action = request.POST.get('action')
+            try:
+                if action == 'stop':
+                    profile = profiling.stop_profile()
+                    if profile is not None:
+                        return redirect('admin:profile-detail', profile.id)
+                elif action in ('seconds', 'requests'):
+                    seconds = int(request.POST.get('seconds') or 0)
+                    pattern = request.POST.get('pattern', '') if action == 'requests' else None
+                    count = int(request.POST.get('count') or 0) if action == 'requests' else 0
+                    profile = profiling.start_profile(action, seconds, pattern=pattern, requests=count)
+                    messages.success(request, f'Profile {profile.id} started in worker {os.getpid()}.')
+            except ValueError:
+                messages.error(request, 'Seconds and request count must be whole numbers.')
+            except re.error as exc:
+                messages.error(request, f'Invalid path pattern: {exc}')
+            except profiling.ProfilerBusy as exc:
+                messages.error(request, str(exc))
+            return redirect('admin:profiler')
+
+        active = profiling.active_profile()
+        context = {
+            **self.each_context(request),
+            'active': active.as_dict() if active else None,
+            'profiles': profiling.saved_profiles(),
+            'pid': os.getpid(),
+            'interval_ms': getattr(settings, 'PROFILER_INTERVAL_MS', profiling.DEFAULT_INTERVAL_MS),
+            'max_seconds': profiling.max_seconds(),
+            'title': 'Profiler',
+        }
+        return render(request, 'admin/profiler.html', context)
+
+    def profile_or_404(self, profile_id):
+        profile = profiling.load_profile(profile_id)
+        if profile is None:
+            raise Http404('Profile not found')
+        return profile
+
+    def profile_detail_view(self, request, profile_id):
+        profile = self.profile_or_404(profile_id)
+        context = {
+            **self.each_context(request),
+            'profile': profile,
+            'flamegraph': profiling.flamegraph_svg(profile['stacks'], title=f"{profile['samples']} samples"),
+            'functions': profiling.top_functions(profile['stacks']),
+            'title': f'Profile {profile_id}',
+        }
+        return render(request, 'admin/profile_detail.html', context)
+
+    def profile_collapsed_view(self, request, profile_id):
+        profile = self.profile_or_404(profile_id)
+        response = HttpResponse(profiling.collapsed(profile['stacks']), content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="profile-{profile_id}.txt"'
+        return response
+
+    def profile_flamegraph_view(self, request, profile_id):
+        profile = self.profile_or_404(profile_id)
+        svg = profiling.flamegraph_svg(profile['stacks'], title=f"Profile {profile_id} ({profile['samples']} samples)")
+        return HttpResponse(svg, content_type='image/svg+xml')
+
 
 # Create custom admin site
 admin_site = EcommerceAdminSite(name='ecommerce_admin')
@@ -150,8 +283,11 @@ class EnhancedCategoryAdmin(admin.ModelAdmin):
         }),
     )
     
+    def get_queryset(self, request):
+        return with_rollups(super().get_queryset(request))
+
     def products_count(self, obj):
-        count = obj.products.count()
+        count = rollup_counts(obj)['total_products']
         color = 'green' if count > 0 else 'red'
         return format_html(
             '<span style="color: {}; font-weight: bold; background: {}; padding: 2px 8px; border-radius: 12px; font-size: 12px;">{}</span>',
@@ -162,8 +298,8 @@ class EnhancedCategoryAdmin(admin.ModelAdmin):
     products_count.short_description = 'Products'
     
     def products_count_display(self, obj):
-        count = obj.products.count()
-        active_count = obj.products.filter(is_active=True).count()
+        counts = rollup_counts(obj)
+        count, active_count = counts['total_products'], counts['active_products']
         return format_html(
             '<div style="padding: 10px; background: #f8f9fa; border-radius: 5px;">'
             '<strong>Total Products:</strong> {}<br>'
@@ -255,18 +391,30 @@ class EnhancedProductAdmin(admin.ModelAdmin):
         )
     image_preview.short_description = 'Image'
     
+    def update_products(self, queryset, **changes):
+        """queryset.update() that still bumps updated_at and notifies product indexes"""
+        product_ids = list(queryset.values_list('id', flat=True))
+        if 'stock_quantity' in changes:
+            changes = {**stock_update_values(changes.pop('stock_quantity')), **changes}
+        updated = queryset.update(updated_at=timezone.now(), **changes)
+        if 'stock_quantity' in changes:
+            for product_id in sharded_stock.sharded_products(product_ids):
+                sharded_stock.set_total(product_id, changes['stock_quantity'])
+        products_bulk_updated.send(sender=Product, product_ids=product_ids)
+        return updated
+
     def activate_products(self, request, queryset):
-        updated = queryset.update(is_active=True)
+        updated = self.update_products(queryset, is_active=True)
         self.message_user(request, f'{updated} products have been activated.')
     activate_products.short_description = "Activate selected products"
     
     def deactivate_products(self, request, queryset):
-        updated = queryset.update(is_active=False)
+        updated = self.update_products(queryset, is_active=False)
         self.message_user(request, f'{updated} products have been deactivated.')
     deactivate_products.short_description = "Deactivate selected products"
     
     def set_low_stock_alert(self, request, queryset):
-        updated = queryset.update(stock_quantity=5)
+        updated = self.update_products(queryset, stock_quantity=5)
         self.message_user(request, f'{updated} products have been set to low stock alert (5 items).')
     set_low_stock_alert.short_description = "Set low stock alert for selected products"
     
@@ -313,9 +461,23 @@ class EnhancedUserProfileAdmin(admin.ModelAdmin):
     image_preview.short_description = 'Profile Picture'
 
 
+# Stock Reservation Admin
+class StockReservationAdmin(admin.ModelAdmin):
+    list_display = ('product', 'user', 'quantity', 'status', 'session', 'expires_at', 'created_at')
+    list_filter = ('status', 'expires_at', 'created_at')
+    search_fields = ('product__name', 'user__username', 'session')
+    readonly_fields = ('product', 'user', 'quantity', 'status', 'session', 'expires_at', 'created_at', 'updated_at')
+    list_per_page = 50
+    ordering = ('-created_at',)
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('product', 'user')
+
+
 # Register models with enhanced admin classes
 admin_site.register(User, EnhancedUserAdmin)
 admin_site.register(Category, EnhancedCategoryAdmin)
 admin_site.register(Product, EnhancedProductAdmin)
 admin_site.register(UserProfile, EnhancedUserProfileAdmin)
+admin_site.register(StockReservation, StockReservationAdmin)
 
@@ -1,7 +1,8 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
+from django.db.models import Q, Case, When
+from django.db.models.functions import Coalesce
 from django.http import JsonResponse
 from django.views.decorators.http import require_http_methods
 from django.views.decorators.csrf import csrf_exempt
@@ -9,11 +10,17 @@ from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib.auth.models import User
 from django.contrib.auth import REDIRECT_FIELD_NAME
 from django.urls import reverse
-from products.models import Product
+from products.bitmaps import get_bitmap_index
+from products.models import LOW_STOCK, OUT_OF_STOCK, Product
 from categories.models import Category
 from accounts.models import UserProfile
+from products.search import get_search_index
+from .tracing import render
 import json
 
+# Most typo-tolerant matches shown when a search finds nothing as typed
+FUZZY_FALLBACK_LIMIT = 120
+
 
 def is_staff_or_superuser(user):
     """Check if user is staff or superuser"""
@@ -37,9 +44,9 @@ def crud_dashboard(request):
         'total_products': Product.objects.count(),
         'total_categories': Category.objects.count(),
         'total_users': User.objects.count(),
-        'low_stock_count': Product.objects.filter(stock_quantity__lt=10, is_active=True).count(),
+        'low_stock_count': sum(get_bitmap_index().stock_counts()[bucket] for bucket in (LOW_STOCK, OUT_OF_STOCK)),
         'recent_products': Product.objects.select_related('category').order_by('-created_at')[:5],
-        'recent_categories': Category.objects.annotate(product_count=Count('products')).order_by('-created_at')[:5],
+        'recent_categories': Category.objects.annotate(product_count=Coalesce('rollup__total_products', 0)).order_by('-created_at')[:5],
         'recent_users': User.objects.select_related('profile').order_by('-date_joined')[:5],
     }
     return render(request, 'crud_dashboard.html', context)
@@ -102,25 +109,36 @@ def render_products_list(request):
     # Base queryset
     products = Product.objects.select_related('category', 'created_by').filter(is_active=True)
     
-    # Apply search filter
-    if search_query:
-        products = products.filter(
-            Q(name__icontains=search_query) |
-            Q(description__icontains=search_query) |
-            Q(category__name__icontains=search_query)
-        )
-    
     # Apply category filter
     if category_filter:
         products = products.filter(category_id=category_filter)
     
     # Apply stock status filter
     if stock_status == 'in_stock':
-        products = products.filter(stock_quantity__gt=0)
+        products = products.exclude(stock_bucket=OUT_OF_STOCK)
     elif stock_status == 'low_stock':
-        products = products.filter(stock_quantity__lt=10, stock_quantity__gt=0)
+        products = products.filter(stock_bucket=LOW_STOCK)
     elif stock_status == 'out_of_stock':
-        products = products.filter(stock_quantity=0)
+        products = products.filter(stock_bucket=OUT_OF_STOCK)
+    
+    # Apply search filter
+    did_you_mean = None
+    if search_query:
+        matches = products.filter(
+            Q(name__icontains=search_query) |
+            Q(description__icontains=search_query) |
+            Q(category__name__icontains=search_query)
+        )
+        if not matches.exists():
+            # Nothing contains the text as typed, fall back to typo-tolerant search
+            result = get_search_index().search(search_query)
+            did_you_mean = result.suggestion
+            ranked_ids = [product_id for product_id, score in result.hits[:FUZZY_FALLBACK_LIMIT]]
+            if ranked_ids:
+                matches = products.filter(id__in=ranked_ids).order_by(
+                    Case(*[When(id=product_id, then=position) for position, product_id in enumerate(ranked_ids)])
+                )
+        products = matches
     
     # Pagination
     paginator = Paginator(products, 12)  # 12 products per page
@@ -132,6 +150,7 @@ def render_products_list(request):
         'categories': Category.objects.filter(is_active=True),
         'total_products': products.count(),
         'active_products': products.filter(is_active=True).count(),
+        'did_you_mean': did_you_mean,
         'action': 'list'
     }
     return render(request, 'crud_products.html', context)
@@ -280,7 +299,7 @@ def render_categories_list(request):
     status_filter = request.GET.get('status', '')
     
     # Base queryset
-    categories = Category.objects.annotate(product_count=Count('products'))
+    categories = Category.objects.annotate(product_count=Coalesce('rollup__total_products', 0))
     
     # Apply search filter
     if search_query:
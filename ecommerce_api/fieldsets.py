@@ -0,0 +1,105 @@
+"""
+Sparse fieldsets: ``?fields=`` / ``?exclude=`` for read-only viewset actions.
+
+The selected fields trim the serializer output and are also pushed down to
+the queryset with ``.only()``, so unused columns (``description`` above all)
+are never read from the database. Serializer fields whose columns cannot be
+derived from their ``source`` are declared in ``sparse_field_columns``;
+when a selected field's columns are unknown the queryset is left alone.
+"""
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework.exceptions import ValidationError
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.serializers import ListSerializer
+
+
+def parse_field_list(value):
+    return [name.strip() for name in (value or '').split(',') if name.strip()]
+
+
+class SparseFieldsetMixin:
+    fields_param = 'fields'
+    exclude_param = 'exclude'
+    sparse_fieldset_actions = ('list', 'retrieve')
+    # serializer field -> model fields it reads, for fields that are not plain columns
+    sparse_field_columns = {}
+
+    def get_sparse_fields(self):
+        """The requested field names in serializer order, or None for all fields"""
+        if not hasattr(self, '_sparse_fields'):
+            self._sparse_fields = self._parse_sparse_fields()
+        return self._sparse_fields
+
+    def _parse_sparse_fields(self):
+        request = self.request
+        if request is None or request.method not in SAFE_METHODS:
+            return None
+        if self.action not in self.sparse_fieldset_actions:
+            return None
+        params = request.query_params
+        fields = parse_field_list(params.get(self.fields_param))
+        exclude = parse_field_list(params.get(self.exclude_param))
+        if not fields and not exclude:
+            return None
+
+        available = list(self.get_serializer_class()(context=self.get_serializer_context()).fields)
+        for param, names in ((self.fields_param, fields), (self.exclude_param, exclude)):
+            unknown = [name for name in names if name not in available]
+            if unknown:
+                raise ValidationError({param: [f"Unknown field(s): {', '.join(unknown)}"]})
+        selected = [name for name in available if (not fields or name in fields) and name not in exclude]
+        return tuple(selected)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        fields = self.get_sparse_fields()
+        if fields is not None:
+            target = serializer.child if isinstance(serializer, ListSerializer) else serializer
+            for name in list(target.fields):
+                if name not in fields:
+                    target.fields.pop(name)
+        return serializer
+
+    def filter_queryset(self, queryset):
+        return self.project_queryset(super().filter_queryset(queryset))
+
+    def project_queryset(self, queryset):
+        """Load only the columns the selected fields read"""
+        fields = self.get_sparse_fields()
+        if fields is None:
+            return queryset
+        columns = self.sparse_columns(queryset.model, fields)
+        if columns is None:
+            return queryset
+
+        select_related = queryset.query.select_related
+        if select_related is True:
+            return queryset
+        if select_related:
+            # A relation can only be followed if its foreign key is loaded
+            keep = [name for name in select_related if name in columns]
+            queryset = queryset.select_related(None)
+            if keep:
+                queryset = queryset.select_related(*keep)
+        return queryset.only(*columns)
+
+    def sparse_columns(self, model, fields):
+        serializer_fields = self.get_serializer_class()(context=self.get_serializer_context()).fields
+        columns = []
+        for name in fields:
+            if name in self.sparse_field_columns:
+                columns.extend(self.sparse_field_columns[name])
+                continue
+            field = serializer_fields[name]
+            if field.source == '*':
+                return None
+            try:
+                model_field = model._meta.get_field(field.source_attrs[0])
+            except FieldDoesNotExist:
+                return None
+            if model_field.concrete or (model_field.one_to_one and model_field.auto_created):
+                # A reverse one-to-one reads no column here, but naming it
+                # lets select_related() keep following it
+                columns.append(model_field.name)
+            # Other reverse relations read no columns of this table
+        return list(dict.fromkeys(columns)) or [model._meta.pk.name]
@@ -1,10 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from django.contrib.auth.hashers import make_password
-from categories.models import Category
 from products.models import Product
-from accounts.models import UserProfile
-import random
+from ecommerce_api.seeding import Seeder
 from decimal import Decimal
 
 class Command(BaseCommand):
@@ -13,16 +10,15 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting to create mock data...'))
         
+        seeder = Seeder(log=self.stdout.write)
+        
         # Create superuser if it doesn't exist
-        if not User.objects.filter(username='admin').exists():
-            admin_user = User.objects.create_user(
-                username='admin',
-                email='admin@example.com',
-                password='admin123',
-                is_staff=True,
-                is_superuser=True
-            )
-            self.stdout.write(self.style.SUCCESS(f'Created superuser: admin/admin123'))
+        seeder.ensure_users([{
+            'username': 'admin',
+            'email': 'admin@example.com',
+            'is_staff': True,
+            'is_superuser': True,
+        }], password='admin123')
         
         # Create regular users
         users_data = [
@@ -32,18 +28,7 @@ class Command(BaseCommand):
             {'username': 'alice_brown', 'email': 'alice@example.com', 'first_name': 'Alice', 'last_name': 'Brown'},
         ]
         
-        created_users = []
-        for user_data in users_data:
-            if not User.objects.filter(username=user_data['username']).exists():
-                user = User.objects.create_user(
-                    username=user_data['username'],
-                    email=user_data['email'],
-                    password='password123',
-                    first_name=user_data['first_name'],
-                    last_name=user_data['last_name']
-                )
-                created_users.append(user)
-                self.stdout.write(f'Created user: {user.username}')
+        seeder.ensure_users(users_data, password='password123')
         
         # Create categories
         categories_data = [
@@ -57,15 +42,8 @@ class Command(BaseCommand):
             {'name': 'Health & Beauty', 'description': 'Health products and beauty supplies'},
         ]
         
-        created_categories = []
-        for cat_data in categories_data:
-            if not Category.objects.filter(name=cat_data['name']).exists():
-                category = Category.objects.create(
-                    name=cat_data['name'],
-                    description=cat_data['description']
-                )
-                created_categories.append(category)
-                self.stdout.write(f'Created category: {category.name}')
+        categories = seeder.ensure_categories([(cat['name'], cat['description']) for cat in categories_data])
+        categories = {category.name: category for category in categories}
         
         # Create products
         products_data = [
@@ -113,41 +91,25 @@ class Command(BaseCommand):
             {'name': 'Hair Dryer Pro', 'description': 'Professional hair dryer with multiple settings', 'price': 129.99, 'stock_quantity': 75, 'category': 'Health & Beauty'},
         ]
         
-        created_products = []
-        for prod_data in products_data:
-            if not Product.objects.filter(name=prod_data['name']).exists():
-                category = Category.objects.get(name=prod_data['category'])
-                # Use admin user as the creator for all products
-                admin_user = User.objects.get(username='admin')
-                product = Product.objects.create(
-                    name=prod_data['name'],
-                    description=prod_data['description'],
-                    price=prod_data['price'],
-                    stock_quantity=prod_data['stock_quantity'],
-                    category=category,
-                    created_by=admin_user
-                )
-                created_products.append(product)
-                self.stdout.write(f'Created product: {product.name} - ${product.price}')
-        
-        # Create user profiles for regular users
-        for user in created_users:
-            if not hasattr(user, 'profile'):
-                profile = UserProfile.objects.create(
-                    user=user,
-                    phone=f'+1-555-{random.randint(100, 999)}-{random.randint(1000, 9999)}',
-                    address=f'{random.randint(100, 9999)} {random.choice(["Main St", "Oak Ave", "Pine Rd", "Elm St"])}',
-                    city=random.choice(['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix']),
-                    state=random.choice(['NY', 'CA', 'IL', 'TX', 'AZ']),
-                    zip_code=f'{random.randint(10000, 99999)}',
-                    country='USA'
-                )
-                self.stdout.write(f'Created profile for user: {user.username}')
+        # Use admin user as the creator for all products
+        admin_user = User.objects.get(username='admin')
+        seeder.ensure_products([
+            {
+                'name': prod_data['name'],
+                'description': prod_data['description'],
+                'price': Decimal(str(prod_data['price'])),
+                'stock_quantity': prod_data['stock_quantity'],
+                'category': categories[prod_data['category']],
+                'created_by': admin_user,
+            }
+            for prod_data in products_data
+        ])
+        seeder.finish()
         
         self.stdout.write(self.style.SUCCESS('\n=== Mock Data Creation Complete ==='))
-        self.stdout.write(f'✅ Created {len(created_users)} users')
-        self.stdout.write(f'✅ Created {len(created_categories)} categories')
-        self.stdout.write(f'✅ Created {len(created_products)} products (now 30 total products!)')
+        self.stdout.write(f"✅ Created {seeder.created['users']} users")
+        self.stdout.write(f"✅ Created {seeder.created['categories']} categories")
+        self.stdout.write(f"✅ Created {seeder.created['products']} products ({Product.objects.count()} total products)")
         self.stdout.write(f'✅ Created user profiles')
         
         self.stdout.write(self.style.SUCCESS('\n=== Login Credentials ==='))
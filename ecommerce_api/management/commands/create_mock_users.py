@@ -1,7 +1,6 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from accounts.models import UserProfile
-import random
+from ecommerce_api.seeding import Seeder
 
 class Command(BaseCommand):
     help = 'Create mock users for testing and debugging purposes'
@@ -9,19 +8,17 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Starting to create mock users...'))
         
+        seeder = Seeder(log=self.stdout.write)
+        
         # Create superuser if it doesn't exist
-        if not User.objects.filter(username='admin').exists():
-            admin_user = User.objects.create_user(
-                username='admin',
-                email='admin@example.com',
-                password='admin123',
-                is_staff=True,
-                is_superuser=True
-            )
-            self.stdout.write(self.style.SUCCESS(f'Created superuser: admin/admin123'))
-        else:
-            admin_user = User.objects.get(username='admin')
+        if User.objects.filter(username='admin').exists():
             self.stdout.write(f'Admin user already exists: admin/admin123')
+        seeder.ensure_users([{
+            'username': 'admin',
+            'email': 'admin@example.com',
+            'is_staff': True,
+            'is_superuser': True,
+        }], password='admin123')
         
         # Create regular users with more variety
         users_data = [
@@ -44,43 +41,19 @@ class Command(BaseCommand):
             {'username': 'support_alex', 'email': 'alex@example.com', 'first_name': 'Alex', 'last_name': 'Taylor', 'is_staff': True},
         ]
         
-        created_users = []
-        for user_data in users_data:
-            if not User.objects.filter(username=user_data['username']).exists():
-                user = User.objects.create_user(
-                    username=user_data['username'],
-                    email=user_data['email'],
-                    password='password123',
-                    first_name=user_data['first_name'],
-                    last_name=user_data['last_name'],
-                    is_staff=user_data['is_staff']
-                )
-                created_users.append(user)
-                self.stdout.write(f'Created user: {user.username} (Staff: {user.is_staff})')
-            else:
-                self.stdout.write(f'User already exists: {user_data["username"]}')
+        existing = set(User.objects.filter(
+            username__in=[user_data['username'] for user_data in users_data]
+        ).values_list('username', flat=True))
+        for username in sorted(existing):
+            self.stdout.write(f'User already exists: {username}')
+        seeder.ensure_users(users_data, password='password123')
         
         # Create user profiles for all users (including existing ones)
-        all_users = User.objects.all()
-        profiles_created = 0
-        
-        for user in all_users:
-            if not hasattr(user, 'profile'):
-                profile = UserProfile.objects.create(
-                    user=user,
-                    phone=f'+1-555-{random.randint(100, 999)}-{random.randint(1000, 9999)}',
-                    address=f'{random.randint(100, 9999)} {random.choice(["Main St", "Oak Ave", "Pine Rd", "Elm St", "Cedar Ln", "Maple Dr"])}',
-                    city=random.choice(['New York', 'Los Angeles', 'Chicago', 'Houston', 'Phoenix', 'Philadelphia', 'San Antonio', 'San Diego', 'Dallas', 'San Jose']),
-                    state=random.choice(['NY', 'CA', 'IL', 'TX', 'AZ', 'PA', 'FL', 'OH', 'GA', 'NC']),
-                    zip_code=f'{random.randint(10000, 99999)}',
-                    country='USA'
-                )
-                profiles_created += 1
-                self.stdout.write(f'Created profile for user: {user.username}')
+        profiles_created = seeder.ensure_profiles(User.objects.all())
         
         self.stdout.write(self.style.SUCCESS('\n=== Mock Users Creation Complete ==='))
         self.stdout.write(f'✅ Total users in system: {User.objects.count()}')
-        self.stdout.write(f'✅ New users created: {len(created_users)}')
+        self.stdout.write(f"✅ New users created: {seeder.created['users']}")
         self.stdout.write(f'✅ New profiles created: {profiles_created}')
         
         self.stdout.write(self.style.SUCCESS('\n=== Login Credentials ==='))
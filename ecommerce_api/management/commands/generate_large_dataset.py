@@ -1,15 +1,13 @@
-from django.core.management.base import BaseCommand
+import os
+
 from django.contrib.auth.models import User
-from django.utils.text import slugify
-from decimal import Decimal
-import random
-from faker import Faker
-from categories.models import Category
-from products.models import Product
-from accounts.models import UserProfile
+from django.core.management.base import BaseCommand
+
+from ecommerce_api.seeding import DEFAULT_BATCH_SIZE, DEFAULT_SEED, Seeder, clear_catalog
+
 
 class Command(BaseCommand):
-    help = 'Generate large dataset with 500 products and 200 users for monitoring'
+    help = 'Generate a large dataset of users and products in bulk (deterministic for a given --seed)'
 
     def add_arguments(self, parser):
         parser.add_argument(
@@ -29,33 +27,55 @@ class Command(BaseCommand):
             action='store_true',
             help='Clear existing data before generating new data'
         )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=DEFAULT_SEED,
+            help=f'Seed the generated data is derived from (default: {DEFAULT_SEED})'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes generating and inserting rows; 1 runs in this process (default: CPU count)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows per INSERT statement (default: {DEFAULT_BATCH_SIZE})'
+        )
 
     def handle(self, *args, **options):
-        fake = Faker()
+        seeder = Seeder(
+            seed=options['seed'],
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            log=self.stdout.write,
+        )
         
         if options['clear']:
             self.stdout.write('Clearing existing data...')
-            Product.objects.all().delete()
-            UserProfile.objects.all().delete()
-            User.objects.filter(is_superuser=False).delete()
+            clear_catalog()
             self.stdout.write('Existing data cleared.')
         
         # Create categories if they don't exist
-        categories = self.create_categories()
+        categories = self.create_categories(seeder)
         
         # Create users
-        users = self.create_users(options['users'], fake)
+        users = self.create_users(options['users'], seeder)
         
         # Create products
-        products = self.create_products(options['products'], categories, users, fake)
+        products = self.create_products(options['products'], categories, seeder)
+        seeder.finish()
         
         self.stdout.write(
             self.style.SUCCESS(
                 f'✅ Large dataset generated successfully!\n'
                 f'📊 Summary:\n'
                 f'   - Categories: {len(categories)}\n'
-                f'   - Users: {len(users)}\n'
-                f'   - Products: {len(products)}\n\n'
+                f'   - Users: {users}\n'
+                f'   - Products: {products}\n\n'
                 f'🔗 You can now:\n'
                 f'   - Visit: http://127.0.0.1:8000/api/\n'
                 f'   - Browse products: http://127.0.0.1:8000/api/products/\n'
@@ -65,9 +85,8 @@ class Command(BaseCommand):
             )
         )
 
-    def create_categories(self):
+    def create_categories(self, seeder):
         """Create comprehensive product categories"""
-        categories = []
         category_data = [
             ('Electronics', 'Electronic devices and accessories'),
             ('Clothing', 'Apparel and fashion items'),
@@ -86,81 +105,25 @@ class Command(BaseCommand):
             ('Outdoor & Camping', 'Outdoor and camping gear'),
         ]
         
-        for name, description in category_data:
-            category, created = Category.objects.get_or_create(
-                name=name,
-                defaults={
-                    'slug': slugify(name),
-                    'description': description,
-                    'is_active': True
-                }
-            )
-            categories.append(category)
-            if created:
-                self.stdout.write(f'Created category: {name}')
-        
-        return categories
+        return seeder.ensure_categories(category_data)
 
-    def create_users(self, num_users, fake):
-        """Create sample users"""
-        users = []
-        
-        # Create admin user if not exists
-        admin_user, created = User.objects.get_or_create(
-            username='admin',
-            defaults={
-                'email': 'admin@example.com',
-                'first_name': 'Admin',
-                'last_name': 'User',
-                'is_active': True,
-                'is_staff': True,
-                'is_superuser': True
-            }
-        )
-        if created:
-            admin_user.set_password('admin')
-            admin_user.save()
-            UserProfile.objects.create(user=admin_user)
-            self.stdout.write('Created admin user: admin/admin')
-        users.append(admin_user)
-        
-        # Create regular users
-        for i in range(num_users - 1):  # -1 because we already have admin
-            username = fake.unique.user_name()
-            email = fake.unique.email()
-            first_name = fake.first_name()
-            last_name = fake.last_name()
-            
-            user = User.objects.create(
-                username=username,
-                email=email,
-                first_name=first_name,
-                last_name=last_name,
-                is_active=random.choice([True, True, True, False]),  # 75% active
-                is_staff=random.choice([True, False, False, False, False]),  # 20% staff
-            )
-            user.set_password('password123')
-            user.save()
-            
-            # Update user profile (signal creates it automatically)
-            profile = user.profile
-            profile.phone_number = fake.phone_number()[:20]
-            profile.address = fake.address()
-            profile.date_of_birth = fake.date_of_birth(minimum_age=18, maximum_age=80)
-            profile.save()
-            
-            users.append(user)
-            
-            if (i + 1) % 50 == 0:
-                self.stdout.write(f'Created {i + 1} users...')
-        
-        self.stdout.write(f'Created {len(users)} users total')
-        return users
+    def create_users(self, num_users, seeder):
+        """Create the admin user and ``num_users - 1`` generated users; return how many were written"""
+        seeder.ensure_users([{
+            'username': 'admin',
+            'email': 'admin@example.com',
+            'first_name': 'Admin',
+            'last_name': 'User',
+            'is_active': True,
+            'is_staff': True,
+            'is_superuser': True,
+        }], password='admin')
+        created = seeder.generate_users(max(num_users - 1, 0), password='password123')
+        self.stdout.write(f'Created {created + 1} users total')
+        return created + 1
 
-    def create_products(self, num_products, categories, users, fake):
-        """Create sample products"""
-        products = []
-        
+    def create_products(self, num_products, categories, seeder):
+        """Create sample products; return how many were written"""
         # Product templates for different categories
         product_templates = {
             'Electronics': [
@@ -315,45 +278,12 @@ class Command(BaseCommand):
             ],
         }
         
-        for i in range(num_products):
-            # Select random category
-            category = random.choice(categories)
-            category_name = category.name
-            
-            # Get product template for this category
-            if category_name in product_templates:
-                templates = product_templates[category_name]
-            else:
-                templates = product_templates['Electronics']  # fallback
-            
-            # Select random template
-            name_template, desc_template, min_price, max_price = random.choice(templates)
-            
-            # Generate unique product name
-            product_name = f"{name_template} {fake.word().title()} {fake.word().title()}"
-            
-            # Generate price within range
-            price = Decimal(str(round(random.uniform(min_price, max_price), 2)))
-            
-            # Generate stock quantity
-            stock_quantity = random.randint(0, 200)
-            
-            # Create product
-            product = Product.objects.create(
-                name=product_name,
-                slug=slugify(product_name),
-                description=f"{desc_template} - {fake.sentence()}",
-                price=price,
-                category=category,
-                stock_quantity=stock_quantity,
-                is_active=random.choice([True, True, True, False]),  # 75% active
-                created_by=random.choice(users)
-            )
-            
-            products.append(product)
-            
-            if (i + 1) % 100 == 0:
-                self.stdout.write(f'Created {i + 1} products...')
-        
-        self.stdout.write(f'Created {len(products)} products total')
-        return products
+        fallback = product_templates['Electronics']
+        templates = {
+            category.id: product_templates.get(category.name, fallback)
+            for category in categories
+        }
+        user_ids = list(User.objects.order_by('id').values_list('id', flat=True))
+        created = seeder.generate_products(num_products, templates, user_ids)
+        self.stdout.write(f'Created {created} products total')
+        return created
@@ -0,0 +1,41 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce_api.seeding import DEFAULT_BATCH_SIZE
+from ecommerce_api.snapshots import SnapshotError, check_schema, load_snapshot, read_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Replace categories, users, profiles and products with the contents of a dataset snapshot'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Snapshot file written by save_snapshot')
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Only check the checksums and columns; change nothing'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Rows per executemany batch (default: {DEFAULT_BATCH_SIZE})'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        try:
+            if options['verify']:
+                header, blocks = read_snapshot(options['path'])
+                check_schema(header)
+                self.stdout.write(self.style.SUCCESS(f"{options['path']} is valid (sha256 {header['sha256'][:12]})"))
+                return
+            loaded = load_snapshot(options['path'], batch_size=options['batch_size'])
+        except (OSError, SnapshotError) as exc:
+            raise CommandError(str(exc))
+
+        elapsed = time.perf_counter() - started
+        for label, rows in loaded.items():
+            self.stdout.write(f'{label}: {rows} rows')
+        self.stdout.write(self.style.SUCCESS(f'Loaded {sum(loaded.values())} rows in {elapsed:.2f}s'))
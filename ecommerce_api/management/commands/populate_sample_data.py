@@ -1,10 +1,7 @@
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from django.utils.text import slugify
+from decimal import Decimal
 import random
-from categories.models import Category
-from products.models import Product
-from accounts.models import UserProfile
+from ecommerce_api.seeding import Seeder
 
 class Command(BaseCommand):
     help = 'Generate basic sample data for the e-commerce project (MySQL compatible)'
@@ -14,14 +11,18 @@ class Command(BaseCommand):
             self.style.SUCCESS('Starting basic data generation for MySQL...')
         )
         
+        seeder = Seeder(log=self.stdout.write)
+        
         # Create categories
-        categories = self.create_categories()
+        categories = self.create_categories(seeder)
         
         # Create users
-        users = self.create_users()
+        users = self.create_users(seeder)
         
         # Create products
-        products = self.create_products(categories, users)
+        products = self.create_products(seeder, categories, users)
+        
+        seeder.finish()
         
         self.stdout.write(
             self.style.SUCCESS(
@@ -32,9 +33,8 @@ class Command(BaseCommand):
             )
         )
 
-    def create_categories(self):
+    def create_categories(self, seeder):
         """Create basic product categories"""
-        categories = []
         category_data = [
             ('Electronics', 'Electronic devices and accessories'),
             ('Clothing', 'Apparel and fashion items'),
@@ -42,82 +42,46 @@ class Command(BaseCommand):
             ('Sports', 'Sports equipment and athletic gear'),
             ('Books', 'Books and educational materials'),
         ]
-        
-        for name, description in category_data:
-            category, created = Category.objects.get_or_create(
-                name=name,
-                defaults={
-                    'slug': slugify(name),
-                    'description': description,
-                    'is_active': True
-                }
-            )
-            categories.append(category)
-            if created:
-                self.stdout.write(f'Created category: {name}')
-        
-        return categories
+        return seeder.ensure_categories(category_data)
 
-    def create_users(self):
+    def create_users(self, seeder):
         """Create sample users"""
-        users = []
         user_data = [
             ('admin', 'admin@example.com', 'admin'),
             ('user1', 'user1@example.com', 'password123'),
             ('user2', 'user2@example.com', 'password123'),
         ]
         
+        users = []
         for username, email, password in user_data:
-            user, created = User.objects.get_or_create(
-                username=username,
-                defaults={
-                    'email': email,
-                    'first_name': username.capitalize(),
-                    'last_name': 'User',
-                    'is_active': True
-                }
-            )
-            if created:
-                user.set_password(password)
-                user.save()
-                # Create profile
-                UserProfile.objects.create(user=user)
-                self.stdout.write(f'Created user: {username}')
-            users.append(user)
-        
+            users += seeder.ensure_users([{
+                'username': username,
+                'email': email,
+                'first_name': username.capitalize(),
+                'last_name': 'User',
+            }], password=password)
         return users
 
-    def create_products(self, categories, users):
+    def create_products(self, seeder, categories, users):
         """Create sample products"""
-        products = []
         product_data = [
-            ('Smartphone', 'Latest smartphone with advanced features', 599.99, 'Electronics'),
-            ('Laptop', 'High-performance laptop for work and gaming', 999.99, 'Electronics'),
-            ('T-Shirt', 'Comfortable cotton t-shirt', 19.99, 'Clothing'),
-            ('Jeans', 'Classic blue jeans', 49.99, 'Clothing'),
-            ('Garden Tool Set', 'Essential tools for gardening', 79.99, 'Home & Garden'),
-            ('Basketball', 'Official size basketball', 29.99, 'Sports'),
-            ('Python Programming Book', 'Learn Python programming', 39.99, 'Books'),
+            ('Smartphone', 'Latest smartphone with advanced features', '599.99', 'Electronics'),
+            ('Laptop', 'High-performance laptop for work and gaming', '999.99', 'Electronics'),
+            ('T-Shirt', 'Comfortable cotton t-shirt', '19.99', 'Clothing'),
+            ('Jeans', 'Classic blue jeans', '49.99', 'Clothing'),
+            ('Garden Tool Set', 'Essential tools for gardening', '79.99', 'Home & Garden'),
+            ('Basketball', 'Official size basketball', '29.99', 'Sports'),
+            ('Python Programming Book', 'Learn Python programming', '39.99', 'Books'),
         ]
         
+        rows = []
         for name, description, price, category_name in product_data:
-            category = next((c for c in categories if c.name == category_name), categories[0])
-            creator = random.choice(users)
-            
-            product, created = Product.objects.get_or_create(
-                name=name,
-                defaults={
-                    'slug': slugify(name),
-                    'description': description,
-                    'price': price,
-                    'category': category,
-                    'stock_quantity': random.randint(10, 100),
-                    'is_active': True,
-                    'created_by': creator
-                }
-            )
-            if created:
-                self.stdout.write(f'Created product: {name}')
-            products.append(product)
-        
-        return products
+            rows.append({
+                'name': name,
+                'description': description,
+                'price': Decimal(price),
+                'category': next((c for c in categories if c.name == category_name), categories[0]),
+                'stock_quantity': random.randint(10, 100),
+                'created_by': random.choice(users),
+            })
+        return seeder.ensure_products(rows)
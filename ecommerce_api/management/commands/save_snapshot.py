@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ecommerce_api.snapshots import save_snapshot, snapshot_path
+
+
+class Command(BaseCommand):
+    help = 'Save categories, users, profiles and products to a dataset snapshot file'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='Snapshot file to write (default: the cache path for --users/--products/--seed)'
+        )
+        parser.add_argument('--users', type=int, help='User count the dataset was generated with')
+        parser.add_argument('--products', type=int, help='Product count the dataset was generated with')
+        parser.add_argument('--seed', type=int, help='Seed the dataset was generated with')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        if path is None:
+            if options['users'] is None or options['products'] is None or options['seed'] is None:
+                raise CommandError('Give a path, or --users, --products and --seed')
+            path = snapshot_path(options['users'], options['products'], options['seed'])
+
+        started = time.perf_counter()
+        header = save_snapshot(path, seed=options['seed'])
+        elapsed = time.perf_counter() - started
+        for table in header['tables']:
+            self.stdout.write(f"{table['model']}: {table['rows']} rows")
+        self.stdout.write(self.style.SUCCESS(f'Saved {path} in {elapsed:.2f}s (sha256 {header["sha256"][:12]})'))
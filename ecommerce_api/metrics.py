@@ -0,0 +1,310 @@
+"""
+Prometheus metrics shared by every worker process.
+
+``MetricsMiddleware`` records, per route (URL name):
+
+- ``http_requests_total{route, method, status}``
+- ``http_request_duration_seconds{route, method}`` (histogram)
+- ``http_requests_in_flight``
+- ``db_queries_total{route}`` and ``db_query_duration_seconds_total{route}``
+
+and ``products.caching`` adds ``catalog_cache_requests_total{endpoint,
+result}``, exported with a derived ``catalog_cache_hit_ratio``.
+
+Recording is lock free: every thread updates its own dicts, and only the
+first use on a new thread takes a lock to register them. Each process
+merges its threads' values and writes them to ``METRICS_DIR/metrics-<pid>.json``
+at most every ``METRICS_FLUSH_SECONDS`` (after a request, so no extra
+thread runs), replacing the file atomically. ``/metrics`` adds up the files
+of all workers plus the live values of the process answering, so a scrape
+sees the whole gunicorn server whichever worker it reaches. Counters of
+workers that have exited are kept, so totals never go backwards; their
+gauges are dropped.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+DEFAULT_FLUSH_SECONDS = 5
+
+# name -> (type, help)
+METRICS = {
+    'http_requests_total': ('counter', 'HTTP requests by route, method and status code'),
+    'http_request_duration_seconds': ('histogram', 'Time to produce a response, by route and method'),
+    'http_requests_in_flight': ('gauge', 'Requests being handled right now'),
+    'db_queries_total': ('counter', 'SQL queries run while handling requests, by route'),
+    'db_query_duration_seconds_total': ('counter', 'Time spent in SQL queries, by route'),
+    'catalog_cache_requests_total': ('counter', 'Catalog response cache lookups by endpoint and result'),
+    'catalog_cache_hit_ratio': ('gauge', 'Share of catalog response cache lookups that were hits'),
+}
+
+_local = threading.local()
+# Every thread's stores; appended to once per thread
+_stores = []
+_stores_lock = threading.Lock()
+_flush_lock = threading.Lock()
+_last_flush = 0.0
+
+
+def latency_buckets():
+    return tuple(getattr(settings, 'METRICS_LATENCY_BUCKETS', DEFAULT_BUCKETS))
+
+
+def metrics_dir():
+    return Path(getattr(settings, 'METRICS_DIR', Path(settings.BASE_DIR) / 'var' / 'metrics'))
+
+
+def _store():
+    store = getattr(_local, 'store', None)
+    if store is None:
+        store = _local.store = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        with _stores_lock:
+            _stores.append(store)
+    return store
+
+
+def _key(name, labels):
+    return (name, tuple(sorted(labels.items())))
+
+
+def inc(name, value=1, **labels):
+    """Add ``value`` to a counter"""
+    counters = _store()['counters']
+    key = _key(name, labels)
+    counters[key] = counters.get(key, 0) + value
+
+
+def gauge_add(name, value, **labels):
+    """Move a gauge up or down"""
+    gauges = _store()['gauges']
+    key = _key(name, labels)
+    gauges[key] = gauges.get(key, 0) + value
+
+
+def observe(name, value, **labels):
+    """Record one observation in a histogram with ``latency_buckets()``"""
+    histograms = _store()['histograms']
+    key = _key(name, labels)
+    values = histograms.get(key)
+    buckets = latency_buckets()
+    if values is None:
+        # Per-bucket counts (not cumulative), then the +Inf count and the sum
+        values = histograms[key] = [0] * (len(buckets) + 2)
+    for index, bound in enumerate(buckets):
+        if value <= bound:
+            values[index] += 1
+            break
+    else:
+        values[len(buckets)] += 1
+    values[-1] += value
+
+
+def process_values():
+    """This process's values, merged over its threads"""
+    merged = {'counters': {}, 'gauges': {}, 'histograms': {}}
+    with _stores_lock:
+        stores = list(_stores)
+    for store in stores:
+        for kind in ('counters', 'gauges'):
+            # dict.copy() runs under the GIL, so owners can keep writing
+            for key, value in store[kind].copy().items():
+                merged[kind][key] = merged[kind].get(key, 0) + value
+        for key, values in store['histograms'].copy().items():
+            merge_histogram(merged['histograms'], key, list(values))
+    return merged
+
+
+def merge_histogram(histograms, key, values):
+    current = histograms.get(key)
+    if current is None or len(current) != len(values):
+        histograms[key] = values
+    else:
+        histograms[key] = [a + b for a, b in zip(current, values)]
+
+
+def encode(values):
+    return {
+        kind: [[name, [list(label) for label in labels], value] for (name, labels), value in entries.items()]
+        for kind, entries in values.items()
+    }
+
+
+def decode(data):
+    return {
+        kind: {(name, tuple(tuple(label) for label in labels)): value for name, labels, value in entries}
+        for kind, entries in data.items()
+    }
+
+
+def flush(force=False):
+    """Write this process's values to its file, at most every ``METRICS_FLUSH_SECONDS``"""
+    global _last_flush
+    now = time.monotonic()
+    interval = getattr(settings, 'METRICS_FLUSH_SECONDS', DEFAULT_FLUSH_SECONDS)
+    if not force and now - _last_flush < interval:
+        return
+    # Another thread of this process is already writing the same values
+    if not _flush_lock.acquire(blocking=False):
+        return
+    try:
+        _last_flush = now
+        directory = metrics_dir()
+        directory.mkdir(parents=True, exist_ok=True)
+        path = directory / f'metrics-{os.getpid()}.json'
+        partial = directory / f'.metrics-{os.getpid()}.json.partial'
+        partial.write_text(json.dumps({'pid': os.getpid(), 'values': encode(process_values())}))
+        os.replace(partial, path)
+    except OSError as exc:
+        # Other workers' scrapes miss this one's latest values until the next flush
+        logger.warning('Could not write metrics to %s: %s', metrics_dir(), exc)
+    finally:
+        _flush_lock.release()
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+def collect():
+    """Values summed over every worker's file, with this process's live values"""
+    pid = os.getpid()
+    total = process_values()
+    directory = metrics_dir()
+    paths = sorted(directory.glob('metrics-*.json')) if directory.exists() else []
+    for path in paths:
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        if data['pid'] == pid:
+            continue
+        values = decode(data['values'])
+        if not process_alive(data['pid']):
+            values['gauges'] = {}
+        for kind in ('counters', 'gauges'):
+            for key, value in values.get(kind, {}).items():
+                total[kind][key] = total[kind].get(key, 0) + value
+        for key, value in values.get('histograms', {}).items():
+            merge_histogram(total['histograms'], key, value)
+    return total
+
+
+def format_labels(labels, extra=()):
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (
+        (name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    )
+    return '{' + ','.join(f'{name}="{value}"' for name, value in escaped) + '}'
+
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def add_cache_hit_ratios(values):
+    results = {}
+    for (name, labels), value in values['counters'].items():
+        if name == 'catalog_cache_requests_total':
+            labels = dict(labels)
+            results.setdefault(labels.get('endpoint', ''), {})[labels.get('result')] = value
+    for endpoint, counts in results.items():
+        lookups = counts.get('hits', 0) + counts.get('misses', 0)
+        if lookups:
+            values['gauges'][('catalog_cache_hit_ratio', (('endpoint', endpoint),))] = counts.get('hits', 0) / lookups
+
+
+def render():
+    """Every metric in the Prometheus text exposition format"""
+    values = collect()
+    add_cache_hit_ratios(values)
+    by_name = {}
+    for kind in ('counters', 'gauges', 'histograms'):
+        for (name, labels), value in values[kind].items():
+            by_name.setdefault(name, []).append((labels, value))
+    by_name.setdefault('http_requests_in_flight', [((), 0)])
+
+    buckets = latency_buckets()
+    lines = []
+    for name in sorted(by_name):
+        kind, description = METRICS.get(name, ('untyped', name))
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for labels, value in sorted(by_name[name]):
+            if kind != 'histogram':
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+                continue
+            cumulative = 0
+            for bound, count in zip(buckets + (float('inf'),), value[:-1]):
+                cumulative += count
+                lines.append(f'{name}_bucket{format_labels(labels, [("le", format_value(bound))])} {cumulative}')
+            lines.append(f'{name}_sum{format_labels(labels)} {format_value(value[-1])}')
+            lines.append(f'{name}_count{format_labels(labels)} {cumulative}')
+    return '\n'.join(lines) + '\n'
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+
+
+class MetricsMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'METRICS_ENABLED', True):
+            return self.get_response(request)
+
+        queries = QueryCounter()
+        gauge_add('http_requests_in_flight', 1)
+        started = time.perf_counter()
+        status = 500
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(queries))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            elapsed = time.perf_counter() - started
+            gauge_add('http_requests_in_flight', -1)
+            match = request.resolver_match
+            # URL names keep the label set small; unmatched paths share one
+            route = (match.view_name if match else None) or 'unmatched'
+            inc('http_requests_total', route=route, method=request.method, status=str(status))
+            observe('http_request_duration_seconds', elapsed, route=route, method=request.method)
+            if queries.count:
+                inc('db_queries_total', queries.count, route=route)
+                inc('db_query_duration_seconds_total', queries.duration, route=route)
+            flush()
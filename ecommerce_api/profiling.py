@@ -0,0 +1,361 @@
+"""
+On-demand sampling profiler for staff.
+
+A background thread reads the Python stack of the profiled threads every
+``PROFILER_INTERVAL_MS`` with ``sys._current_frames()``. The profiled code
+runs no profiler hooks, so requests only pay for the GIL time the sampler
+holds while it walks their stacks. A profile covers either:
+
+- ``seconds``: every thread of this worker for N seconds
+- ``requests``: only the threads serving the next K requests whose path
+  matches a regular expression (``ProfilingMiddleware`` claims them), until
+  K have finished or the time limit passes
+
+Samples are counted as collapsed stacks (``root;caller;callee count``, as
+read by flamegraph.pl and speedscope) and saved to ``PROFILER_DIR/<id>.json``
+when the profile ends. Staff start profiles and read the results, drawn as a
+flamegraph, at ``/admin/profiler/``.
+
+A profile runs in the worker that received the request to start it, and a
+``requests`` profile only sees the requests that worker serves. One profile
+at a time runs per worker.
+"""
+import json
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+import zlib
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+from django.utils.html import escape
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INTERVAL_MS = 10
+DEFAULT_MAX_SECONDS = 120
+DEFAULT_MAX_REQUESTS = 100
+
+PROFILE_ID = re.compile(r'^[0-9]{8}-[0-9]{6}-[0-9a-f]{6}$')
+
+FLAMEGRAPH_WIDTH = 1200
+FRAME_HEIGHT = 17
+MIN_FRAME_WIDTH = 0.5
+CHAR_WIDTH = 7
+
+_lock = threading.Lock()
+_active = None
+
+
+class ProfilerBusy(Exception):
+    """A profile is already running in this worker"""
+
+
+def profile_dir():
+    return Path(getattr(settings, 'PROFILER_DIR', Path(settings.BASE_DIR) / 'var' / 'profiles'))
+
+
+def max_seconds():
+    return getattr(settings, 'PROFILER_MAX_SECONDS', DEFAULT_MAX_SECONDS)
+
+
+def frame_label(frame, labels):
+    """``module:Class.function``, cached per code object"""
+    code = frame.f_code
+    label = labels.get(code)
+    if label is None:
+        label = labels[code] = f"{frame.f_globals.get('__name__', '?')}:{code.co_qualname}"
+    return label
+
+
+def collapse(frame, labels):
+    """The stack of ``frame`` as ``root;...;frame``"""
+    names = []
+    while frame is not None:
+        names.append(frame_label(frame, labels))
+        frame = frame.f_back
+    names.reverse()
+    return ';'.join(names)
+
+
+class Profile:
+    def __init__(self, kind, seconds, pattern=None, requests=0):
+        self.id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+        self.kind = kind
+        self.seconds = seconds
+        self.pattern = pattern
+        self.regex = re.compile(pattern) if pattern is not None else None
+        self.requested = requests
+        self.remaining = requests
+        self.interval = getattr(settings, 'PROFILER_INTERVAL_MS', DEFAULT_INTERVAL_MS) / 1000
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + seconds
+        self.finished_at = None
+        self.stacks = Counter()
+        self.samples = 0
+        self.ticks = 0
+        # Thread ident -> claimed request, for ``requests`` profiles
+        self.threads = {}
+        self.requests = []
+        self.stopped = threading.Event()
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.run, name=f'profiler-{self.id}', daemon=True)
+
+    def claim(self, request):
+        """Profile the current thread while it serves ``request``, if it is one of the next K matching"""
+        with self.lock:
+            if self.remaining <= 0 or self.stopped.is_set() or not self.regex.search(request.path):
+                return False
+            self.remaining -= 1
+            self.threads[threading.get_ident()] = f'{request.method} {request.get_full_path()}'
+            return True
+
+    def release(self, status, seconds):
+        with self.lock:
+            description = self.threads.pop(threading.get_ident())
+            self.requests.append({'request': description, 'status': status, 'duration_ms': round(seconds * 1000, 2)})
+            if self.remaining <= 0 and not self.threads:
+                self.stopped.set()
+
+    def targets(self):
+        """Thread idents to sample, or None for all of them"""
+        if self.kind == 'seconds':
+            return None
+        with self.lock:
+            return list(self.threads)
+
+    def run(self):
+        own = threading.get_ident()
+        # Per profile, so code objects are not kept alive after it ends
+        labels = {}
+        try:
+            while not self.stopped.is_set() and time.monotonic() < self.deadline:
+                targets = self.targets()
+                if targets != []:
+                    frames = sys._current_frames()
+                    frame = None
+                    for ident in (frames if targets is None else targets):
+                        frame = frames.get(ident)
+                        if ident != own and frame is not None:
+                            self.stacks[collapse(frame, labels)] += 1
+                            self.samples += 1
+                    # Don't keep the sampled frames (and their locals) alive until the next tick
+                    frames = frame = None
+                self.ticks += 1
+                self.stopped.wait(self.interval)
+        finally:
+            self.finish()
+
+    def finish(self):
+        global _active
+        self.stopped.set()
+        self.finished_at = time.time()
+        try:
+            save_profile(self.as_dict())
+        except OSError:
+            logger.warning('Could not save profile %s', self.id, exc_info=True)
+        finally:
+            with _lock:
+                if _active is self:
+                    _active = None
+
+    def as_dict(self):
+        with self.lock:
+            requests = list(self.requests)
+            in_progress = list(self.threads.values())
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'pid': os.getpid(),
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'seconds': self.seconds,
+            'pattern': self.pattern,
+            'requested': self.requested,
+            'requests': requests,
+            'in_progress': in_progress,
+            'interval_ms': self.interval * 1000,
+            'ticks': self.ticks,
+            'samples': self.samples,
+            'stacks': dict(self.stacks.most_common()),
+        }
+
+
+def start_profile(kind, seconds, pattern=None, requests=0):
+    """
+    Start profiling this worker; return the ``Profile``. Raises
+    ``ProfilerBusy``, or ``re.error`` for an invalid pattern.
+    """
+    global _active
+    seconds = max(1, min(seconds, max_seconds()))
+    if kind == 'requests':
+        requests = max(1, min(requests, getattr(settings, 'PROFILER_MAX_REQUESTS', DEFAULT_MAX_REQUESTS)))
+    profile = Profile(kind, seconds, pattern, requests)
+    with _lock:
+        if _active is not None:
+            raise ProfilerBusy(f'Profile {_active.id} is still running')
+        _active = profile
+    profile.thread.start()
+    return profile
+
+
+def active_profile():
+    return _active
+
+
+def stop_profile():
+    """Stop the running profile early; it is saved with the samples taken so far"""
+    profile = _active
+    if profile is not None:
+        profile.stopped.set()
+        profile.thread.join()
+    return profile
+
+
+def save_profile(data):
+    directory = profile_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    partial = directory / f".{data['id']}.json.partial"
+    partial.write_text(json.dumps(data))
+    os.replace(partial, directory / f"{data['id']}.json")
+
+
+def load_profile(profile_id):
+    """A saved profile by id, or None"""
+    if not PROFILE_ID.match(profile_id):
+        return None
+    try:
+        return json.loads((profile_dir() / f'{profile_id}.json').read_text())
+    except (OSError, ValueError):
+        return None
+
+
+def saved_profiles(limit=50):
+    """The newest saved profiles, without their stacks"""
+    directory = profile_dir()
+    if not directory.exists():
+        return []
+    profiles = []
+    # Ids start with the start time, so names sort by age
+    for path in sorted(directory.glob('*.json'), reverse=True)[:limit]:
+        try:
+            data = json.loads(path.read_text())
+        except (OSError, ValueError):
+            continue
+        data.pop('stacks', None)
+        profiles.append(data)
+    return profiles
+
+
+def collapsed(stacks):
+    """Collapsed stack text, one ``stack count`` line per distinct stack"""
+    return ''.join(f'{stack} {count}\n' for stack, count in stacks.items())
+
+
+def top_functions(stacks, limit=30):
+    """``[{'name', 'self', 'total'}]`` by total samples; recursive frames count once per stack"""
+    own = Counter()
+    total = Counter()
+    for stack, count in stacks.items():
+        names = stack.split(';')
+        own[names[-1]] += count
+        for name in set(names):
+            total[name] += count
+    return [{'name': name, 'self': own[name], 'total': count} for name, count in total.most_common(limit)]
+
+
+def stack_tree(stacks):
+    root = {'name': 'all', 'value': 0, 'children': {}}
+    for stack, count in stacks.items():
+        root['value'] += count
+        node = root
+        for name in stack.split(';'):
+            node = node['children'].setdefault(name, {'name': name, 'value': 0, 'children': {}})
+            node['value'] += count
+    return root
+
+
+def frame_color(name):
+    """Stable warm colour per function; project code in one hue, Django and DRF in others"""
+    shade = zlib.crc32(name.encode()) % 1000 / 1000
+    module = name.split(':', 1)[0]
+    if module.startswith('rest_framework'):
+        return f'rgb({int(230 + shade * 25)},{int(120 + shade * 60)},{int(40 + shade * 30)})'
+    if module.startswith('django'):
+        return f'rgb({int(200 + shade * 40)},{int(170 + shade * 50)},{int(60 + shade * 40)})'
+    if module.split('.', 1)[0] in ('accounts', 'categories', 'products', 'ecommerce_api'):
+        return f'rgb({int(220 + shade * 35)},{int(60 + shade * 60)},{int(50 + shade * 30)})'
+    return f'rgb({int(205 + shade * 50)},{int(shade * 200)},{int(shade * 55)})'
+
+
+def flamegraph_svg(stacks, title='Flame graph'):
+    """An SVG flame graph (callers at the bottom), with a tooltip per frame"""
+    root = stack_tree(stacks)
+    total = root['value'] or 1
+    scale = (FLAMEGRAPH_WIDTH - 20) / total
+    frames = []
+    pending = [(root, 10.0, 0)]
+    depth_max = 0
+    while pending:
+        node, x, depth = pending.pop()
+        width = node['value'] * scale
+        if width < MIN_FRAME_WIDTH:
+            continue
+        frames.append((node, x, depth, width))
+        depth_max = max(depth_max, depth)
+        child_x = x
+        for name in sorted(node['children']):
+            child = node['children'][name]
+            pending.append((child, child_x, depth + 1))
+            child_x += child['value'] * scale
+
+    height = (depth_max + 1) * FRAME_HEIGHT + 50
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{FLAMEGRAPH_WIDTH}" height="{height}" '
+        f'viewBox="0 0 {FLAMEGRAPH_WIDTH} {height}" font-family="Verdana, sans-serif" font-size="11">',
+        '<rect width="100%" height="100%" fill="#fdfaf2"/>',
+        f'<text x="{FLAMEGRAPH_WIDTH / 2}" y="22" text-anchor="middle" font-size="15">{escape(title)}</text>',
+    ]
+    for node, x, depth, width in frames:
+        y = height - 10 - (depth + 1) * FRAME_HEIGHT
+        name = node['name']
+        share = node['value'] / total * 100
+        label = ''
+        chars = int((width - 6) / CHAR_WIDTH)
+        if chars >= 3:
+            label = name if len(name) <= chars else name[:chars - 2] + '..'
+        parts.append(
+            f'<g><title>{escape(name)} ({node["value"]} samples, {share:.2f}%)</title>'
+            f'<rect x="{x:.1f}" y="{y}" width="{width:.1f}" height="{FRAME_HEIGHT - 1}" rx="2" '
+            f'fill="{"#d0d0d0" if node is root else frame_color(name)}"/>'
+            + (f'<text x="{x + 3:.1f}" y="{y + 12}">{escape(label)}</text>' if label else '')
+            + '</g>'
+        )
+    parts.append('</svg>')
+    return '\n'.join(parts)
+
+
+class ProfilingMiddleware:
+    """Claims requests for a running ``requests`` profile; otherwise one global lookup per request"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        profile = _active
+        if profile is None or profile.kind != 'requests' or not profile.claim(request):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        status = 500
+        try:
+            response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            profile.release(status, time.perf_counter() - started)
@@ -0,0 +1,210 @@
+"""
+Per-request SQL query budgets and N+1 detection.
+
+``QueryBudgetMiddleware`` wraps every database connection for the duration
+of a request and records each query's *shape*: the SQL with literals and
+``IN``/``VALUES`` lists collapsed, so ``WHERE user_id = 1`` and
+``WHERE user_id = 2`` share a fingerprint. When one shape runs
+``QUERY_N_PLUS_ONE_THRESHOLD`` times or more in a request, it is reported as
+an N+1 pattern. The report names the code that issued it: the serializer
+field being rendered (``UserSerializer.profile``), otherwise the view
+method, otherwise the first project source line.
+
+Each endpoint (URL name, or ``unmatched`` for paths no URL matches) has a
+budget, from ``QUERY_BUDGETS`` or ``QUERY_BUDGET_DEFAULT``.
+``QUERY_BUDGET_MODE`` decides what happens to requests over budget or with
+N+1 patterns:
+
+- ``warn`` logs a warning to ``ecommerce_api.querybudget``
+- ``raise`` also raises ``QueryBudgetExceeded``, which fails the test that
+  made the request
+- ``off`` disables the middleware
+
+Per-endpoint totals and the most recent flagged requests are kept in
+process memory for the staff report at ``/admin/query-report/``. Each
+worker reports only the requests it served.
+"""
+import logging
+import re
+import sys
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from pathlib import Path
+
+from django.conf import settings
+from django.db import connections
+from rest_framework.fields import Field
+from rest_framework.views import APIView
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUDGET = 30
+DEFAULT_N_PLUS_ONE_THRESHOLD = 5
+DEFAULT_REPORT_SIZE = 100
+
+PROJECT_ROOT = str(Path(settings.BASE_DIR).resolve())
+THIS_FILE = str(Path(__file__).resolve())
+
+SHAPE_PATTERNS = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'\bIN \((?:%s|\?)(?:, (?:%s|\?))*\)'), 'IN (...)'),
+    (re.compile(r'\((?:%s|\?)(?:, (?:%s|\?))*\)(?:, \((?:%s|\?)(?:, (?:%s|\?))*\))+'), '(...)'),
+)
+
+
+class QueryBudgetExceeded(Exception):
+    """A request ran more queries than its budget allows, or an N+1 pattern"""
+
+
+def query_shape(sql):
+    """``sql`` with literals and parameter lists collapsed"""
+    for pattern, replacement in SHAPE_PATTERNS:
+        sql = pattern.sub(replacement, sql)
+    return sql
+
+
+def query_origin(frame):
+    """Where a query issued from ``frame`` (or a caller) comes from"""
+    view = None
+    source = None
+    while frame is not None:
+        owner = frame.f_locals.get('self')
+        if isinstance(owner, Field) and owner.field_name and owner.parent is not None:
+            return f'{type(owner.parent).__name__}.{owner.field_name}'
+        if view is None and isinstance(owner, APIView):
+            view = f'{type(owner).__name__}.{frame.f_code.co_name}'
+        filename = frame.f_code.co_filename
+        if (source is None and filename.startswith(PROJECT_ROOT) and filename != THIS_FILE
+                and 'site-packages' not in filename):
+            source = f'{Path(filename).relative_to(PROJECT_ROOT)}:{frame.f_lineno}'
+        frame = frame.f_back
+    return view or source or 'unknown'
+
+
+class QueryRecorder:
+    """``execute_wrapper`` that counts one request's queries by shape"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        # shape -> [executions, example SQL, origin]
+        self.shapes = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            shape = query_shape(sql)
+            entry = self.shapes.get(shape)
+            if entry is None:
+                self.shapes[shape] = [1, sql, None]
+            else:
+                entry[0] += 1
+                if entry[2] is None:
+                    # Walking the stack is only worth it once a shape repeats
+                    entry[2] = query_origin(sys._getframe(1))
+
+    def repeated(self, threshold):
+        """``[{'count', 'sql', 'origin'}]`` for shapes run ``threshold`` times or more"""
+        return [
+            {'count': count, 'sql': sql, 'origin': origin}
+            for count, sql, origin in sorted(self.shapes.values(), key=lambda entry: -entry[0])
+            if count >= threshold
+        ]
+
+
+class QueryReport:
+    """Per-endpoint totals and recent flagged requests for this process"""
+
+    def __init__(self, size=DEFAULT_REPORT_SIZE):
+        self.lock = threading.Lock()
+        self.endpoints = {}
+        self.flagged = deque(maxlen=size)
+
+    def add(self, endpoint, budget, recorder, patterns, method, path):
+        with self.lock:
+            stats = self.endpoints.setdefault(endpoint, {
+                'endpoint': endpoint, 'budget': budget, 'requests': 0, 'queries': 0,
+                'max_queries': 0, 'over_budget': 0, 'n_plus_one': 0,
+            })
+            stats['budget'] = budget
+            stats['requests'] += 1
+            stats['queries'] += recorder.count
+            stats['max_queries'] = max(stats['max_queries'], recorder.count)
+            over = budget is not None and recorder.count > budget
+            stats['over_budget'] += over
+            stats['n_plus_one'] += bool(patterns)
+            if over or patterns:
+                self.flagged.appendleft({
+                    'endpoint': endpoint, 'method': method, 'path': path, 'budget': budget,
+                    'queries': recorder.count, 'duration_ms': round(recorder.duration * 1000, 2),
+                    'patterns': patterns, 'at': time.time(),
+                })
+
+    def snapshot(self):
+        """``(endpoint totals sorted by worst request, recent flagged requests)``"""
+        with self.lock:
+            endpoints = sorted(
+                (dict(stats, average=stats['queries'] / stats['requests']) for stats in self.endpoints.values()),
+                key=lambda stats: -stats['max_queries'],
+            )
+            return endpoints, list(self.flagged)
+
+    def clear(self):
+        with self.lock:
+            self.endpoints.clear()
+            self.flagged.clear()
+
+
+report = QueryReport(getattr(settings, 'QUERY_REPORT_SIZE', DEFAULT_REPORT_SIZE))
+
+
+def budget_for(endpoint):
+    """The query budget of a URL name; None means unlimited"""
+    budgets = getattr(settings, 'QUERY_BUDGETS', {})
+    if endpoint in budgets:
+        return budgets[endpoint]
+    return getattr(settings, 'QUERY_BUDGET_DEFAULT', DEFAULT_BUDGET)
+
+
+class QueryBudgetMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        mode = getattr(settings, 'QUERY_BUDGET_MODE', 'warn')
+        if mode == 'off':
+            return self.get_response(request)
+
+        recorder = QueryRecorder()
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(recorder))
+            response = self.get_response(request)
+        request.query_recorder = recorder
+
+        match = request.resolver_match
+        # URL names keep the report bounded; unmatched paths share one entry
+        endpoint = (match.view_name if match else None) or 'unmatched'
+        budget = budget_for(endpoint)
+        threshold = getattr(settings, 'QUERY_N_PLUS_ONE_THRESHOLD', DEFAULT_N_PLUS_ONE_THRESHOLD)
+        patterns = recorder.repeated(threshold)
+        report.add(endpoint, budget, recorder, patterns, request.method, request.get_full_path())
+
+        problems = []
+        if budget is not None and recorder.count > budget:
+            problems.append(f'{recorder.count} queries, budget {budget}')
+        for pattern in patterns:
+            problems.append(f"N+1 from {pattern['origin']}: {pattern['count']}x {pattern['sql'][:200]}")
+        if problems:
+            message = f'{request.method} {request.path} ({endpoint}): ' + '; '.join(problems)
+            logger.warning(message)
+            if mode == 'raise':
+                raise QueryBudgetExceeded(message)
+        return response
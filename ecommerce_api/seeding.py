@@ -0,0 +1,331 @@
+"""
+Bulk seeding engine shared by the sample and mock data commands.
+
+Generated rows are deterministic: chunk ``n`` of a run draws from a Faker
+instance seeded with ``(seed, kind, n)``, so a seed always produces the same
+users and products however many workers share the work. Each worker
+generates its chunks and writes them with batched ``bulk_create`` (multi-row
+``INSERT``s) over its own database connection.
+
+- every user gets the same precomputed password hash instead of one PBKDF2
+  run per user
+- profiles are bulk created next to their users, since ``bulk_create`` does
+  not send the ``post_save`` that normally creates them
+- rows that already exist (same username or slug) are skipped, so re-running
+  a seed without clearing only adds what is missing
+- ``clear_catalog`` / ``fast_delete`` empty tables with ``TRUNCATE`` or one
+  ``DELETE`` per table instead of loading every object
+
+``bulk_create`` skips the product signals too: ``Seeder.finish`` recounts the
+category rollups and invalidates the catalog cache once at the end, and the
+per-worker catalog indexes pick the rows up on their next catch-up.
+"""
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from decimal import Decimal
+from functools import lru_cache
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.color import no_style
+from django.db import connection, connections, models
+from django.utils import timezone
+from django.utils.text import slugify
+from faker import Faker
+
+from accounts.models import UserProfile
+from categories.models import Category
+from products.bulk import SlugAllocator
+from products.models import Product, stock_bucket_for
+from products.utils import init_pool_worker
+
+DEFAULT_SEED = 42
+DEFAULT_BATCH_SIZE = 1000
+# Rows generated and written by one pool task
+CHUNK_SIZE = 10000
+# Keeps the IN lists of the id lookups within SQLite's parameter limit
+LOOKUP_SIZE = 900
+
+DEFAULT_TEMPLATES = (('Product', 'Quality everyday product', 4.99, 99.99),)
+
+
+@lru_cache(maxsize=None)
+def password_hash(password):
+    """The hash stored for ``password``; computed once per process"""
+    return make_password(password)
+
+
+def chunk_faker(seed, kind, start):
+    fake = Faker()
+    fake.seed_instance(f'{seed}:{kind}:{start}')
+    return fake
+
+
+def lookup_ids(model, field, values):
+    """``{value: pk}`` for rows whose ``field`` is in ``values``"""
+    values = list(values)
+    ids = {}
+    for start in range(0, len(values), LOOKUP_SIZE):
+        chunk = values[start:start + LOOKUP_SIZE]
+        ids.update(model.objects.filter(**{f'{field}__in': chunk}).order_by().values_list(field, 'pk'))
+    return ids
+
+
+# Clearing
+
+def truncate(*models_to_clear):
+    """Empty whole tables with the backend's flush statements (``TRUNCATE`` where available)"""
+    tables = [model._meta.db_table for model in models_to_clear]
+    statements = connection.ops.sql_flush(no_style(), tables, allow_cascade=False)
+    connection.ops.execute_sql_flush(statements)
+
+
+def fast_delete(queryset):
+    """
+    Delete ``queryset`` and everything that cascades from it with one
+    ``DELETE`` per table, without loading objects or sending signals.
+    Returns the number of rows deleted from ``queryset``'s own table.
+    """
+    model = queryset.model
+    pks = queryset.values('pk')
+    for field in model._meta.many_to_many:
+        through = field.remote_field.through
+        through._base_manager.filter(**{f'{field.m2m_field_name()}__in': pks})._raw_delete(queryset.db)
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            through = relation.through
+            name = relation.field.m2m_reverse_field_name()
+            through._base_manager.filter(**{f'{name}__in': pks})._raw_delete(queryset.db)
+            continue
+        related = relation.related_model._base_manager.filter(**{f'{relation.field.name}__in': pks})
+        if relation.on_delete is models.CASCADE:
+            fast_delete(related)
+        elif relation.on_delete is models.SET_NULL:
+            related.update(**{relation.field.name: None})
+    return queryset._raw_delete(queryset.db)
+
+
+def catalog_models():
+    """Products and every model that hangs off them"""
+    return [relation.related_model for relation in Product._meta.related_objects] + [Product]
+
+
+def clear_catalog(keep_superusers=True):
+    """Remove every product and every user (but superusers, by default)"""
+    truncate(*catalog_models())
+    users = User.objects.filter(is_superuser=False) if keep_superusers else User.objects.all()
+    fast_delete(users)
+
+
+# Row generation (pure functions, run inside the pool workers)
+
+def generate_users(seed, start, count, active_ratio=0.75, staff_ratio=0.2):
+    fake = chunk_faker(seed, 'users', start)
+    rows = []
+    for position in range(start, start + count):
+        first_name, last_name = fake.first_name(), fake.last_name()
+        username = f'{slugify(f"{first_name}.{last_name}")[:120]}{position}'
+        rows.append(({
+            'username': username,
+            'email': f'{username}@{fake.free_email_domain()}',
+            'first_name': first_name,
+            'last_name': last_name,
+            'is_active': fake.random.random() < active_ratio,
+            'is_staff': fake.random.random() < staff_ratio,
+        }, {
+            'phone_number': fake.phone_number()[:20],
+            'address': fake.address(),
+            'date_of_birth': fake.date_of_birth(minimum_age=18, maximum_age=80),
+        }))
+    return rows
+
+
+def generate_products(seed, start, count, templates, user_ids, active_ratio=0.75):
+    """``templates``: ``[(category_id, [(name, description, min_price, max_price), ...]), ...]``"""
+    fake = chunk_faker(seed, 'products', start)
+    rng = fake.random
+    words = fake.get_words_list()
+    rows = []
+    for position in range(start, start + count):
+        category_id, category_templates = rng.choice(templates)
+        name, description, min_price, max_price = rng.choice(category_templates)
+        name = f'{name} {rng.choice(words).title()} {rng.choice(words).title()}'
+        stock_quantity = rng.randint(0, 200)
+        rows.append({
+            'name': name,
+            'slug': f'{slugify(name)[:170]}-{seed}-{position}',
+            'description': f'{description} - {fake.sentence()}',
+            'price': Decimal(str(round(rng.uniform(min_price, max_price), 2))),
+            'category_id': category_id,
+            'stock_quantity': stock_quantity,
+            'stock_bucket': stock_bucket_for(stock_quantity),
+            'is_active': rng.random() < active_ratio,
+            'created_by_id': rng.choice(user_ids),
+        })
+    return rows
+
+
+# Writing
+
+def write_users(rows, hashed_password, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Insert ``(user fields, profile fields)`` rows with their profiles; return
+    the number of users inserted (usernames already taken are skipped).
+    """
+    now = timezone.now()
+    usernames = [fields['username'] for fields, profile in rows]
+    existing = lookup_ids(User, 'username', usernames)
+    users = [
+        User(password=hashed_password, date_joined=now, **fields)
+        for fields, profile in rows if fields['username'] not in existing
+    ]
+    User.objects.bulk_create(users, batch_size=batch_size, ignore_conflicts=True)
+    # Neither MySQL nor ignore_conflicts report the new ids
+    ids = lookup_ids(User, 'username', usernames)
+    profiles = [
+        UserProfile(user_id=ids[fields['username']], created_at=now, **profile)
+        for fields, profile in rows if fields['username'] in ids
+    ]
+    UserProfile.objects.bulk_create(profiles, batch_size=batch_size, ignore_conflicts=True)
+    return len(ids) - len(existing)
+
+
+def write_products(rows, batch_size=DEFAULT_BATCH_SIZE):
+    """Insert product field dicts; return the number inserted (slugs already taken are skipped)"""
+    slugs = [fields['slug'] for fields in rows]
+    existing = lookup_ids(Product, 'slug', slugs)
+    Product.objects.bulk_create(
+        [Product(**fields) for fields in rows if fields['slug'] not in existing],
+        batch_size=batch_size, ignore_conflicts=True,
+    )
+    return len(lookup_ids(Product, 'slug', slugs)) - len(existing)
+
+
+def seed_users_chunk(seed, start, count, hashed_password, batch_size):
+    return write_users(generate_users(seed, start, count), hashed_password, batch_size)
+
+
+def seed_products_chunk(seed, start, count, templates, user_ids, batch_size):
+    return write_products(generate_products(seed, start, count, templates, user_ids), batch_size)
+
+
+class Seeder:
+    """
+    Creates categories, users and products in bulk.
+
+    ``ensure_*`` take fixed rows and only create the ones missing (looked up
+    by name or username); ``generate_*`` add any number of random rows
+    derived from ``seed``, spread over ``workers`` processes. ``created``
+    counts the rows written per kind.
+    """
+
+    def __init__(self, seed=DEFAULT_SEED, workers=1, batch_size=DEFAULT_BATCH_SIZE, log=None):
+        self.seed = seed
+        self.workers = max(workers, 1)
+        self.batch_size = batch_size
+        self.log = log or (lambda message: None)
+        self.created = Counter()
+
+    def ensure_categories(self, rows):
+        """``rows``: ``(name, description)`` pairs; return the categories in the same order"""
+        existing = Category.objects.in_bulk([name for name, description in rows], field_name='name')
+        missing = [
+            Category(name=name, slug=slugify(name), description=description, is_active=True)
+            for name, description in rows if name not in existing
+        ]
+        Category.objects.bulk_create(missing, batch_size=self.batch_size)
+        self.created['categories'] += len(missing)
+        for category in missing:
+            self.log(f'Created category: {category.name}')
+        categories = Category.objects.in_bulk([name for name, description in rows], field_name='name')
+        return [categories[name] for name, description in rows]
+
+    def ensure_users(self, rows, password):
+        """
+        ``rows``: ``User`` field dicts (``username`` required); missing users are
+        created with ``password`` and a profile. Return every user in order.
+        """
+        usernames = [fields['username'] for fields in rows]
+        existing = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+        missing = [(fields, {}) for fields in rows if fields['username'] not in existing]
+        if missing:
+            self.created['users'] += write_users(missing, password_hash(password), self.batch_size)
+            for fields, profile in missing:
+                self.log(f"Created user: {fields['username']}")
+        users = User.objects.in_bulk(usernames, field_name='username')
+        # Existing users may predate the signal that creates profiles
+        self.ensure_profiles(users.values())
+        return [users[username] for username in usernames]
+
+    def ensure_profiles(self, users):
+        """Create empty profiles for the users without one; return how many were created"""
+        user_ids = [user.pk for user in users]
+        with_profile = set(UserProfile.objects.filter(user_id__in=user_ids).values_list('user_id', flat=True))
+        missing = [UserProfile(user_id=user_id) for user_id in user_ids if user_id not in with_profile]
+        UserProfile.objects.bulk_create(missing, batch_size=self.batch_size)
+        self.created['profiles'] += len(missing)
+        return len(missing)
+
+    def ensure_products(self, rows):
+        """
+        ``rows``: dicts with ``name``, ``description``, ``price``, ``stock_quantity``,
+        ``category`` and ``created_by``. Products whose name exists are kept.
+        Return every product in order.
+        """
+        names = [fields['name'] for fields in rows]
+        existing = set(Product.objects.filter(name__in=names).values_list('name', flat=True))
+        missing = [fields for fields in rows if fields['name'] not in existing]
+        slugs = SlugAllocator([fields['name'] for fields in missing])
+        Product.objects.bulk_create([
+            Product(**{
+                'is_active': True,
+                **fields,
+                'slug': slugs.allocate(fields['name']),
+                'stock_bucket': stock_bucket_for(fields['stock_quantity']),
+            })
+            for fields in missing
+        ], batch_size=self.batch_size)
+        self.created['products'] += len(missing)
+        for fields in missing:
+            self.log(f"Created product: {fields['name']} - ${fields['price']}")
+        products = {product.name: product for product in Product.objects.filter(name__in=names).order_by('id')}
+        return [products[name] for name in names]
+
+    def generate_users(self, count, password):
+        return self.run('users', seed_users_chunk, count, password_hash(password), self.batch_size)
+
+    def generate_products(self, count, templates, user_ids):
+        """``templates``: ``{category_id: [(name, description, min_price, max_price), ...]}``"""
+        templates = [(category_id, list(rows) or list(DEFAULT_TEMPLATES)) for category_id, rows in templates.items()]
+        return self.run('products', seed_products_chunk, count, templates, list(user_ids), self.batch_size)
+
+    def run(self, kind, function, count, *args):
+        """Run ``function(seed, start, count, *args)`` over chunks of ``count`` rows"""
+        tasks = [(self.seed, start, min(CHUNK_SIZE, count - start), *args) for start in range(0, count, CHUNK_SIZE)]
+        started = time.perf_counter()
+        written = 0
+        if self.workers == 1 or len(tasks) <= 1:
+            for task in tasks:
+                written += function(*task)
+                self.log(f'Created {written} {kind}...')
+        else:
+            # Forked workers must not share the parent's database connections
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=self.workers, initializer=init_pool_worker) as pool:
+                for future in as_completed([pool.submit(function, *task) for task in tasks]):
+                    written += future.result()
+                    self.log(f'Created {written} {kind}...')
+        elapsed = time.perf_counter() - started
+        self.created[kind] += written
+        if written:
+            self.log(f'Wrote {written} {kind} in {elapsed:.2f}s ({written / elapsed if elapsed else 0:.0f} rows/s)')
+        return written
+
+    def finish(self):
+        """Bring what ``bulk_create`` bypassed up to date: category rollups and cached responses"""
+        from products.caching import bump_catalog_generation
+        from products.rollups import recount
+
+        recount()
+        bump_catalog_generation()
@@ -13,6 +13,7 @@ https://docs.djangoproject.com/en/5.2/ref/settings/
 from pathlib import Path
 from decouple import config
 import os
+import sys
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -75,6 +76,11 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'ecommerce_api.profiling.ProfilingMiddleware',
+    'ecommerce_api.metrics.MetricsMiddleware',
+    'ecommerce_api.tracing.TracingMiddleware',
+    'ecommerce_api.timing.ServerTimingMiddleware',
+    'ecommerce_api.querybudget.QueryBudgetMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -249,6 +255,98 @@ CORS_ALLOWED_ORIGINS = config('CORS_ALLOWED_ORIGINS',
 
 CORS_ALLOW_CREDENTIALS = True
 
+# Cache Configuration
+# Local memory by default; point CACHE_BACKEND at a file or Redis cache so
+# that invalidations reach every worker process
+CACHES = {
+    'default': {
+        'BACKEND': config('CACHE_BACKEND', default='django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': config('CACHE_LOCATION', default='ecommerce-api'),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=5000, cast=int),
+        },
+    }
+}
+
+# Anonymous catalog response cache (products.caching)
+CATALOG_CACHE_ALIAS = 'default'
+# Seconds per endpoint, overriding products.caching.DEFAULT_TTLS; 0 disables an endpoint
+CATALOG_CACHE_TTLS = {
+    'products.list': config('CATALOG_CACHE_TTL_PRODUCTS', default=60, cast=int),
+}
+
+# Catalog Index Configuration (product search, autocomplete)
+# Snapshot written by `manage.py rebuild_search_index` so workers start warm
+SEARCH_INDEX_PATH = config('SEARCH_INDEX_PATH', default=str(BASE_DIR / 'var' / 'search_index.pickle'))
+# How often each worker picks up catalog changes made by other processes
+CATALOG_INDEX_REFRESH_SECONDS = config('CATALOG_INDEX_REFRESH_SECONDS', default=30, cast=int)
+
+# Product export (products.export): rows read and written per batch
+PRODUCT_EXPORT_BATCH_SIZE = config('PRODUCT_EXPORT_BATCH_SIZE', default=2000, cast=int)
+# Batch product writes (products.bulk): most items accepted per request
+PRODUCT_BULK_MAX_ITEMS = config('PRODUCT_BULK_MAX_ITEMS', default=1000, cast=int)
+
+# Dataset snapshots (ecommerce_api.snapshots): cached generated datasets for
+# benchmarks and scale tests
+DATASET_SNAPSHOT_DIR = config('DATASET_SNAPSHOT_DIR', default=str(BASE_DIR / 'var' / 'snapshots'))
+
+# Stock reservations (products.reservations): hold lifetime in seconds, the
+# longest lifetime a client may ask for, and holds expired per sweep batch
+STOCK_RESERVATION_TTL_SECONDS = config('STOCK_RESERVATION_TTL_SECONDS', default=600, cast=int)
+STOCK_RESERVATION_MAX_TTL_SECONDS = config('STOCK_RESERVATION_MAX_TTL_SECONDS', default=3600, cast=int)
+STOCK_RESERVATION_SWEEP_BATCH_SIZE = config('STOCK_RESERVATION_SWEEP_BATCH_SIZE', default=500, cast=int)
+
+# Query budgets (ecommerce_api.querybudget): queries allowed per request by
+# URL name (None: unlimited), how often one SQL shape may repeat before it is
+# reported as N+1, and whether offenders are logged (warn), also raised
+# (raise; the default under `manage.py test`) or not checked at all (off)
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+QUERY_BUDGET_MODE = config('QUERY_BUDGET_MODE', default='raise' if TESTING else 'warn')
+QUERY_BUDGET_DEFAULT = config('QUERY_BUDGET_DEFAULT', default=30, cast=int)
+QUERY_BUDGETS = {
+    # Seeding endpoints write whole datasets
+    'create-mock-data': None,
+    'create-mock-users': None,
+    'setup-database-mock': None,
+}
+QUERY_N_PLUS_ONE_THRESHOLD = config('QUERY_N_PLUS_ONE_THRESHOLD', default=5, cast=int)
+QUERY_REPORT_SIZE = config('QUERY_REPORT_SIZE', default=100, cast=int)
+
+# Request timing (ecommerce_api.timing): Server-Timing header on every
+# response, plus the X-Debug-Timing JSON breakdown when debugging
+SERVER_TIMING = config('SERVER_TIMING', default=True, cast=bool)
+SERVER_TIMING_DEBUG = config('SERVER_TIMING_DEBUG', default=DEBUG, cast=bool)
+
+# Prometheus metrics (ecommerce_api.metrics): where each worker writes its
+# values for /metrics to add up, how often, the latency histogram buckets in
+# seconds, and an optional bearer token scrapers must send
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+METRICS_DIR = config('METRICS_DIR', default=str(BASE_DIR / 'var' / 'metrics'))
+METRICS_FLUSH_SECONDS = config('METRICS_FLUSH_SECONDS', default=5, cast=int)
+METRICS_LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_TOKEN = config('METRICS_TOKEN', default='')
+
+# Request tracing (ecommerce_api.tracing): requests slower than
+# TRACE_SLOW_MS are always kept, others with probability TRACE_SAMPLE_RATE;
+# kept traces go to a rotating JSON lines file per process, named after
+# TRACE_FILE with the pid added (traces-<pid>.jsonl)
+TRACING_ENABLED = config('TRACING_ENABLED', default=True, cast=bool)
+TRACE_SLOW_MS = config('TRACE_SLOW_MS', default=500, cast=int)
+TRACE_SAMPLE_RATE = config('TRACE_SAMPLE_RATE', default=0.01, cast=float)
+TRACE_MAX_SPANS = config('TRACE_MAX_SPANS', default=2000, cast=int)
+TRACE_FILE = config('TRACE_FILE', default=str(BASE_DIR / 'var' / 'traces' / 'traces.jsonl'))
+TRACE_FILE_MAX_BYTES = config('TRACE_FILE_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+TRACE_FILE_BACKUPS = config('TRACE_FILE_BACKUPS', default=3, cast=int)
+
+# Sampling profiler (ecommerce_api.profiling), started by staff from
+# /admin/profiler/: stack sampling interval, limits on one profile's length
+# and request count, and where finished profiles are saved
+PROFILER_INTERVAL_MS = config('PROFILER_INTERVAL_MS', default=10, cast=int)
+PROFILER_MAX_SECONDS = config('PROFILER_MAX_SECONDS', default=120, cast=int)
+PROFILER_MAX_REQUESTS = config('PROFILER_MAX_REQUESTS', default=100, cast=int)
+PROFILER_DIR = config('PROFILER_DIR', default=str(BASE_DIR / 'var' / 'profiles'))
+
 # Logging Configuration for PythonAnywhere
 if PYTHONANYWHERE_ENVIRONMENT:
     LOGGING = {
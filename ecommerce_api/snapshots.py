@@ -0,0 +1,280 @@
+"""
+Dataset snapshots: save the seeded tables to one file and restore them in bulk.
+
+Re-seeding through Faker and the ORM takes minutes at benchmark sizes; loading
+a snapshot only decodes columns and runs batched ``INSERT``s.
+
+File layout::
+
+    MAGIC
+    header length (4 bytes, big endian)
+    header (JSON): format version, per-table row counts, columns, block
+                   offsets/lengths and SHA-256 checksums, and an overall
+                   checksum over the table checksums
+    blocks: one zlib-compressed JSON array per column, table after table
+
+Columns are stored separately so similar values compress together, and are
+written in primary key order so the same data always produces the same bytes.
+Every checksum is verified, and every column decoded and counted, before
+anything is deleted; the delete and the inserts share one transaction.
+
+``load_dataset`` restores a cached snapshot for a given size and seed, or
+generates the dataset once and saves it; ``SnapshotTestMixin`` calls it from
+``setUpTestData`` for scale tests.
+"""
+import hashlib
+import json
+import struct
+import zlib
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from uuid import UUID
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.color import no_style
+from django.db import connection, transaction
+
+from accounts.models import UserProfile
+from categories.models import Category
+from products.models import Product
+
+from .seeding import DEFAULT_BATCH_SIZE, DEFAULT_SEED, Seeder, fast_delete
+
+MAGIC = b'ECSNAP\x00\x01'
+FORMAT_VERSION = 1
+
+# Restored in this order so foreign keys always point at loaded rows
+SNAPSHOT_MODELS = (Category, User, UserProfile, Product)
+
+
+class SnapshotError(Exception):
+    """The file is not a snapshot, or does not match its checksums or this schema"""
+
+
+def snapshot_dir():
+    return Path(getattr(settings, 'DATASET_SNAPSHOT_DIR', Path(settings.BASE_DIR) / 'var' / 'snapshots'))
+
+
+def snapshot_path(users, products, seed=DEFAULT_SEED):
+    """Where the generated dataset of a given size and seed is cached"""
+    return snapshot_dir() / f'dataset-u{users}-p{products}-s{seed}.snap'
+
+
+def model_label(model):
+    return model._meta.label_lower
+
+
+def columns_for(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def encode_value(value):
+    if isinstance(value, (datetime, date, time)):
+        return value.isoformat()
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+def encode_column(values):
+    return zlib.compress(
+        json.dumps([encode_value(value) for value in values], separators=(',', ':')).encode(), 6
+    )
+
+
+def digest(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def overall_checksum(tables):
+    return digest(''.join(column['sha256'] for table in tables for column in table['columns']).encode())
+
+
+def save_snapshot(path, seed=None, batch_size=DEFAULT_BATCH_SIZE):
+    """Write the ``SNAPSHOT_MODELS`` tables to ``path``; return the header"""
+    path = Path(path)
+    tables = []
+    blocks = []
+    offset = 0
+    for model in SNAPSHOT_MODELS:
+        columns = columns_for(model)
+        data = {column: [] for column in columns}
+        rows = model._base_manager.order_by('pk').values_list(*columns).iterator(chunk_size=batch_size)
+        count = 0
+        for row in rows:
+            for column, value in zip(columns, row):
+                data[column].append(value)
+            count += 1
+        entries = []
+        for column in columns:
+            block = encode_column(data.pop(column))
+            entries.append({'name': column, 'offset': offset, 'length': len(block), 'sha256': digest(block)})
+            blocks.append(block)
+            offset += len(block)
+        tables.append({'model': model_label(model), 'rows': count, 'columns': entries})
+
+    header = {'version': FORMAT_VERSION, 'seed': seed, 'tables': tables, 'sha256': overall_checksum(tables)}
+    encoded = json.dumps(header, sort_keys=True, separators=(',', ':')).encode()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    partial = path.with_name(path.name + '.partial')
+    with open(partial, 'wb') as snapshot:
+        snapshot.write(MAGIC)
+        snapshot.write(struct.pack('>I', len(encoded)))
+        snapshot.write(encoded)
+        for block in blocks:
+            snapshot.write(block)
+    # Readers never see a half-written snapshot
+    partial.replace(path)
+    return header
+
+
+def read_snapshot(path):
+    """
+    Read and verify a snapshot; return ``(header, blocks)`` where ``blocks``
+    is the raw data after the header. Raises ``SnapshotError``.
+    """
+    with open(path, 'rb') as snapshot:
+        data = snapshot.read()
+    if data[:len(MAGIC)] != MAGIC:
+        raise SnapshotError(f'{path} is not a dataset snapshot')
+    start = len(MAGIC) + 4
+    (header_length,) = struct.unpack('>I', data[len(MAGIC):start])
+    try:
+        header = json.loads(data[start:start + header_length])
+    except ValueError as exc:
+        raise SnapshotError(f'{path} has a corrupt header') from exc
+    if header.get('version') != FORMAT_VERSION:
+        raise SnapshotError(f"{path} uses snapshot format {header.get('version')}, expected {FORMAT_VERSION}")
+    blocks = memoryview(data)[start + header_length:]
+
+    if overall_checksum(header['tables']) != header['sha256']:
+        raise SnapshotError(f'{path} header checksum mismatch')
+    for table in header['tables']:
+        for column in table['columns']:
+            block = blocks[column['offset']:column['offset'] + column['length']]
+            if len(block) != column['length'] or digest(block) != column['sha256']:
+                raise SnapshotError(f"{path}: checksum mismatch in {table['model']}.{column['name']}")
+    return header, blocks
+
+
+def check_schema(header):
+    """Snapshot tables must match ``SNAPSHOT_MODELS`` column for column"""
+    expected = [(model_label(model), columns_for(model)) for model in SNAPSHOT_MODELS]
+    found = [(table['model'], [column['name'] for column in table['columns']]) for table in header['tables']]
+    if found != expected:
+        raise SnapshotError('Snapshot columns do not match the current models; regenerate it')
+
+
+def clear_dataset():
+    """
+    Empty the snapshot tables and everything that references them. Called
+    inside a transaction: DELETEs rather than TRUNCATE, which commits
+    implicitly on MySQL, so a failed load rolls back to the old rows.
+    """
+    fast_delete(Product._base_manager.all())
+    fast_delete(User._base_manager.all())
+    fast_delete(Category._base_manager.all())
+
+
+def insert_rows(model, columns, values, batch_size):
+    """``executemany`` the decoded columns into ``model``'s table"""
+    fields = [model._meta.get_field(column) for column in columns]
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table),
+        ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)),
+    )
+    prepared = [
+        [None if value is None else field.get_db_prep_save(field.to_python(value), connection) for value in column]
+        for field, column in zip(fields, values)
+    ]
+    rows = list(zip(*prepared))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            cursor.executemany(sql, rows[start:start + batch_size])
+
+
+def load_snapshot(path, batch_size=DEFAULT_BATCH_SIZE):
+    """
+    Replace the snapshot tables with the contents of ``path``; return
+    ``{model label: rows}``. Nothing is changed if verification fails.
+    """
+    header, blocks = read_snapshot(path)
+    check_schema(header)
+    # Decode everything before touching the database
+    tables = []
+    for model, table in zip(SNAPSHOT_MODELS, header['tables']):
+        columns = [column['name'] for column in table['columns']]
+        try:
+            values = [
+                json.loads(zlib.decompress(blocks[column['offset']:column['offset'] + column['length']]))
+                for column in table['columns']
+            ]
+        except (zlib.error, ValueError) as exc:
+            raise SnapshotError(f"{path}: cannot decode {table['model']}: {exc}") from exc
+        if any(len(column) != table['rows'] for column in values):
+            raise SnapshotError(f"{path}: row count mismatch in {table['model']}")
+        tables.append((model, table, columns, values))
+
+    loaded = {}
+    with transaction.atomic():
+        # Inside the transaction, so a failed insert restores the old rows
+        clear_dataset()
+        for model, table, columns, values in tables:
+            if table['rows']:
+                insert_rows(model, columns, values, batch_size)
+            loaded[table['model']] = table['rows']
+        # Explicit primary keys leave PostgreSQL sequences behind
+        with connection.cursor() as cursor:
+            for statement in connection.ops.sequence_reset_sql(no_style(), SNAPSHOT_MODELS):
+                cursor.execute(statement)
+        Seeder().finish()
+    return loaded
+
+
+def load_dataset(users, products, seed=DEFAULT_SEED):
+    """
+    Load the generated dataset of this size and seed from its cached snapshot,
+    generating it (in this process, so it stays in the current transaction)
+    and saving the snapshot on first use. Returns ``{model label: rows}``.
+    """
+    path = snapshot_path(users, products, seed)
+    if path.exists():
+        try:
+            return load_snapshot(path)
+        except SnapshotError:
+            # Stale or damaged: rebuild it below
+            path.unlink()
+    with transaction.atomic():
+        clear_dataset()
+        call_command(
+            'generate_large_dataset', users=users, products=products, seed=seed,
+            workers=1, stdout=StringIO()
+        )
+    header = save_snapshot(path, seed=seed)
+    return {table['model']: table['rows'] for table in header['tables']}
+
+
+class SnapshotTestMixin:
+    """
+    Loads a generated dataset once per ``TestCase`` class::
+
+        class ProductListScaleTest(SnapshotTestMixin, APITestCase):
+            snapshot_users = 1000
+            snapshot_products = 100000
+    """
+    snapshot_users = 100
+    snapshot_products = 10000
+    snapshot_seed = DEFAULT_SEED
+
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.snapshot_rows = load_dataset(cls.snapshot_users, cls.snapshot_products, cls.snapshot_seed)
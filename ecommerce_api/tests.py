@@ -279,3 +279,1726 @@ class ErrorHandlingTest(TestCase):
         """Test that 500 errors are handled properly"""
         # This is a basic test - in a real scenario you'd test actual error conditions
         self.assertTrue(True)  # Placeholder for actual error handling tests
+
+
+class CursorPaginationTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='pager', password='pagerpass123')
+        self.category = Category.objects.create(name='Pagination')
+        for i in range(7):
+            Product.objects.create(
+                name=f'Paged Product {i}',
+                description='Cursor pagination fixture',
+                price='10.00',
+                category=self.category,
+                stock_quantity=i,
+                created_by=self.user
+            )
+
+    def collect_pages(self, url):
+        """Follow next links and return the ids of every page"""
+        ids = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            self.assertNotIn('count', response.data)
+            ids.extend(item['id'] for item in response.data['results'])
+            url = response.data['next']
+        return ids
+
+    def test_cursor_pages_cover_every_product_once(self):
+        """Test that following cursors returns every product exactly once"""
+        from products.models import Product
+
+        url = reverse('product-list') + '?pagination=cursor&page_size=3'
+        ids = self.collect_pages(url)
+        expected = list(Product.objects.order_by('-created_at', '-id').values_list('id', flat=True))
+        self.assertEqual(ids, expected)
+
+    def test_cursor_pagination_respects_ordering_and_filters(self):
+        """Test keyset pages with a custom ordering and ProductFilter params"""
+        url = reverse('product-list') + '?pagination=cursor&page_size=2&ordering=stock_quantity&min_stock=2'
+        ids = self.collect_pages(url)
+        self.assertEqual(len(ids), 5)
+
+    def test_page_size_is_capped(self):
+        """Test that page_size cannot exceed the maximum"""
+        response = self.client.get(reverse('product-list') + '?pagination=cursor&page_size=100000')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertLessEqual(len(response.data['results']), 100)
+
+    def test_invalid_cursor(self):
+        """Test that a tampered cursor is rejected"""
+        response = self.client.get(reverse('product-list') + '?cursor=not-a-cursor')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_every_cursor_ordering_is_indexed(self):
+        """Test that each keyset ordering has an (ordering field, id) index"""
+        from products.models import Product
+        from products.pagination import ProductCursorPagination
+
+        indexed = {tuple(index.fields) for index in Product._meta.indexes}
+        for field in ProductCursorPagination.ordering_fields:
+            self.assertIn((field, 'id'), indexed)
+
+
+class ProductSearchIndexTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+        from products.indexing import catalog_indexes
+
+        for index in catalog_indexes():
+            index.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='searcher', password='searchpass123')
+        self.footwear = Category.objects.create(name='Footwear')
+        self.garden = Category.objects.create(name='Garden')
+        self.shoes = Product.objects.create(
+            name='Trail Running Shoes', description='Lightweight shoes for trails',
+            price='89.99', category=self.footwear, stock_quantity=5, created_by=self.user
+        )
+        self.polish = Product.objects.create(
+            name='Leather Polish', description='Keeps your shoe leather shining',
+            price='9.99', category=self.footwear, stock_quantity=5, created_by=self.user
+        )
+        self.hose = Product.objects.create(
+            name='Garden Hose', description='Twenty metre hose',
+            price='29.99', category=self.garden, stock_quantity=5, created_by=self.user
+        )
+        self.Product = Product
+
+    def search_ids(self, query):
+        response = self.client.get(reverse('product-search'), {'q': query})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.data['results']]
+
+    def test_stemmed_terms_are_ranked_by_relevance(self):
+        """Test that 'shoe' matches 'Shoes' and name matches outrank description matches"""
+        self.assertEqual(self.search_ids('shoe'), [self.shoes.id, self.polish.id])
+
+    def test_category_names_are_searchable(self):
+        """Test that products can be found by category name"""
+        self.assertEqual(set(self.search_ids('footwear')), {self.shoes.id, self.polish.id})
+
+    def test_index_follows_saves_and_bulk_updates(self):
+        """Test incremental updates from save() and admin-style queryset updates"""
+        from products.signals import products_bulk_updated
+
+        self.search_ids('hose')  # build the index
+        self.hose.name = 'Garden Sprinkler'
+        self.hose.save()
+        self.assertEqual(self.search_ids('sprinkler'), [self.hose.id])
+
+        self.Product.objects.filter(id=self.shoes.id).update(is_active=False)
+        products_bulk_updated.send(sender=self.Product, product_ids=[self.shoes.id])
+        self.assertEqual(self.search_ids('shoe'), [self.polish.id])
+
+    def test_catch_up_follows_other_processes_without_rebuilding(self):
+        """Test that catch_up drops hard-deleted rows and adds missed ones incrementally"""
+        from unittest import mock
+        from products.search.index import get_search_index
+
+        index = get_search_index()
+        self.search_ids('hose')  # build the index
+        # Writes from another process: no signals reach this one's index
+        self.Product.objects.filter(id=self.hose.id)._raw_delete('default')
+        [bench] = self.Product.objects.bulk_create([self.Product(
+            name='Garden Bench', description='Oak bench', price='120.00', slug='garden-bench',
+            category=self.garden, stock_quantity=2, created_by=self.user,
+        )])
+        index.watermark = self.Product.objects.get(id=bench.id).updated_at.replace(year=2999)
+
+        with mock.patch.object(type(index), 'rebuild') as rebuild:
+            index.catch_up()
+        rebuild.assert_not_called()
+        self.assertNotIn(self.hose.id, index.doc_category)
+        self.assertIn(bench.id, index.doc_category)
+        self.assertEqual(self.search_ids('bench'), [bench.id])
+
+    def test_catch_up_without_deletes_skips_the_id_diff(self):
+        """Test that a catch-up with nothing deleted reads the changes and one aggregate only"""
+        from products.search.index import get_search_index
+
+        index = get_search_index()
+        self.search_ids('hose')  # build the index
+        # Categories and products since the watermarks, then COUNT/MAX(id)
+        with self.assertNumQueries(3):
+            index.catch_up()
+        self.assertIn(self.hose.id, index.doc_category)
+
+    def test_stale_index_catches_up_in_the_background(self):
+        """Test that ensure_ready returns at once and leaves the catch-up to another thread"""
+        import threading
+        from unittest import mock
+        from products.search.index import get_search_index
+
+        index = get_search_index()
+        self.search_ids('hose')  # build the index
+        index.checked_at = 0.0
+        caught_up = threading.Event()
+        threads = []
+
+        def catch_up():
+            threads.append(threading.current_thread())
+            caught_up.set()
+
+        with mock.patch.object(index, 'catch_up', side_effect=catch_up):
+            index.ensure_ready()
+            self.assertTrue(caught_up.wait(5))
+        self.assertIsNot(threads[0], threading.current_thread())
+
+    def test_missing_query(self):
+        """Test that the q parameter is required"""
+        response = self.client.get(reverse('product-search'))
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_misspelled_query_suggests_correction(self):
+        """Test that typos still find products and return a did-you-mean suggestion"""
+        response = self.client.get(reverse('product-search'), {'q': 'runnign shoos'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['did_you_mean'], 'running shoes')
+        self.assertEqual(response.data['results'][0]['id'], self.shoes.id)
+
+    def test_autocomplete_completes_word_starts(self):
+        """Test that a prefix of any leading word completes product and category names"""
+        response = self.client.get(reverse('product-autocomplete'), {'q': 'run'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual([item['id'] for item in response.data['products']], [self.shoes.id])
+
+        response = self.client.get(reverse('product-autocomplete'), {'q': 'foot'})
+        self.assertEqual([item['name'] for item in response.data['categories']], ['Footwear'])
+
+    def test_autocomplete_follows_saves(self):
+        """Test that deactivated products stop completing"""
+        self.client.get(reverse('product-autocomplete'), {'q': 'gar'})  # build the index
+        self.hose.is_active = False
+        self.hose.save()
+        response = self.client.get(reverse('product-autocomplete'), {'q': 'gar'})
+        self.assertEqual(response.data['products'], [])
+        self.assertEqual(response.data['categories'], [])
+
+
+class ProductFacetsTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.indexing import catalog_indexes
+        from products.models import Product
+
+        for index in catalog_indexes():
+            index.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='facets', password='facetspass123')
+        self.books = Category.objects.create(name='Books')
+        self.toys = Category.objects.create(name='Toys')
+        for name, price, stock, category in [
+            ('Cheap Book', '9.99', 0, self.books),
+            ('Big Book', '60.00', 4, self.books),
+            ('Puzzle Toy', '30.00', 50, self.toys),
+        ]:
+            Product.objects.create(
+                name=name, description='Facet fixture', price=price,
+                category=category, stock_quantity=stock, created_by=self.user
+            )
+
+    def counts(self, block):
+        return {item['key']: item['count'] for item in block}
+
+    def test_list_facets_count_the_filtered_result_set(self):
+        """Test category, price bucket and stock status counts on the list endpoint"""
+        response = self.client.get(reverse('product-list'), {'facets': 'true', 'max_price': '50'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        facets = response.data['facets']
+        self.assertEqual(
+            [(item['name'], item['count']) for item in facets['categories']],
+            [('Books', 1), ('Toys', 1)]
+        )
+        self.assertEqual(self.counts(facets['price'])['0-25'], 1)
+        self.assertEqual(self.counts(facets['price'])['25-50'], 1)
+        self.assertEqual(
+            self.counts(facets['stock_status']),
+            {'in_stock': 1, 'low_stock': 0, 'out_of_stock': 1}
+        )
+
+    def test_facets_are_opt_in(self):
+        """Test that facets are only computed when requested"""
+        response = self.client.get(reverse('product-list'))
+        self.assertNotIn('facets', response.data)
+
+    def test_search_facets(self):
+        """Test that search results carry facets for every hit"""
+        response = self.client.get(reverse('product-search'), {'q': 'book', 'facets': '1'})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(self.counts(response.data['facets']['stock_status'])['low_stock'], 1)
+        self.assertEqual(response.data['facets']['categories'][0]['count'], 2)
+
+    def test_search_facets_run_no_queries(self):
+        """Test that search facets come from the bitmap index, not a GROUP BY per id chunk"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        url = reverse('product-search')
+        self.client.get(url, {'q': 'book', 'facets': '1'})  # build the indexes
+        with CaptureQueriesContext(connection) as plain:
+            self.client.get(url, {'q': 'book'})
+        with CaptureQueriesContext(connection) as faceted:
+            self.client.get(url, {'q': 'book', 'facets': '1'})
+        self.assertEqual(len(faceted), len(plain))
+
+
+class BitmapIndexTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.indexing import catalog_indexes
+        from products.models import Product
+
+        for index in catalog_indexes():
+            index.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='bitmaps', password='bitmapspass123')
+        self.categories = [Category.objects.create(name=f'Bitmap {i}') for i in range(3)]
+        prices = ['4.99', '5.00', '12.50', '25.00', '49.99', '50.00', '99.95', '250.00', '750.00', '6000.00']
+        for i in range(30):
+            Product.objects.create(
+                name=f'Bitmap Product {i}', description='Bitmap fixture',
+                price=prices[i % len(prices)], category=self.categories[i % 3],
+                stock_quantity=(i * 7) % 15, is_active=i % 4 != 0, created_by=self.user
+            )
+        self.Product = Product
+
+    def assertMatchesORM(self, params, active_only=True):
+        from products.bitmaps import get_bitmap_index
+        from products.filters import ProductFilter
+
+        queryset = self.Product.objects.all()
+        if active_only:
+            queryset = queryset.filter(is_active=True)
+        expected = list(
+            ProductFilter(params, queryset=queryset).qs
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        selection = get_bitmap_index().select(params, active_only=active_only)
+        self.assertIsNotNone(selection, params)
+        self.assertEqual(list(selection), expected, params)
+
+    def test_filter_combinations_match_the_orm(self):
+        """Test that bitmap answers equal ProductFilter results for many combinations"""
+        from itertools import product
+
+        categories = ['', str(self.categories[1].id)]
+        for category, in_stock, min_price, max_price, is_active in product(
+            categories, ['', 'true', 'false', '1'], ['', '5', '12.5', '-1'],
+            ['', '50', '99.94', '4'], ['', 'false'],
+        ):
+            params = {
+                'category': category, 'in_stock': in_stock, 'min_price': min_price,
+                'max_price': max_price, 'is_active': is_active,
+            }
+            self.assertMatchesORM(params, active_only=not is_active)
+
+    def test_index_follows_saves_and_bulk_updates(self):
+        """Test that bitmaps are maintained on save() and signalled queryset updates"""
+        from products.signals import products_bulk_updated
+
+        self.assertMatchesORM({'in_stock': 'false'})
+        product = self.Product.objects.filter(stock_quantity=0, is_active=True).first()
+        product.stock_quantity = 40
+        product.price = '15.00'
+        product.save()
+        self.assertMatchesORM({'in_stock': 'false'})
+        self.assertMatchesORM({'min_price': '15', 'max_price': '15'})
+
+        ids = list(self.Product.objects.filter(category=self.categories[0]).values_list('id', flat=True))
+        self.Product.objects.filter(id__in=ids).update(is_active=False)
+        products_bulk_updated.send(sender=self.Product, product_ids=ids)
+        self.assertMatchesORM({'category': str(self.categories[0].id)})
+        self.assertMatchesORM({})
+
+    def test_out_of_order_rows_are_renumbered_once_per_read(self):
+        """Test that a batch of backdated rows costs one renumbering, on the next read"""
+        from datetime import timedelta
+        from unittest import mock
+        from products.bitmaps import get_bitmap_index
+
+        index = get_bitmap_index()
+        self.assertMatchesORM({})  # build the index
+        oldest = self.Product.objects.order_by('created_at').first().created_at
+        # Written by another process (no signals), e.g. by a parallel seed
+        backdated = [product.id for product in self.Product.objects.bulk_create([
+            self.Product(
+                name=f'Backdated {number}', slug=f'backdated-{number}', description='Bitmap fixture',
+                price='10.00', category=self.categories[0], stock_quantity=3, created_by=self.user
+            )
+            for number in range(3)
+        ])]
+        self.Product.objects.filter(id__in=backdated).update(created_at=oldest - timedelta(days=1))
+
+        with mock.patch.object(index, '_reslot', wraps=index._reslot) as reslot:
+            index.reindex_ids(backdated)
+            reslot.assert_not_called()
+            self.assertMatchesORM({})
+            self.assertMatchesORM({'category': str(self.categories[0].id)})
+        self.assertEqual(reslot.call_count, 1)
+
+    def test_list_endpoint_pages_bitmap_results(self):
+        """Test that the list endpoint returns the same pages with and without the index"""
+        response = self.client.get(reverse('product-list'), {'in_stock': 'true', 'page': 2})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        expected = list(
+            self.Product.objects.filter(is_active=True, stock_quantity__gt=0)
+            .order_by('-created_at', '-id').values_list('id', flat=True)
+        )
+        self.assertEqual(response.data['count'], len(expected))
+        self.assertEqual([item['id'] for item in response.data['results']], expected[20:40])
+
+    def test_unsupported_filters_fall_back_to_the_orm(self):
+        """Test that other ProductFilter params bypass the index"""
+        from products.bitmaps import get_bitmap_index
+
+        self.assertIsNone(get_bitmap_index().select({'name': 'Bitmap'}))
+        self.assertIsNone(get_bitmap_index().select({'ordering': 'price'}))
+        response = self.client.get(reverse('product-list'), {'min_price': 'abc'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class CatalogResponseCacheTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.caching import reset_response_cache_stats
+        from products.indexing import catalog_indexes
+        from products.models import Product
+
+        for index in catalog_indexes():
+            index.clear()
+        reset_response_cache_stats()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='cacher', password='cacherpass123')
+        self.category = Category.objects.create(name='Cached')
+        self.product = Product.objects.create(
+            name='Cached Lamp', description='Cache fixture', price='15.00',
+            category=self.category, stock_quantity=3, created_by=self.user
+        )
+        self.Product = Product
+
+    def get(self, url, params=None):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response
+
+    def test_anonymous_reads_are_cached_with_normalized_keys(self):
+        """Test that repeated reads hit the cache whatever the parameter order"""
+        url = reverse('product-list')
+        self.assertEqual(self.get(url + '?in_stock=true&page=1')['X-Cache'], 'MISS')
+        hit = self.get(url + '?page=1&in_stock=true&search=')
+        self.assertEqual(hit['X-Cache'], 'HIT')
+        self.assertEqual(hit.data['results'][0]['id'], self.product.id)
+
+        from products.caching import response_cache_stats
+        self.assertEqual(response_cache_stats()['products.list'], {'hits': 1, 'misses': 1})
+
+    def test_saves_and_admin_updates_invalidate(self):
+        """Test that model saves and admin queryset updates bump the generation"""
+        from ecommerce_api.admin import EnhancedProductAdmin, admin_site
+
+        url = reverse('category-popular')
+        self.get(url)
+        self.assertEqual(self.get(url)['X-Cache'], 'HIT')
+
+        self.category.description = 'Changed'
+        self.category.save()
+        self.assertEqual(self.get(url)['X-Cache'], 'MISS')
+
+        list_url = reverse('product-list')
+        self.get(list_url)
+        EnhancedProductAdmin(self.Product, admin_site).update_products(
+            self.Product.objects.filter(id=self.product.id), is_active=False
+        )
+        response = self.get(list_url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.data['results'], [])
+
+    def test_authenticated_reads_bypass_the_cache(self):
+        """Test that authenticated users always get fresh responses"""
+        self.client.force_authenticate(self.user)
+        self.assertNotIn('X-Cache', self.get(reverse('category-list')))
+
+
+class ConditionalGetTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.indexing import catalog_indexes
+        from products.models import Product
+
+        for index in catalog_indexes():
+            index.clear()
+        self.client = APIClient()
+        self.user = User.objects.create_user(username='etagger', password='etaggerpass123')
+        self.category = Category.objects.create(name='Validators')
+        self.product = Product.objects.create(
+            name='Validated Chair', description='ETag fixture', price='49.00',
+            category=self.category, stock_quantity=8, created_by=self.user
+        )
+
+    def test_unchanged_list_returns_304(self):
+        """Test that If-None-Match with the current ETag returns 304 without a body"""
+        url = reverse('product-list')
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertIn('public', response['Cache-Control'])
+        self.assertIn('max-age=30', response['Cache-Control'])
+
+        not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(not_modified.content, b'')
+        self.assertEqual(not_modified['ETag'], response['ETag'])
+
+        self.product.price = '45.00'
+        self.product.save()
+        changed = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(changed.status_code, status.HTTP_200_OK)
+        self.assertNotEqual(changed['ETag'], response['ETag'])
+
+    def test_detail_if_modified_since(self):
+        """Test Last-Modified based revalidation of a category"""
+        url = reverse('category-detail', kwargs={'slug': self.category.slug})
+        response = self.client.get(url)
+        not_modified = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_etag_depends_on_query_and_user(self):
+        """Test that different filters and authenticated users get different validators"""
+        url = reverse('category-popular')
+        anonymous = self.client.get(url)
+        self.assertNotEqual(anonymous['ETag'], self.client.get(url, {'page': 2})['ETag'])
+
+        self.client.force_authenticate(self.user)
+        authenticated = self.client.get(url)
+        self.assertNotEqual(authenticated['ETag'], anonymous['ETag'])
+        self.assertIn('private', authenticated['Cache-Control'])
+
+    def test_cached_responses_revalidate_without_queries(self):
+        """Test that anonymous validators come from the cache entry, not COUNT/MAX fingerprints"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        url = reverse('product-list') + '?pagination=cursor'
+        with CaptureQueriesContext(connection) as miss:
+            response = self.client.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertFalse([query for query in miss if 'MAX(' in query['sql'] or 'COUNT(' in query['sql']])
+
+        with self.assertNumQueries(0):
+            not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(not_modified.status_code, status.HTTP_304_NOT_MODIFIED)
+        with self.assertNumQueries(0):
+            hit = self.client.get(url, HTTP_IF_NONE_MATCH='W/"other"')
+        self.assertEqual((hit.status_code, hit['X-Cache'], hit['ETag']), (200, 'HIT', response['ETag']))
+
+    def test_missing_object_has_no_validators(self):
+        """Test that 404 responses carry no ETag"""
+        response = self.client.get(reverse('product-detail', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertNotIn('ETag', response)
+
+
+class CompiledSerializerTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.user = User.objects.create_user(username='compiler', password='compilerpass123')
+        category = Category.objects.create(name='Compiled Ünicode')
+        Product.objects.create(
+            name='Plain Mug', description='No image', price='7.50',
+            category=category, stock_quantity=0, created_by=self.user
+        )
+        Product.objects.create(
+            name='Pictured Mug', description='With image', price='1234.00',
+            category=category, stock_quantity=12, is_active=False,
+            image='products/mug photo (1).jpg', created_by=self.user
+        )
+        self.Product = Product
+
+    def test_compiled_output_matches_drf_byte_for_byte(self):
+        """Test that the compiled serializer renders exactly the same JSON as ProductSerializer"""
+        from django.test import RequestFactory
+        from rest_framework.renderers import JSONRenderer
+        from rest_framework.request import Request
+        from products.serializers import ProductSerializer
+        from products.views import ProductViewSet
+
+        compiled = ProductViewSet.compiled_list_serializer
+        request = Request(RequestFactory().get('/api/products/'))
+        queryset = self.Product.objects.order_by('-id')
+        expected = ProductSerializer(queryset, many=True, context={'request': request}).data
+        actual = compiled.render(compiled.values(queryset), request)
+        self.assertEqual(JSONRenderer().render(actual), JSONRenderer().render(expected))
+
+    def test_list_endpoint_uses_compiled_rows(self):
+        """Test that the list endpoint output is unchanged for authenticated and cursor requests"""
+        self.client.force_authenticate(self.user)
+        page = self.client.get(reverse('product-list'), {'ordering': 'price'})
+        self.assertEqual([item['name'] for item in page.data['results']], ['Plain Mug', 'Pictured Mug'])
+        self.assertTrue(page.data['results'][1]['image'].endswith('/media/products/mug%20photo%20(1).jpg'))
+
+        cursor = self.client.get(reverse('product-list'), {'pagination': 'cursor', 'page_size': 1})
+        self.assertEqual(len(cursor.data['results']), 1)
+        self.assertEqual(self.client.get(cursor.data['next']).data['results'][0]['name'], 'Plain Mug')
+
+
+class SparseFieldsetTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.client = APIClient()
+        self.admin = User.objects.create_superuser(username='sparse', password='sparsepass123', email='s@example.com')
+        self.category = Category.objects.create(name='Sparse', description='Long category text')
+        Product.objects.create(
+            name='Sparse Kettle', description='A very long description ' * 50, price='25.00',
+            category=self.category, stock_quantity=4, created_by=self.admin
+        )
+
+    def test_product_fields_and_exclude(self):
+        """Test that ?fields= and ?exclude= trim product list items"""
+        response = self.client.get(reverse('product-list'), {'fields': 'id,name,price'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'name', 'price'])
+
+        response = self.client.get(reverse('product-list'), {'exclude': 'description', 'ordering': 'name'})
+        self.assertNotIn('description', response.data['results'][0])
+        self.assertIn('category', response.data['results'][0])
+
+    def test_projection_defers_unselected_columns(self):
+        """Test that unselected columns are not loaded from the database"""
+        from products.views import ProductViewSet
+        from rest_framework.request import Request
+        from django.test import RequestFactory
+
+        view = ProductViewSet(action='retrieve', format_kwarg=None)
+        view.request = Request(RequestFactory().get('/', {'fields': 'name,category'}))
+        view.request.user = self.admin
+        product = view.filter_queryset(view.get_queryset()).get()
+        self.assertEqual(product.get_deferred_fields() & {'description', 'name'}, {'description'})
+
+    def test_category_and_user_fieldsets(self):
+        """Test sparse fieldsets on categories and users"""
+        response = self.client.get(reverse('category-list'), {'fields': 'name,products_count'})
+        self.assertEqual(response.data['results'][0], {'name': 'Sparse', 'products_count': 1})
+
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(reverse('user-list'), {'exclude': 'profile,email'})
+        self.assertNotIn('profile', response.data['results'][0])
+        self.assertIn('username', response.data['results'][0])
+
+    def test_unknown_field(self):
+        """Test that unknown field names are rejected"""
+        response = self.client.get(reverse('product-list'), {'fields': 'name,secret'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('fields', response.data)
+
+
+class ProductExportTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.user = User.objects.create_user(username='exporter', password='exporterpass123')
+        self.books = Category.objects.create(name='Export Books')
+        toys = Category.objects.create(name='Export Toys')
+        for position in range(5):
+            Product.objects.create(
+                name=f'Book {position}', description='Line one\nline "two"', price=f'{10 + position}.00',
+                category=self.books, stock_quantity=position, created_by=self.user
+            )
+        Product.objects.create(
+            name='Yo-yo', description='Toy', price='3.00',
+            category=toys, stock_quantity=1, created_by=self.user
+        )
+        Product.objects.create(
+            name='Hidden Book', description='Inactive', price='9.00',
+            category=self.books, stock_quantity=1, is_active=False, created_by=self.user
+        )
+
+    def test_ndjson_export_streams_every_filtered_product_in_batches(self):
+        """Test that NDJSON exports honor ProductFilter, stream in id order and log the row rate"""
+        import json
+
+        with self.settings(PRODUCT_EXPORT_BATCH_SIZE=2), self.assertLogs('products.export', 'INFO') as logs:
+            response = self.client.get(reverse('product-export'), {'category': self.books.id})
+            self.assertTrue(response.streaming)
+            body = b''.join(response.streaming_content).decode('utf-8')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson; charset=utf-8')
+
+        items = [json.loads(line) for line in body.splitlines()]
+        self.assertEqual([item['name'] for item in items], [f'Book {position}' for position in range(5)])
+        self.assertEqual(items[0]['category'], 'Export Books')
+        self.assertEqual(items[0]['description'], 'Line one\nline "two"')
+        self.assertIn('Exported 5 products as ndjson', logs.output[0])
+
+    def test_csv_export_with_sparse_fields(self):
+        """Test that ?format=csv writes a header and quoted rows for the selected fields"""
+        import csv
+
+        self.client.force_authenticate(self.user)
+        response = self.client.get(reverse('product-export'), {'format': 'csv', 'fields': 'name,price,is_active'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode('utf-8').splitlines()))
+        self.assertEqual(rows[0], ['name', 'price', 'is_active'])
+        self.assertEqual(len(rows), 8)
+        self.assertIn(['Hidden Book', '9.00', 'False'], rows)
+
+        empty = self.client.get(reverse('product-export'), {'format': 'csv', 'fields': 'name', 'min_price': 1000})
+        self.assertEqual(b''.join(empty.streaming_content), b'name\r\n')
+
+    def test_export_catalog_command_writes_sharded_files_and_manifest(self):
+        """Test that export_catalog splits the table into id ranges and records them in a manifest"""
+        import csv
+        import gzip
+        import json
+        import os
+        import tempfile
+        from io import StringIO
+        from django.core.management import call_command
+
+        with tempfile.TemporaryDirectory() as output:
+            call_command(
+                'export_catalog', output=output, format='csv', gzip=True, workers=1,
+                shards=3, active_only=True, fields='name,price', stdout=StringIO()
+            )
+            with open(os.path.join(output, 'manifest.json')) as handle:
+                manifest = json.load(handle)
+            self.assertEqual(manifest['rows'], 6)
+            self.assertEqual(len(manifest['shards']), 3)
+
+            names = []
+            for shard in manifest['shards']:
+                with gzip.open(os.path.join(output, shard['file']), 'rt', newline='') as handle:
+                    rows = list(csv.reader(handle))
+                self.assertEqual(rows[0], ['name', 'price'])
+                self.assertEqual(len(rows) - 1, shard['rows'])
+                names.extend(row[0] for row in rows[1:])
+            self.assertEqual(sorted(names), sorted([f'Book {position}' for position in range(5)] + ['Yo-yo']))
+
+
+class ProductBulkWriteTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.user = User.objects.create_user(username='erp', password='erppass12345')
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='Bulk Tools')
+        self.other = Category.objects.create(name='Bulk Garden')
+        self.existing = Product.objects.create(
+            name='Hammer', description='Claw hammer', price='12.00',
+            category=self.category, stock_quantity=3, created_by=self.user
+        )
+        self.Product = Product
+
+    def item(self, name, **overrides):
+        return {'name': name, 'description': f'{name} description', 'price': '5.00',
+                'category': self.category.id, 'stock_quantity': 1, **overrides}
+
+    def test_bulk_create_reports_each_item_and_allocates_unique_slugs(self):
+        """Test that valid items are created in one batch, invalid ones reported, and slugs deduplicated"""
+        items = [
+            self.item('Hammer'),
+            self.item('Hammer'),
+            self.item('Rake', category=self.other.id),
+            self.item('Broken', price='-1', category=999999),
+        ]
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('product-bulk'), items, format='json')
+        # Categories, two slug lookups, one INSERT (and its ids on MySQL), savepoints,
+        # and one recount of the touched category rollups
+        self.assertLessEqual(len(queries), 11)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual((response.data['created'], response.data['errors']), (3, 1))
+
+        results = response.data['results']
+        self.assertEqual([result['slug'] for result in results[:3]], ['hammer-2', 'hammer-3', 'rake'])
+        self.assertEqual(set(results[3]['errors']), {'price', 'category'})
+        rake = self.Product.objects.get(id=results[2]['id'])
+        self.assertEqual((rake.category, rake.created_by), (self.other, self.user))
+
+        search = self.client.get(reverse('product-search'), {'q': 'rake'})
+        self.assertEqual([item['slug'] for item in search.data['results']], ['rake'])
+
+    def test_bulk_update_by_slug(self):
+        """Test that PATCH updates by slug, bumps updated_at and rejects unknown or duplicate slugs"""
+        before = self.existing.updated_at
+        items = [
+            {'slug': 'hammer', 'price': '14.50', 'category': self.other.id},
+            {'slug': 'missing', 'price': '1.00'},
+            {'slug': 'hammer', 'stock_quantity': 9},
+            {'price': '2.00'},
+        ]
+        response = self.client.patch(reverse('product-bulk'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual([result['status'] for result in response.data['results']],
+                         ['updated', 'error', 'error', 'error'])
+
+        self.existing.refresh_from_db()
+        self.assertEqual((str(self.existing.price), self.existing.category), ('14.50', self.other))
+        self.assertEqual(self.existing.stock_quantity, 3)
+        self.assertGreater(self.existing.updated_at, before)
+
+    def test_bulk_update_writes_only_each_items_fields(self):
+        """Test that a price-only item does not write back stock changed concurrently"""
+        from unittest import mock
+        from products import bulk
+
+        rake = self.Product.objects.create(
+            name='Rake', description='Rake', price='8.00', category=self.category,
+            stock_quantity=100, created_by=self.user
+        )
+        validate_items = bulk.validate_items
+
+        def validate_then_reserve(*args, **kwargs):
+            # A checkout takes stock after the batch loaded its products
+            self.Product.objects.filter(id=rake.id).update(stock_quantity=60)
+            return validate_items(*args, **kwargs)
+
+        items = [{'slug': 'rake', 'price': '9.00'}, {'slug': 'hammer', 'stock_quantity': 7}]
+        with mock.patch.object(bulk, 'validate_items', validate_then_reserve):
+            response = self.client.patch(reverse('product-bulk'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        rake.refresh_from_db()
+        self.assertEqual((str(rake.price), rake.stock_quantity), ('9.00', 60))
+        self.existing.refresh_from_db()
+        self.assertEqual((self.existing.stock_quantity, self.existing.stock_bucket), (7, 'low_stock'))
+
+    def test_bulk_create_reallocates_slugs_taken_concurrently(self):
+        """Test that a slug taken between allocation and insert is allocated again, not a 500"""
+        from unittest import mock
+        from products import bulk
+
+        allocators = []
+        slug_allocator = bulk.SlugAllocator
+
+        def allocate_then_collide(names):
+            allocator = slug_allocator(names)
+            if not allocators:
+                # Another request creates the same product before this batch inserts
+                self.Product.objects.create(
+                    name='Lamp', description='Lamp', price='20.00', category=self.category,
+                    stock_quantity=1, created_by=self.user
+                )
+            allocators.append(allocator)
+            return allocator
+
+        with mock.patch.object(bulk, 'SlugAllocator', side_effect=allocate_then_collide):
+            response = self.client.post(reverse('product-bulk'), [self.item('Lamp')], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.data['results'][0]['slug'], 'lamp-2')
+        self.assertEqual(len(allocators), 2)
+
+    def test_bulk_limits(self):
+        """Test that empty, non-list, oversized and anonymous batches are rejected"""
+        self.assertEqual(self.client.post(reverse('product-bulk'), [], format='json').status_code, 400)
+        self.assertEqual(self.client.post(reverse('product-bulk'), {'name': 'x'}, format='json').status_code, 400)
+        with self.settings(PRODUCT_BULK_MAX_ITEMS=2):
+            response = self.client.post(reverse('product-bulk'), [self.item(str(n)) for n in range(3)], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+        self.client.force_authenticate(None)
+        response = self.client.post(reverse('product-bulk'), [self.item('Anonymous')], format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class StockAdjustmentTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.user = User.objects.create_user(username='warehouse', password='warehousepass123')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Stock Parts')
+        self.bolts = Product.objects.create(
+            name='Bolts', description='M6', price='0.20', category=category, stock_quantity=10, created_by=self.user
+        )
+        self.nuts = Product.objects.create(
+            name='Nuts', description='M6', price='0.10', category=category, stock_quantity=2, created_by=self.user
+        )
+
+    def test_adjustments_apply_in_one_update_and_never_go_negative(self):
+        """Test that deltas are applied atomically and items that would go below zero are rejected"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+
+        items = [
+            {'slug': 'bolts', 'delta': -4},
+            {'slug': 'nuts', 'delta': -3},
+            {'slug': 'washers', 'delta': 5},
+            {'slug': 'bolts', 'delta': 1},
+            {'slug': 'nuts', 'delta': 'many'},
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('product-adjust-stock'), items, format='json')
+        self.assertEqual(len([query for query in queries if query['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        self.assertEqual(response.data['applied'], [{'index': 0, 'slug': 'bolts', 'delta': -4, 'stock_quantity': 6}])
+        self.assertEqual(
+            [(entry['index'], entry['error']) for entry in response.data['rejected']],
+            [(1, 'Insufficient stock'), (2, 'Not found'),
+             (3, 'Duplicate item for this product in the batch'), (4, 'delta must be an integer')]
+        )
+        self.assertEqual(response.data['rejected'][0]['stock_quantity'], 2)
+
+        self.bolts.refresh_from_db()
+        self.nuts.refresh_from_db()
+        self.assertEqual((self.bolts.stock_quantity, self.nuts.stock_quantity), (6, 2))
+
+        in_stock = self.client.get(reverse('product-list'), {'in_stock': 'false'})
+        self.assertEqual(in_stock.data['count'], 0)
+        response = self.client.post(reverse('product-adjust-stock'), [{'slug': 'bolts', 'delta': -6}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        in_stock = self.client.get(reverse('product-list'), {'in_stock': 'false'})
+        self.assertEqual([item['name'] for item in in_stock.data['results']], ['Bolts'])
+
+    def test_all_rejected_is_a_conflict(self):
+        """Test that a batch with nothing applied returns 409"""
+        response = self.client.post(reverse('product-adjust-stock'), [{'slug': 'nuts', 'delta': -5}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.client.post(reverse('product-adjust-stock'), {}, format='json').status_code, 400)
+
+    def test_out_of_range_deltas_are_rejected(self):
+        """Test that deltas and results outside the stock column's range are rejected, not a 500"""
+        from products.stock import MAX_STOCK_QUANTITY
+
+        items = [{'slug': 'bolts', 'delta': 10 ** 12}, {'slug': 'nuts', 'delta': MAX_STOCK_QUANTITY}]
+        response = self.client.post(reverse('product-adjust-stock'), items, format='json')
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(
+            [entry['error'] for entry in response.data['rejected']],
+            [f'delta must be between -{MAX_STOCK_QUANTITY} and {MAX_STOCK_QUANTITY}',
+             f'Stock cannot exceed {MAX_STOCK_QUANTITY}']
+        )
+        self.nuts.refresh_from_db()
+        self.assertEqual(self.nuts.stock_quantity, 2)
+
+
+class StockReservationTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.buyer = User.objects.create_user(username='buyer', password='buyerpass12345')
+        self.client.force_authenticate(self.buyer)
+        category = Category.objects.create(name='Flash Sale')
+        self.console = Product.objects.create(
+            name='Console', description='Limited', price='299.00',
+            category=category, stock_quantity=5, created_by=self.buyer
+        )
+
+    def reserve(self, quantity, **extra):
+        return self.client.post(reverse('reservation-list'), {'product': 'console', 'quantity': quantity, **extra})
+
+    def stock(self):
+        self.console.refresh_from_db()
+        return self.console.stock_quantity
+
+    def test_reserve_confirm_and_release(self):
+        """Test that holds take stock, confirmed holds keep it and released holds return it"""
+        first = self.reserve(3, session='cart-1', ttl=60)
+        self.assertEqual(first.status_code, status.HTTP_201_CREATED)
+        self.assertEqual((first.data['status'], first.data['session']), ('held', 'cart-1'))
+        self.assertEqual(self.stock(), 2)
+
+        self.assertEqual(self.reserve(3).status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.stock(), 2)
+
+        second = self.reserve(2)
+        confirmed = self.client.post(reverse('reservation-confirm', kwargs={'pk': first.data['id']}))
+        self.assertEqual(confirmed.data['status'], 'confirmed')
+        released = self.client.post(reverse('reservation-release', kwargs={'pk': second.data['id']}))
+        self.assertEqual(released.data['status'], 'released')
+        self.assertEqual(self.stock(), 2)
+
+        again = self.client.post(reverse('reservation-release', kwargs={'pk': first.data['id']}))
+        self.assertEqual(again.status_code, status.HTTP_409_CONFLICT)
+        self.assertEqual(self.stock(), 2)
+
+    def test_holds_are_private(self):
+        """Test that other users cannot see or change a hold"""
+        hold = self.reserve(1)
+        other = User.objects.create_user(username='other-buyer', password='otherpass12345')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.client.get(reverse('reservation-list')).data['count'], 0)
+        response = self.client.post(reverse('reservation-confirm', kwargs={'pk': hold.data['id']}))
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_sweeper_expires_stale_holds_in_batches(self):
+        """Test that expired holds cannot be confirmed and the sweeper returns their units"""
+        from datetime import timedelta
+        from io import StringIO
+        from django.core.management import call_command
+        from django.utils import timezone
+        from products.models import StockReservation
+
+        holds = [self.reserve(1).data['id'] for _ in range(3)]
+        StockReservation.objects.filter(id__in=holds[:2]).update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = self.client.post(reverse('reservation-confirm', kwargs={'pk': holds[0]}))
+        self.assertEqual(response.status_code, status.HTTP_409_CONFLICT)
+
+        out = StringIO()
+        call_command('expire_reservations', batch_size=1, stdout=out)
+        self.assertIn('Expired 2 reservations', out.getvalue())
+        self.assertEqual(self.stock(), 4)
+        self.assertEqual(
+            list(StockReservation.objects.order_by('id').values_list('status', flat=True)),
+            ['expired', 'expired', 'held']
+        )
+
+
+class ShardedStockTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.user = User.objects.create_user(username='shard-buyer', password='shardpass12345')
+        self.client.force_authenticate(self.user)
+        category = Category.objects.create(name='Hot Items')
+        self.product = Product.objects.create(
+            name='Hot Sneaker', description='Drop', price='120.00',
+            category=category, stock_quantity=10, created_by=self.user
+        )
+        self.Product = Product
+
+    def enable(self, shards=4):
+        from io import StringIO
+        from django.core.management import call_command
+
+        call_command('shard_stock', 'hot-sneaker', shards=shards, stdout=StringIO())
+        return self.Product.objects.get(pk=self.product.pk)
+
+    def test_reservations_decrement_shards_and_sync_the_total(self):
+        """Test that sharded products take units from shards and write the total back on commit"""
+        from products.models import StockShard
+
+        product = self.enable()
+        self.assertEqual(sorted(StockShard.objects.values_list('quantity', flat=True)), [2, 2, 3, 3])
+        updated_at = product.updated_at
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post(reverse('reservation-list'), {'product': 'hot-sneaker', 'quantity': 2}).status_code, 201)
+        with self.captureOnCommitCallbacks(execute=True):
+            # More than any one shard holds, so it is gathered across shards
+            self.assertEqual(self.client.post(reverse('reservation-list'), {'product': 'hot-sneaker', 'quantity': 7}).status_code, 201)
+        self.assertEqual(self.client.post(reverse('reservation-list'), {'product': 'hot-sneaker', 'quantity': 2}).status_code, 409)
+
+        product = self.Product.objects.get(pk=self.product.pk)
+        self.assertGreater(product.updated_at, updated_at)
+        self.assertEqual((product.stock_quantity, product.is_in_stock), (1, True))
+        detail = self.client.get(reverse('product-detail', kwargs={'slug': 'hot-sneaker'}))
+        listed = self.client.get(reverse('product-list'))
+        self.assertEqual((detail.data['stock_quantity'], listed.data['results'][0]['stock_quantity']), (1, 1))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('product-adjust-stock'), [{'slug': 'hot-sneaker', 'delta': -1}], format='json')
+        self.assertEqual(response.data['applied'][0]['stock_quantity'], 0)
+        self.assertEqual(self.Product.objects.get(pk=self.product.pk).stock_status, 'Out of Stock')
+        self.assertEqual(self.Product.objects.filter(stock_bucket='out_of_stock').count(), 1)
+
+    def test_assignments_rebalance_and_disable(self):
+        """Test that saved stock values are spread over the shards and rebalancing syncs the column"""
+        from io import StringIO
+        from django.core.management import call_command
+        from products.models import StockShard
+        from products.sharded_stock import take
+
+        self.enable(shards=3)
+        response = self.client.post(reverse('product-update-stock', kwargs={'slug': 'hot-sneaker'}), {'stock_quantity': 30})
+        self.assertEqual(response.data['stock_quantity'], 30)
+        self.assertEqual(list(StockShard.objects.order_by('index').values_list('quantity', flat=True)), [10, 10, 10])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertTrue(take(self.product.pk, 6, 3))
+        self.assertEqual(self.Product.objects.filter(pk=self.product.pk).values_list('stock_quantity', flat=True)[0], 24)
+        call_command('rebalance_stock_shards', stdout=StringIO())
+        self.assertEqual(list(StockShard.objects.order_by('index').values_list('quantity', flat=True)), [8, 8, 8])
+        listed = self.client.get(reverse('product-list'))
+        self.assertEqual(listed.data['results'][0]['stock_quantity'], 24)
+
+        product = self.enable(shards=0)
+        self.assertEqual((product.stock_shards, product.stock_quantity), (0, 24))
+        self.assertFalse(StockShard.objects.exists())
+
+
+class StockBucketTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.indexing import catalog_indexes
+        from products.models import Product
+
+        for index in catalog_indexes():
+            index.clear()
+        self.user = User.objects.create_user(username='bucket-admin', password='bucketpass123', is_staff=True)
+        self.books = Category.objects.create(name='Books')
+        self.toys = Category.objects.create(name='Toys')
+        for name, stock, category in [
+            ('Sold Out Book', 0, self.books),
+            ('Last Book', 3, self.books),
+            ('Last Toy', 2, self.toys),
+            ('Plenty Toy', 40, self.toys),
+        ]:
+            Product.objects.create(
+                name=name, description=name, price='10.00', category=category,
+                stock_quantity=stock, created_by=self.user
+            )
+        self.Product = Product
+
+    def buckets(self):
+        return dict(self.Product.objects.values_list('slug', 'stock_bucket'))
+
+    def test_bucket_follows_every_stock_write(self):
+        """Test that saves, conditional updates and admin actions keep stock_bucket in step"""
+        from ecommerce_api.admin import EnhancedProductAdmin, admin_site
+        from products.reservations import reserve
+
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.buckets(), {
+            'sold-out-book': 'out_of_stock', 'last-book': 'low_stock',
+            'last-toy': 'low_stock', 'plenty-toy': 'in_stock',
+        })
+        reserve(self.Product.objects.get(slug='last-toy'), self.user, 2)
+        self.client.post(reverse('product-adjust-stock'), [
+            {'slug': 'plenty-toy', 'delta': -35}, {'slug': 'sold-out-book', 'delta': 20},
+        ], format='json')
+        self.client.post(reverse('product-update-stock', kwargs={'slug': 'last-book'}), {'stock_quantity': 12})
+        self.assertEqual(self.buckets(), {
+            'sold-out-book': 'in_stock', 'last-book': 'in_stock',
+            'last-toy': 'out_of_stock', 'plenty-toy': 'low_stock',
+        })
+
+        admin = EnhancedProductAdmin(self.Product, admin_site)
+        admin.update_products(self.Product.objects.filter(category=self.books), stock_quantity=0)
+        self.assertEqual(self.buckets()['last-book'], 'out_of_stock')
+
+    def test_feeds_are_paginated_filtered_and_counted(self):
+        """Test the low/out of stock feeds and the stock counts endpoint"""
+        response = self.client.get(reverse('product-low-stock'))
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            {product['name'] for product in response.data['results']}, {'Last Book', 'Last Toy'}
+        )
+        response = self.client.get(reverse('product-low-stock'), {'category': self.toys.pk, 'fields': 'name'})
+        self.assertEqual(response.data['results'], [{'name': 'Last Toy'}])
+        response = self.client.get(reverse('product-out-of-stock'))
+        self.assertEqual([product['name'] for product in response.data['results']], ['Sold Out Book'])
+
+        response = self.client.get(reverse('product-stock-counts'))
+        self.assertEqual(response.data['counts'], {'in_stock': 1, 'low_stock': 2, 'out_of_stock': 1})
+        self.Product.objects.filter(slug='plenty-toy').get().delete()
+        response = self.client.get(reverse('product-stock-counts'), {'category': self.toys.pk})
+        self.assertEqual(response.data['counts'], {'in_stock': 0, 'low_stock': 1, 'out_of_stock': 0})
+        self.assertEqual(self.client.get(reverse('product-stock-counts'), {'category': 'x'}).status_code, 400)
+
+
+class CategoryRollupTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.user = User.objects.create_user(username='rollup', password='rolluppass123')
+        self.books = Category.objects.create(name='Books')
+        self.toys = Category.objects.create(name='Toys')
+        self.product = Product.objects.create(
+            name='Novel', description='Novel', price='10.00', category=self.books,
+            stock_quantity=5, created_by=self.user
+        )
+        Product.objects.create(
+            name='Old Atlas', description='Atlas', price='30.00', category=self.books,
+            stock_quantity=0, created_by=self.user
+        )
+        self.Product = Product
+
+    def counts(self, category):
+        from products.models import CategoryRollup
+        from products.rollups import COUNT_FIELDS
+
+        return CategoryRollup.objects.values_list(*COUNT_FIELDS).get(category=category)
+
+    def test_rollups_follow_product_writes(self):
+        """Test that saves, moves, deletes and bulk writes keep the category counts current"""
+        from products.reservations import reserve
+
+        self.assertEqual(self.counts(self.books), (2, 2, 1, 1))
+        self.assertEqual(self.counts(self.toys), (0, 0, 0, 0))
+
+        product = self.Product.objects.get(pk=self.product.pk)
+        product.category = self.toys
+        product.save()
+        self.assertEqual(self.counts(self.books), (1, 1, 0, 1))
+        self.assertEqual(self.counts(self.toys), (1, 1, 1, 0))
+
+        reserve(product, self.user, 5)
+        self.assertEqual(self.counts(self.toys), (1, 1, 0, 1))
+
+        self.client.force_authenticate(self.user)
+        response = self.client.patch(reverse('product-bulk'), [{'slug': 'old-atlas', 'category': self.toys.id}], format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.counts(self.books), (0, 0, 0, 0))
+        self.assertEqual(self.counts(self.toys), (2, 2, 0, 2))
+
+        self.Product.objects.get(slug='old-atlas').delete()
+        self.assertEqual(self.counts(self.toys), (1, 1, 0, 1))
+
+    def test_stock_moves_apply_deltas_without_counting(self):
+        """Test that stock writes move the rollups by their known states and never recount a category"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from products.reservations import release, reserve
+        from products.stock import adjust_stock
+
+        def rollup_queries(queries):
+            return [
+                query['sql'] for query in queries
+                if 'COUNT(' in query['sql'] or 'products_categoryrollup' in query['sql']
+            ]
+
+        with CaptureQueriesContext(connection) as queries:
+            hold = reserve(self.product, self.user, 2)
+        # Still in stock: the counts do not move, so the rollups are not touched
+        self.assertEqual(rollup_queries(queries.captured_queries), [])
+        self.assertEqual(self.counts(self.books), (2, 2, 1, 1))
+
+        with CaptureQueriesContext(connection) as queries:
+            reserve(self.product, self.user, 3)
+        self.assertEqual(len(rollup_queries(queries.captured_queries)), 1)
+        self.assertNotIn('COUNT(', rollup_queries(queries.captured_queries)[0])
+        self.assertEqual(self.counts(self.books), (2, 2, 0, 2))
+
+        with CaptureQueriesContext(connection) as queries:
+            release(hold)
+            adjust_stock([{'slug': 'old-atlas', 'delta': 4}])
+        self.assertFalse(any('COUNT(' in sql for sql in rollup_queries(queries.captured_queries)))
+        self.assertEqual(self.counts(self.books), (2, 2, 2, 0))
+
+    def test_admin_sorts_categories_by_product_count(self):
+        """Test that the category admin reads and sorts by the rollup counts"""
+        admin = User.objects.create_superuser(username='rollupadmin', password='rollupadmin123')
+        self.client.force_login(admin)
+        response = self.client.get(reverse('admin:categories_category_changelist'), {'o': '-3'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([category.name for category in response.context['cl'].result_list], ['Books', 'Toys'])
+
+    def test_category_endpoints_read_rollups_and_reconcile_repairs(self):
+        """Test that category lists read the rollups in one query and drift is repaired"""
+        from io import StringIO
+        from django.core.management import call_command
+        from products.models import CategoryRollup
+
+        # The page count and the page; none per category, and the validators come from the cache entry
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('category-list'))
+        counts = {category['name']: category['products_count'] for category in response.data['results']}
+        self.assertEqual(counts, {'Books': 2, 'Toys': 0})
+        stats = self.client.get(reverse('category-stats', kwargs={'slug': 'books'})).data['stats']
+        self.assertEqual(stats, {'total_products': 2, 'active_products': 2, 'out_of_stock': 1, 'in_stock': 1})
+        popular = self.client.get(reverse('category-popular'))
+        self.assertEqual([category['name'] for category in popular.data], ['Books'])
+
+        CategoryRollup.objects.filter(category=self.books).update(total_products=9)
+        output = StringIO()
+        call_command('reconcile_category_rollups', stdout=output)
+        self.assertIn('Repaired 1', output.getvalue())
+        self.assertEqual(self.counts(self.books), (2, 2, 1, 1))
+
+
+class SeedingEngineTest(APITestCase):
+    def test_generate_large_dataset_is_reproducible(self):
+        """Test that the same seed writes the same rows, with profiles, hashes and rollups"""
+        from io import StringIO
+        from django.core.management import call_command
+        from products.models import CategoryRollup, Product
+        from products.rollups import count_products
+
+        def generate():
+            call_command(
+                'generate_large_dataset', users=6, products=25, clear=True, seed=7,
+                workers=1, stdout=StringIO()
+            )
+            return list(Product.objects.order_by('slug').values_list('slug', 'name', 'price', 'stock_quantity'))
+
+        first = generate()
+        self.assertEqual(len(first), 25)
+        self.assertEqual(generate(), first)
+
+        user = User.objects.filter(is_superuser=False).first()
+        self.assertTrue(user.check_password('password123'))
+        self.assertFalse(User.objects.filter(profile__isnull=True).exists())
+        counts = count_products(Product.objects.all())
+        for rollup in CategoryRollup.objects.all():
+            self.assertEqual(rollup.total_products, counts.get(rollup.category_id, {}).get('total_products', 0))
+
+    def test_reseeding_reports_only_inserted_rows(self):
+        """Test that rows skipped as already existing are not counted as created"""
+        from ecommerce_api.seeding import Seeder
+
+        self.assertEqual(Seeder(seed=3).generate_users(5, 'password123'), 5)
+        seeder = Seeder(seed=3)
+        self.assertEqual(seeder.generate_users(5, 'password123'), 0)
+        self.assertEqual(seeder.created['users'], 0)
+        self.assertEqual(User.objects.count(), 5)
+
+    def test_mock_commands_are_idempotent(self):
+        """Test that the fixed-row commands create missing rows only"""
+        from io import StringIO
+        from django.core.management import call_command
+        from products.models import Product
+
+        call_command('create_mock_data', stdout=StringIO())
+        products = Product.objects.count()
+        self.assertGreater(products, 0)
+        call_command('create_mock_data', stdout=StringIO())
+        call_command('create_mock_users', stdout=StringIO())
+        self.assertEqual(Product.objects.count(), products)
+        self.assertTrue(User.objects.get(username='admin').check_password('admin123'))
+        self.assertFalse(User.objects.filter(profile__isnull=True).exists())
+
+
+class DatasetSnapshotTest(APITestCase):
+    def setUp(self):
+        import tempfile
+
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def test_snapshot_round_trip_and_checksums(self):
+        """Test that a loaded snapshot restores the same rows and corrupt files are rejected"""
+        from io import StringIO
+        from pathlib import Path
+        from django.core.management import call_command
+        from django.core.management.base import CommandError
+        from accounts.models import UserProfile
+        from products.models import CategoryRollup, Product
+
+        call_command('generate_large_dataset', users=5, products=40, seed=3, workers=1, stdout=StringIO())
+        fields = ('id', 'slug', 'price', 'stock_quantity', 'stock_bucket', 'category_id', 'created_by_id', 'created_at')
+        expected = list(Product.objects.order_by('id').values_list(*fields))
+        users = list(User.objects.order_by('id').values_list('id', 'username', 'password'))
+        path = Path(self.directory.name) / 'dataset.snap'
+        call_command('save_snapshot', str(path), stdout=StringIO())
+
+        Product.objects.all().delete()
+        call_command('load_snapshot', str(path), stdout=StringIO())
+        self.assertEqual(list(Product.objects.order_by('id').values_list(*fields)), expected)
+        self.assertEqual(list(User.objects.order_by('id').values_list('id', 'username', 'password')), users)
+        self.assertEqual(UserProfile.objects.count(), len(users))
+        self.assertEqual(sum(CategoryRollup.objects.values_list('total_products', flat=True)), 40)
+
+        data = bytearray(path.read_bytes())
+        data[-5] ^= 0xFF
+        path.write_bytes(bytes(data))
+        with self.assertRaisesMessage(CommandError, 'checksum mismatch'):
+            call_command('load_snapshot', str(path), stdout=StringIO())
+        self.assertEqual(Product.objects.count(), 40)
+
+    def test_failed_load_keeps_the_current_rows(self):
+        """Test that an insert failing midway rolls back the delete too"""
+        from io import StringIO
+        from pathlib import Path
+        from unittest import mock
+        from django.core.management import call_command
+        from django.db import DatabaseError
+        from ecommerce_api import snapshots
+        from products.models import Product
+
+        call_command('generate_large_dataset', users=3, products=10, seed=4, workers=1, stdout=StringIO())
+        path = Path(self.directory.name) / 'dataset.snap'
+        call_command('save_snapshot', str(path), stdout=StringIO())
+        slugs = list(Product.objects.order_by('id').values_list('slug', flat=True))
+        users = User.objects.count()
+
+        insert_rows = snapshots.insert_rows
+
+        def fail_on_products(model, *args):
+            if model is Product:
+                raise DatabaseError('disk full')
+            return insert_rows(model, *args)
+
+        with mock.patch.object(snapshots, 'insert_rows', side_effect=fail_on_products):
+            with self.assertRaises(DatabaseError):
+                snapshots.load_snapshot(path)
+        self.assertEqual(list(Product.objects.order_by('id').values_list('slug', flat=True)), slugs)
+        self.assertEqual(User.objects.count(), users)
+
+    def test_load_dataset_generates_once_then_restores(self):
+        """Test that the cached dataset is generated on first use and loaded after that"""
+        from unittest import mock
+        from django.test import override_settings
+        from ecommerce_api import snapshots
+        from products.models import Product
+
+        with override_settings(DATASET_SNAPSHOT_DIR=self.directory.name):
+            first = snapshots.load_dataset(users=4, products=30, seed=5)
+            self.assertTrue(snapshots.snapshot_path(4, 30, 5).exists())
+            slugs = list(Product.objects.order_by('id').values_list('slug', flat=True))
+            with mock.patch.object(snapshots, 'call_command') as generate:
+                second = snapshots.load_dataset(users=4, products=30, seed=5)
+            generate.assert_not_called()
+        self.assertEqual(first, second)
+        self.assertEqual(second['products.product'], 30)
+        self.assertEqual(list(Product.objects.order_by('id').values_list('slug', flat=True)), slugs)
+
+
+class QueryBudgetTest(APITestCase):
+    def setUp(self):
+        from ecommerce_api import querybudget
+
+        self.admin = User.objects.create_superuser(username='budget', password='budgetpass123', email='b@example.com')
+        for number in range(6):
+            User.objects.create_user(username=f'shopper{number}', password='shopperpass123')
+        querybudget.report.clear()
+        self.addCleanup(querybudget.report.clear)
+        self.client.force_authenticate(self.admin)
+
+    def test_n_plus_one_is_traced_to_the_serializer_field(self):
+        """Test that a repeated query shape fails the request and names the nested field"""
+        from unittest import mock
+        from ecommerce_api.querybudget import QueryBudgetExceeded
+        from accounts.views import UserViewSet
+
+        # The user list itself joins the profiles
+        response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.query_recorder.repeated(2), [])
+        response = self.client.get(reverse('user-list'), {'fields': 'id,profile'})
+        self.assertEqual(response.wsgi_request.query_recorder.repeated(2), [])
+
+        with mock.patch.object(UserViewSet, 'get_queryset', lambda view: User.objects.all()):
+            with self.assertLogs('ecommerce_api.querybudget', level='WARNING'):
+                with self.assertRaisesMessage(QueryBudgetExceeded, 'N+1 from UserSerializer.profile'):
+                    self.client.get(reverse('user-list'))
+
+    def test_budgets_warn_and_the_staff_report_lists_offenders(self):
+        """Test that over-budget requests are logged in warn mode and shown to staff only"""
+        from django.test import override_settings
+
+        with override_settings(QUERY_BUDGET_MODE='warn', QUERY_BUDGETS={'user-list': 1}):
+            with self.assertLogs('ecommerce_api.querybudget', level='WARNING') as logs:
+                response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('budget 1', logs.output[0])
+
+        self.client.force_login(self.admin)
+        report = self.client.get(reverse('admin:query-report'))
+        self.assertEqual(report.status_code, 200)
+        self.assertContains(report, 'user-list')
+        self.assertEqual(report.context['flagged'][0]['budget'], 1)
+
+        self.client.logout()
+        self.client.force_login(User.objects.get(username='shopper0'))
+        self.assertEqual(self.client.get(reverse('admin:query-report')).status_code, 302)
+
+    def test_unmatched_paths_share_one_report_entry(self):
+        """Test that requests to unknown paths are reported under one endpoint"""
+        from ecommerce_api import querybudget
+
+        for number in range(3):
+            self.assertEqual(self.client.get(f'/no-such-page-{number}/').status_code, 404)
+        self.assertEqual(list(querybudget.report.endpoints), ['unmatched'])
+        self.assertEqual(querybudget.report.endpoints['unmatched']['requests'], 3)
+
+
+class ServerTimingTest(APITestCase):
+    def setUp(self):
+        from categories.models import Category
+        from products.models import Product
+
+        self.user = User.objects.create_superuser(username='timing', password='timingpass123', email='t@example.com')
+        category = Category.objects.create(name='Lamps')
+        Product.objects.create(
+            name='Desk Lamp', description='Lamp', price='25.00', category=category,
+            stock_quantity=4, created_by=self.user
+        )
+
+    def phases(self, response):
+        return {entry.split(';')[0].strip(): entry for entry in response['Server-Timing'].split(',')}
+
+    def test_api_responses_break_down_the_request(self):
+        """Test that Server-Timing covers auth, queryset, serializer, renderer and database time"""
+        import json
+        from django.test import override_settings
+
+        self.client.force_authenticate(self.user)
+        with override_settings(SERVER_TIMING_DEBUG=True):
+            response = self.client.get(reverse('user-list'))
+        self.assertEqual(response.status_code, 200)
+        phases = self.phases(response)
+        for name in ('auth', 'permissions', 'queryset', 'filter', 'serialize', 'render', 'db', 'total'):
+            self.assertIn(name, phases)
+        self.assertRegex(phases['db'], r'db;dur=[\d.]+;desc="\d+ queries"')
+        debug = json.loads(response['X-Debug-Timing'])
+        self.assertEqual(debug['total']['calls'], 1)
+        self.assertGreaterEqual(debug['total']['ms'], debug['render']['ms'])
+
+        # The compiled list serializer reports its own time
+        with override_settings(SERVER_TIMING_DEBUG=False):
+            response = self.client.get(reverse('product-list'), {'search': 'lamp'})
+        self.assertIn('serialize', self.phases(response))
+        self.assertNotIn('X-Debug-Timing', response)
+
+    def test_disabled_timing_adds_nothing(self):
+        """Test that with SERVER_TIMING off no header is sent and timed() is a no-op"""
+        from django.test import override_settings
+        from ecommerce_api.timing import current_timings, timed
+
+        with override_settings(SERVER_TIMING=False):
+            response = self.client.get(reverse('product-list'))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Server-Timing', response)
+        with timed('outside'):
+            pass
+        self.assertIsNone(current_timings.get())
+
+
+class MetricsEndpointTest(APITestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        settings_override = override_settings(METRICS_DIR=self.directory, METRICS_TOKEN='')
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def scrape(self):
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+        samples = {}
+        for line in response.content.decode().splitlines():
+            if line and not line.startswith('#'):
+                name, value = line.rsplit(' ', 1)
+                samples[name] = float(value)
+        return samples
+
+    def test_requests_latency_db_and_cache_are_exported(self):
+        """Test that route counters, latency histograms, DB stats and cache hit ratios are scraped"""
+        before = self.scrape().get('http_requests_total{method="GET",route="product-list",status="200"}', 0)
+        self.client.get(reverse('product-list'))
+        self.client.get(reverse('product-list'))
+
+        samples = self.scrape()
+        self.assertEqual(samples['http_requests_total{method="GET",route="product-list",status="200"}'], before + 2)
+        self.assertEqual(
+            samples['http_request_duration_seconds_bucket{method="GET",route="product-list",le="+Inf"}'],
+            samples['http_request_duration_seconds_count{method="GET",route="product-list"}'],
+        )
+        self.assertGreater(samples['db_queries_total{route="product-list"}'], 0)
+        self.assertGreater(samples['catalog_cache_hit_ratio{endpoint="products.list"}'], 0)
+        # The scrape itself is in flight
+        self.assertEqual(samples['http_requests_in_flight'], 1)
+
+    def test_worker_files_are_added_up(self):
+        """Test that other workers' counters are summed and exited workers' gauges dropped"""
+        import json
+        import os
+        from pathlib import Path
+        from ecommerce_api import metrics
+
+        def write(pid, requests, in_flight):
+            values = {
+                'counters': [['http_requests_total', [['method', 'GET'], ['route', 'elsewhere'], ['status', '200']], requests]],
+                'gauges': [['http_requests_in_flight', [], in_flight]],
+                'histograms': [],
+            }
+            Path(self.directory, f'metrics-{pid}.json').write_text(json.dumps({'pid': pid, 'values': values}))
+
+        write(os.getppid(), 3, 2)
+        write(2 ** 22 + 4321, 4, 5)
+        samples = self.scrape()
+        self.assertEqual(samples['http_requests_total{method="GET",route="elsewhere",status="200"}'], 7)
+        self.assertEqual(samples['http_requests_in_flight'], 3)
+
+        metrics.flush(force=True)
+        self.assertTrue(Path(self.directory, f'metrics-{os.getpid()}.json').exists())
+
+        with self.settings(METRICS_TOKEN='scrape-secret'):
+            self.assertEqual(self.client.get('/metrics').status_code, 401)
+            response = self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer scrape-secret')
+            self.assertEqual(response.status_code, 200)
+
+
+class RequestTracingTest(APITestCase):
+    def setUp(self):
+        import tempfile
+        from pathlib import Path
+        from django.test import override_settings
+        from categories.models import Category
+        from products.models import Product
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(TRACE_FILE=str(Path(directory.name) / 'traces.jsonl'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+        self.staff = User.objects.create_user(username='tracer', password='tracerpass123', is_staff=True)
+        category = Category.objects.create(name='Garden')
+        Product.objects.create(
+            name='Rake', description='Rake', price='15.00', category=category,
+            stock_quantity=8, created_by=self.staff
+        )
+
+    def test_slow_requests_are_kept_with_a_span_tree(self):
+        """Test that kept traces hold view, SQL, serializer, URL and template spans in a tree"""
+        from ecommerce_api import tracing
+
+        with self.settings(TRACE_SLOW_MS=0):
+            self.client.get(reverse('product-list'), {'search': 'rake'})
+            self.client.force_login(self.staff)
+            self.client.get(reverse('crud-dashboard'))
+
+        dashboard, products = tracing.recent_traces()
+        self.assertEqual((products['route'], products['status'], products['kept']), ('product-list', 200, 'slow'))
+        spans = {item['name']: item for item in products['spans']}
+        self.assertEqual(spans['view']['attributes']['view'], 'products.views.ProductViewSet.list')
+        for name in ('sql', 'serialize', 'render', 'build_absolute_uri'):
+            self.assertIn(name, spans)
+        self.assertRegex(spans['sql']['attributes']['fingerprint'], r'^[0-9a-f]{12}$')
+        by_id = {item['id']: item for item in products['spans']}
+        ancestors = []
+        parent = spans['serialize']['parent']
+        while parent is not None:
+            ancestors.append(by_id[parent]['name'])
+            parent = by_id[parent]['parent']
+        self.assertEqual(ancestors[-2:], ['view', 'request'])
+        self.assertTrue(all(item['duration_ms'] is not None for item in products['spans']))
+
+        template = next(item for item in dashboard['spans'] if item['name'] == 'template')
+        self.assertEqual(template['attributes']['template'], 'crud_dashboard.html')
+
+    def test_sampling_and_staff_viewer(self):
+        """Test that fast requests are dropped unless sampled and that only staff see traces"""
+        from ecommerce_api import tracing
+
+        with self.settings(TRACE_SLOW_MS=60000, TRACE_SAMPLE_RATE=0):
+            self.client.get(reverse('product-list'))
+        self.assertEqual(tracing.recent_traces(), [])
+        with self.settings(TRACE_SLOW_MS=60000, TRACE_SAMPLE_RATE=1):
+            self.client.get(reverse('product-list'))
+        [trace] = tracing.recent_traces()
+        self.assertEqual(trace['kept'], 'sampled')
+
+        self.client.force_login(self.staff)
+        listing = self.client.get(reverse('admin:traces'))
+        self.assertContains(listing, trace['trace_id'])
+        detail = self.client.get(reverse('admin:trace-detail', args=[trace['trace_id']]))
+        self.assertContains(detail, 'ProductViewSet.list')
+        self.assertEqual(self.client.get(reverse('admin:trace-detail', args=['missing'])).status_code, 404)
+
+        self.client.force_login(User.objects.create_user(username='shopper', password='shopperpass123'))
+        self.assertEqual(self.client.get(reverse('admin:traces')).status_code, 302)
+
+    def test_each_process_writes_its_own_file(self):
+        """Test that workers write separate trace files and the viewer reads all of them"""
+        from unittest import mock
+        from ecommerce_api import tracing
+
+        for pid, started_at in ((101, 1.0), (202, 2.0), (101, 3.0)):
+            with mock.patch.object(tracing.os, 'getpid', return_value=pid):
+                tracing.write_trace({'trace_id': f'{pid}-{started_at}', 'started_at': started_at, 'spans': []})
+
+        self.assertEqual([path.name for path in tracing.trace_files()], ['traces-101.jsonl', 'traces-202.jsonl'])
+        self.assertEqual([trace['trace_id'] for trace in tracing.recent_traces()], ['101-3.0', '202-2.0', '101-1.0'])
+        self.assertEqual(tracing.find_trace('202-2.0')['started_at'], 2.0)
+
+
+class ProfilerTest(APITestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        from ecommerce_api import profiling
+
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        settings_override = override_settings(PROFILER_DIR=directory.name, PROFILER_INTERVAL_MS=1)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.addCleanup(profiling.stop_profile)
+
+        self.staff = User.objects.create_user(username='profiler', password='profilerpass123', is_staff=True)
+
+    def test_profiles_the_next_matching_requests(self):
+        """Test that a requests profile samples only the next K matching requests and renders a flame graph"""
+        import time
+        from unittest import mock
+        from ecommerce_api import profiling
+        from products.views import ProductViewSet
+
+        self.client.force_login(self.staff)
+        self.client.post(reverse('admin:profiler'), {
+            'action': 'requests', 'pattern': '^/api/products/$', 'count': 2, 'seconds': 30,
+        })
+        profile = profiling.active_profile()
+        self.assertEqual((profile.kind, profile.remaining), ('requests', 2))
+
+        list_products = ProductViewSet.list
+
+        def slow_list(view, request, *args, **kwargs):
+            time.sleep(0.05)
+            return list_products(view, request, *args, **kwargs)
+
+        with mock.patch.object(ProductViewSet, 'list', slow_list):
+            self.client.get(reverse('category-list'))
+            for _ in range(3):
+                self.client.get(reverse('product-list'))
+        profile.thread.join(5)
+        self.assertIsNone(profiling.active_profile())
+
+        saved = profiling.load_profile(profile.id)
+        self.assertEqual([item['request'] for item in saved['requests']], ['GET /api/products/'] * 2)
+        self.assertGreater(saved['samples'], 0)
+        self.assertTrue(any('rest_framework.views:APIView.dispatch' in stack for stack in saved['stacks']))
+        self.assertTrue(any('slow_list' in stack for stack in saved['stacks']))
+
+        detail = self.client.get(reverse('admin:profile-detail', args=[profile.id]))
+        self.assertContains(detail, '<svg')
+        self.assertContains(detail, 'APIView.dispatch')
+        collapsed = self.client.get(reverse('admin:profile-collapsed', args=[profile.id])).content.decode()
+        self.assertRegex(collapsed.splitlines()[0], r'^\S.*;.* \d+$')
+        self.assertEqual(self.client.get(reverse('admin:profile-detail', args=['missing'])).status_code, 404)
+
+        self.client.force_login(User.objects.create_user(username='shopper', password='shopperpass123'))
+        self.assertEqual(self.client.get(reverse('admin:profiler')).status_code, 302)
+
+    def test_worker_profile_and_flame_graph_layout(self):
+        """Test that a timed profile samples every thread, runs one at a time and can be stopped early"""
+        import time
+        from ecommerce_api import profiling
+
+        self.client.force_login(self.staff)
+        self.client.post(reverse('admin:profiler'), {'action': 'seconds', 'seconds': 60})
+        profile = profiling.active_profile()
+        with self.assertRaises(profiling.ProfilerBusy):
+            profiling.start_profile('seconds', 1)
+        time.sleep(0.05)
+        self.assertContains(self.client.get(reverse('admin:profiler')), 'Stop and save')
+        response = self.client.post(reverse('admin:profiler'), {'action': 'stop'})
+        self.assertRedirects(response, reverse('admin:profile-detail', args=[profile.id]))
+        self.assertContains(self.client.get(reverse('admin:profiler')), profile.id)
+
+        saved = profiling.load_profile(profile.id)
+        self.assertGreater(saved['samples'], 0)
+        self.assertTrue(any('ProfilerTest.test_worker_profile_and_flame_graph_layout' in stack for stack in saved['stacks']))
+        self.assertIn(profile.id, [item['id'] for item in profiling.saved_profiles()])
+
+        svg = profiling.flamegraph_svg({'app:main;app:serialize': 3, 'app:main;app:query': 1})
+        self.assertIn('<title>app:serialize (3 samples, 75.00%)</title>', svg)
+        self.assertIn('<title>all (4 samples, 100.00%)</title>', svg)
+        self.assertEqual(
+            profiling.top_functions({'app:main;app:serialize': 3, 'app:main;app:query': 1})[0],
+            {'name': 'app:main', 'self': 0, 'total': 4},
+        )
@@ -0,0 +1,205 @@
+"""
+Server-Timing breakdown of API requests.
+
+``ServerTimingMiddleware`` collects named phases for each request and sends
+them in a ``Server-Timing`` header, which browser devtools show in the
+network timing tab::
+
+    Server-Timing: auth;dur=0.8, permissions;dur=0.1, queryset;dur=0.3,
+                   filter;dur=1.2, serialize;dur=14.5, render;dur=3.1,
+                   db;dur=9.7;desc="12 queries", total;dur=31.0
+
+The phases come from:
+
+- ``db``: every query, through ``connection.execute_wrapper``
+- ``auth``, ``permissions``, ``throttle``, ``queryset``, ``filter``,
+  ``serialize`` and ``render``: ``ServerTimingMixin`` on DRF views
+- any code that wraps a step in ``timed(name)``, like the compiled list
+  serializer
+
+Every ``timed()`` block is also a span of the request's trace
+(``ecommerce_api.tracing``).
+
+Phases nest: ``serialize`` includes the queries that lazy querysets run
+while serializing, and ``db`` counts those too. ``total`` covers the
+whole middleware chain below this one.
+
+With ``SERVER_TIMING_DEBUG`` the same numbers are also sent as JSON in
+``X-Debug-Timing``, with call counts per phase. With ``SERVER_TIMING``
+off, the middleware returns straight away and ``timed()`` costs one
+context variable lookup.
+"""
+import functools
+import json
+import time
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import connections
+
+from .tracing import span
+
+current_timings = ContextVar('current_timings', default=None)
+
+
+class Timings:
+    """Accumulated milliseconds and call counts per phase, in first-seen order"""
+
+    def __init__(self):
+        self.phases = {}
+        self.queries = 0
+        # Phases being timed right now; nested blocks of the same phase are not counted twice
+        self.active = set()
+
+    def add(self, name, seconds):
+        phase = self.phases.setdefault(name, [0.0, 0])
+        phase[0] += seconds * 1000
+        phase[1] += 1
+
+    def execute_wrapper(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.add('db', time.perf_counter() - started)
+            self.queries += 1
+
+    def header(self):
+        entries = []
+        for name, (milliseconds, calls) in self.phases.items():
+            entry = f'{name};dur={milliseconds:.1f}'
+            if name == 'db':
+                entry += f';desc="{self.queries} queries"'
+            entries.append(entry)
+        return ', '.join(entries)
+
+    def debug(self):
+        return json.dumps({
+            name: {'ms': round(milliseconds, 3), 'calls': calls}
+            for name, (milliseconds, calls) in self.phases.items()
+        }, separators=(',', ':'))
+
+
+@contextmanager
+def timed(name):
+    """Add the time spent in the block to phase ``name`` of the current request (and trace it)"""
+    timings = current_timings.get()
+    with span(name):
+        if timings is None or name in timings.active:
+            yield
+            return
+        timings.active.add(name)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            timings.active.discard(name)
+            timings.add(name, time.perf_counter() - started)
+
+
+def timed_method(name, method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with timed(name):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+class ServerTimingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'SERVER_TIMING', True):
+            return self.get_response(request)
+
+        timings = Timings()
+        token = current_timings.set(timings)
+        started = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(timings.execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            current_timings.reset(token)
+        timings.add('total', time.perf_counter() - started)
+
+        response['Server-Timing'] = timings.header()
+        if getattr(settings, 'SERVER_TIMING_DEBUG', False):
+            response['X-Debug-Timing'] = timings.debug()
+        return response
+
+
+# Serializer classes with a timed ``data``, created on first use
+timed_serializer_classes = {}
+
+
+def timed_data(serializer):
+    with timed('serialize'):
+        return super(type(serializer), serializer).data
+
+
+def time_serializer(serializer):
+    """Make ``serializer.data`` count toward the ``serialize`` phase"""
+    base = type(serializer)
+    if getattr(base, 'timed_serializer', False):
+        return serializer
+    timed_class = timed_serializer_classes.get(base)
+    if timed_class is None:
+        timed_class = type(base.__name__, (base,), {
+            'data': property(timed_data), 'timed_serializer': True, '__module__': base.__module__,
+        })
+        timed_serializer_classes[base] = timed_class
+    serializer.__class__ = timed_class
+    return serializer
+
+
+class ServerTimingMixin:
+    """Times the DRF request lifecycle steps of a view; put it first in the bases"""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Views replace get_queryset without calling super(); time their own
+        if 'get_queryset' in cls.__dict__:
+            cls.get_queryset = timed_method('queryset', cls.__dict__['get_queryset'])
+
+    def perform_authentication(self, request):
+        with timed('auth'):
+            super().perform_authentication(request)
+
+    def check_permissions(self, request):
+        with timed('permissions'):
+            super().check_permissions(request)
+
+    def check_object_permissions(self, request, obj):
+        with timed('permissions'):
+            super().check_object_permissions(request, obj)
+
+    def check_throttles(self, request):
+        with timed('throttle'):
+            super().check_throttles(request)
+
+    def get_queryset(self):
+        with timed('queryset'):
+            return super().get_queryset()
+
+    def filter_queryset(self, queryset):
+        with timed('filter'):
+            return super().filter_queryset(queryset)
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if current_timings.get() is not None:
+            time_serializer(serializer)
+        return serializer
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if current_timings.get() is not None and hasattr(response, 'render'):
+            # Django would render right after the view returns; doing it
+            # here lets the time be attributed to the renderer
+            with timed('render'):
+                response.render()
+        return response
@@ -0,0 +1,306 @@
+"""
+Tail-sampled request traces.
+
+``TracingMiddleware`` builds a span tree for every request:
+
+- ``request``: the whole request, with method, path, route and status
+- ``view``: from the view being called until the response is returned
+- ``sql``: every query, with its shape fingerprint (see
+  ``ecommerce_api.querybudget.query_shape``) and the SQL text
+- ``build_absolute_uri``: each absolute URL built for the request
+- every ``ecommerce_api.timing.timed()`` phase (``auth``, ``queryset``,
+  ``serialize``, ``render``...), and ``template`` spans from ``render()``
+  used by the CRUD pages
+
+Spans are kept in memory until the request ends, and only then is the
+trace kept or dropped (*tail* sampling). Requests slower than
+``TRACE_SLOW_MS`` are always kept, and the others with probability
+``TRACE_SAMPLE_RATE``. Kept traces are appended as JSON lines to a file
+per process next to ``TRACE_FILE`` (``traces-<pid>.jsonl`` for
+``traces.jsonl``), so gunicorn workers never rotate a file another worker
+is writing; each rotates its own at ``TRACE_FILE_MAX_BYTES``. Staff can
+browse the traces of every worker at ``/admin/traces/``.
+"""
+import hashlib
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import ExitStack, contextmanager
+from contextvars import ContextVar
+from logging.handlers import RotatingFileHandler
+from pathlib import Path
+
+from django import shortcuts
+from django.conf import settings
+from django.db import connections
+
+from .querybudget import query_shape
+
+DEFAULT_SLOW_MS = 500
+DEFAULT_SAMPLE_RATE = 0.01
+DEFAULT_MAX_SPANS = 2000
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+SQL_TEXT_LIMIT = 1000
+
+current_trace = ContextVar('current_trace', default=None)
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class Trace:
+    def __init__(self, max_spans):
+        self.trace_id = uuid.uuid4().hex
+        self.started_at = time.time()
+        self.origin = time.perf_counter()
+        self.max_spans = max_spans
+        self.spans = []
+        self.dropped = 0
+        # Ids of the open spans, innermost last
+        self.stack = []
+        self.view_span = None
+
+    def start(self, name, attributes):
+        """Open a span under the innermost open one; return its index or None when over the limit"""
+        if len(self.spans) >= self.max_spans:
+            self.dropped += 1
+            return None
+        span = {
+            'id': len(self.spans),
+            'parent': self.stack[-1] if self.stack else None,
+            'name': name,
+            'start_ms': (time.perf_counter() - self.origin) * 1000,
+            'duration_ms': None,
+            'attributes': attributes,
+        }
+        self.spans.append(span)
+        self.stack.append(span['id'])
+        return span['id']
+
+    def finish(self, span_id, **attributes):
+        if span_id is None:
+            return
+        span = self.spans[span_id]
+        span['duration_ms'] = round((time.perf_counter() - self.origin) * 1000 - span['start_ms'], 3)
+        span['start_ms'] = round(span['start_ms'], 3)
+        span['attributes'].update(attributes)
+        # Spans close innermost first; anything left open inside is closed with it
+        if span_id in self.stack:
+            del self.stack[self.stack.index(span_id):]
+
+    def as_dict(self):
+        root = self.spans[0]
+        return {
+            'trace_id': self.trace_id,
+            'started_at': self.started_at,
+            'duration_ms': root['duration_ms'],
+            'method': root['attributes'].get('method'),
+            'path': root['attributes'].get('path'),
+            'route': root['attributes'].get('route'),
+            'status': root['attributes'].get('status'),
+            'spans': self.spans,
+            'dropped_spans': self.dropped,
+        }
+
+
+@contextmanager
+def span(name, **attributes):
+    """Record the block as a span of the current request's trace, if any"""
+    trace = current_trace.get()
+    if trace is None:
+        yield
+        return
+    span_id = trace.start(name, attributes)
+    try:
+        yield
+    finally:
+        trace.finish(span_id)
+
+
+def render(request, template_name, context=None, *args, **kwargs):
+    """``django.shortcuts.render`` inside a ``template`` span"""
+    with span('template', template=template_name):
+        return shortcuts.render(request, template_name, context, *args, **kwargs)
+
+
+def sql_fingerprint(sql):
+    return hashlib.sha1(query_shape(sql).encode()).hexdigest()[:12]
+
+
+def trace_query(execute, sql, params, many, context):
+    trace = current_trace.get()
+    if trace is None:
+        return execute(sql, params, many, context)
+    span_id = trace.start('sql', {
+        'fingerprint': sql_fingerprint(sql),
+        'sql': sql[:SQL_TEXT_LIMIT],
+        'many': many,
+        'alias': context['connection'].alias,
+    })
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        trace.finish(span_id)
+
+
+def should_keep(duration_ms):
+    """``'slow'``, ``'sampled'`` or None"""
+    if duration_ms >= getattr(settings, 'TRACE_SLOW_MS', DEFAULT_SLOW_MS):
+        return 'slow'
+    if random.random() < getattr(settings, 'TRACE_SAMPLE_RATE', DEFAULT_SAMPLE_RATE):
+        return 'sampled'
+    return None
+
+
+def trace_file():
+    return Path(getattr(settings, 'TRACE_FILE', Path(settings.BASE_DIR) / 'var' / 'traces' / 'traces.jsonl'))
+
+
+def process_trace_file(pid):
+    """The file the process ``pid`` writes its traces to"""
+    path = trace_file()
+    return path.with_name(f'{path.stem}-{pid}{path.suffix}')
+
+
+def trace_files(rotated=False):
+    """Every process's trace file, with their rotated backups when ``rotated``"""
+    path = trace_file()
+    if not path.parent.exists():
+        return []
+    return sorted(path.parent.glob(f'{path.stem}-*{path.suffix}' + ('*' if rotated else '')))
+
+
+def writer_for(path):
+    """One rotating handler per file; only this process writes to it, and its lock serializes the writes"""
+    with _writers_lock:
+        handler = _writers.get(path)
+        if handler is None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            handler = RotatingFileHandler(
+                path,
+                maxBytes=getattr(settings, 'TRACE_FILE_MAX_BYTES', DEFAULT_MAX_BYTES),
+                backupCount=getattr(settings, 'TRACE_FILE_BACKUPS', DEFAULT_BACKUPS),
+                encoding='utf-8',
+            )
+            handler.setFormatter(logging.Formatter('%(message)s'))
+            _writers[path] = handler
+        return handler
+
+
+def write_trace(data):
+    record = logging.LogRecord('ecommerce_api.tracing', logging.INFO, __file__, 0, json.dumps(data, default=str), None, None)
+    writer_for(process_trace_file(os.getpid())).handle(record)
+
+
+def recent_traces(limit=200):
+    """The newest kept traces in the processes' current trace files, newest first"""
+    traces = []
+    for path in trace_files():
+        lines = deque(maxlen=limit)
+        try:
+            with open(path, encoding='utf-8') as file:
+                lines.extend(file)
+        except OSError:
+            continue
+        for line in lines:
+            try:
+                traces.append(json.loads(line))
+            except ValueError:
+                continue
+    traces.sort(key=lambda trace: trace['started_at'], reverse=True)
+    return traces[:limit]
+
+
+def find_trace(trace_id):
+    """A kept trace by id, searching every process's files and their rotated backups"""
+    for candidate in trace_files(rotated=True):
+        if not candidate.exists():
+            continue
+        with open(candidate, encoding='utf-8') as traces:
+            for line in traces:
+                if trace_id in line:
+                    try:
+                        data = json.loads(line)
+                    except ValueError:
+                        continue
+                    if data.get('trace_id') == trace_id:
+                        return data
+    return None
+
+
+def span_tree(trace):
+    """Spans in depth-first order as ``(depth, span)``, for the viewer"""
+    children = {}
+    for item in trace['spans']:
+        children.setdefault(item['parent'], []).append(item)
+    ordered = []
+    pending = [(0, item) for item in reversed(children.get(None, []))]
+    while pending:
+        depth, item = pending.pop()
+        ordered.append((depth, item))
+        pending.extend((depth + 1, child) for child in reversed(children.get(item['id'], [])))
+    return ordered
+
+
+class TracingMiddleware:
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not getattr(settings, 'TRACING_ENABLED', True):
+            return self.get_response(request)
+
+        trace = Trace(getattr(settings, 'TRACE_MAX_SPANS', DEFAULT_MAX_SPANS))
+        token = current_trace.set(trace)
+        root = trace.start('request', {'method': request.method, 'path': request.get_full_path(), 'pid': os.getpid()})
+        build_absolute_uri = request.build_absolute_uri
+
+        def traced_build_absolute_uri(location=None):
+            with span('build_absolute_uri'):
+                return build_absolute_uri(location)
+
+        request.build_absolute_uri = traced_build_absolute_uri
+        status = 500
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    stack.enter_context(connection.execute_wrapper(trace_query))
+                response = self.get_response(request)
+            status = response.status_code
+            return response
+        finally:
+            current_trace.reset(token)
+            trace.finish(trace.view_span)
+            match = request.resolver_match
+            trace.finish(root, status=status, route=match.view_name if match else None)
+            reason = should_keep(trace.spans[0]['duration_ms'])
+            if reason:
+                data = trace.as_dict()
+                data['kept'] = reason
+                try:
+                    write_trace(data)
+                except OSError:
+                    logging.getLogger(__name__).warning('Could not write trace %s', trace.trace_id, exc_info=True)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        trace = current_trace.get()
+        if trace is not None:
+            # Closed once the view and the middleware inside this one return
+            trace.view_span = trace.start('view', {'view': view_name(view_func, request.method)})
+        return None
+
+
+def view_name(view_func, method):
+    """Dotted name of a view; DRF viewsets also name the action"""
+    view_class = getattr(view_func, 'cls', None) or getattr(view_func, 'view_class', None)
+    if view_class is None:
+        return f'{view_func.__module__}.{getattr(view_func, "__qualname__", type(view_func).__name__)}'
+    name = f'{view_class.__module__}.{view_class.__qualname__}'
+    action = (getattr(view_func, 'actions', None) or {}).get(method.lower())
+    return f'{name}.{action}' if action else name
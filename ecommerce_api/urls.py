@@ -35,6 +35,9 @@ urlpatterns = [
     # Healthcheck endpoint for Railway
     path('health/', views.healthcheck, name='healthcheck'),
     
+    # Prometheus scrape endpoint
+    path('metrics', views.metrics, name='metrics'),
+    
     # Authentication URLs
     path('login/', views.user_login, name='user-login'),
     path('logout/', views.user_logout, name='user-logout'),
@@ -2,7 +2,7 @@ from django.shortcuts import render, redirect
 from django.contrib.auth import authenticate, login, logout
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
@@ -14,6 +14,9 @@ from accounts.serializers import UserCreateSerializer
 from django.utils import timezone
 from django.core.management import call_command
 from django.views.decorators.csrf import csrf_exempt
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+from . import metrics as request_metrics
 import json
 
 
@@ -137,6 +140,14 @@ def healthcheck(request):
     })
 
 
+def metrics(request):
+    """Prometheus metrics for all workers (bearer token required when METRICS_TOKEN is set)"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token and not constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+        return JsonResponse({'error': 'Invalid metrics token'}, status=401)
+    return HttpResponse(request_metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 def create_mock_data(request):
     """Create mock data for debugging purposes"""
     if request.method == 'POST':
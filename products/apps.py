@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class ProductsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'products'
+
+    def ready(self):
+        # Register the catalog indexes kept current by the signals in models.py
+        from . import bitmaps, search  # noqa: F401
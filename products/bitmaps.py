@@ -0,0 +1,435 @@
+"""
+Bitmap index answering the common ``ProductFilter`` combinations in memory.
+
+Every product gets a slot, numbered in ``(created_at, id)`` order, and the
+index keeps one bitset per category, stock status, price bucket and active
+flag. A filter combination is a handful of bitwise ANDs/ORs over those sets;
+the matching slots are read newest first, so only the ids of the requested
+page are looked up in the database.
+
+See ``products.indexing`` for how the index is built and kept current.
+"""
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal, InvalidOperation
+
+from .facets import PRICE_BUCKETS, STOCK_STATUSES, price_buckets
+from .filters import ProductFilter
+from .indexing import CatalogIndex, register_index
+from .models import stock_bucket_for as stock_status
+
+# Positions are split into chunks of this many bits; empty chunks are not stored
+CHUNK_BITS = 1 << 16
+
+# Lower edges of the price buckets. Filters whose bounds fall inside a bucket
+# check the exact price of the products in that bucket only, so finer buckets
+# mean fewer checks. Every facet bucket edge must be one of these.
+PRICE_EDGES = (0, 5, 10, 15, 20, 25, 30, 40, 50, 75, 100, 150, 200, 250, 300, 400, 500,
+               750, 1000, 2000, 5000)
+
+assert set(PRICE_BUCKETS) <= set(PRICE_EDGES)
+
+# ProductFilter parameters the index can answer
+BITMAP_FILTERS = ('category', 'in_stock', 'is_active', 'min_price', 'max_price')
+
+# BooleanFilter reads its value through NullBooleanSelect; anything else means "no filter"
+BOOLEAN_VALUES = {'True': True, 'true': True, '2': True, 'False': False, 'false': False, '3': False}
+
+
+class Bitset:
+    """
+    Compressed set of non-negative integers.
+
+    Positions are grouped into ``CHUNK_BITS``-wide chunks, each stored as a
+    Python int and only if it is non-empty, so sparse sets stay small and
+    set operations only touch chunks present on both sides.
+    """
+    __slots__ = ('chunks',)
+
+    def __init__(self, chunks=None):
+        self.chunks = chunks if chunks is not None else {}
+
+    @classmethod
+    def from_positions(cls, positions):
+        bitset = cls()
+        for position in positions:
+            bitset.add(position)
+        return bitset
+
+    @classmethod
+    def union(cls, bitsets):
+        result = cls()
+        for bitset in bitsets:
+            result |= bitset
+        return result
+
+    def add(self, position):
+        key, bit = divmod(position, CHUNK_BITS)
+        self.chunks[key] = self.chunks.get(key, 0) | (1 << bit)
+
+    def discard(self, position):
+        key, bit = divmod(position, CHUNK_BITS)
+        word = self.chunks.get(key)
+        if word is None:
+            return
+        word &= ~(1 << bit)
+        if word:
+            self.chunks[key] = word
+        else:
+            del self.chunks[key]
+
+    def __contains__(self, position):
+        key, bit = divmod(position, CHUNK_BITS)
+        return bool(self.chunks.get(key, 0) >> bit & 1)
+
+    def __len__(self):
+        return sum(word.bit_count() for word in self.chunks.values())
+
+    def __bool__(self):
+        return bool(self.chunks)
+
+    def __eq__(self, other):
+        return isinstance(other, Bitset) and self.chunks == other.chunks
+
+    def __and__(self, other):
+        small, large = sorted((self.chunks, other.chunks), key=len)
+        chunks = {}
+        for key, word in small.items():
+            word &= large.get(key, 0)
+            if word:
+                chunks[key] = word
+        return Bitset(chunks)
+
+    def __or__(self, other):
+        chunks = dict(self.chunks)
+        for key, word in other.chunks.items():
+            chunks[key] = chunks.get(key, 0) | word
+        return Bitset(chunks)
+
+    def __ior__(self, other):
+        for key, word in other.chunks.items():
+            self.chunks[key] = self.chunks.get(key, 0) | word
+        return self
+
+    def __sub__(self, other):
+        chunks = {}
+        for key, word in self.chunks.items():
+            word &= ~other.chunks.get(key, 0)
+            if word:
+                chunks[key] = word
+        return Bitset(chunks)
+
+    def iter_descending(self, skip=0):
+        """Yield positions from highest to lowest, after skipping the first ``skip``"""
+        for key in sorted(self.chunks, reverse=True):
+            word = self.chunks[key]
+            if skip:
+                count = word.bit_count()
+                if skip >= count:
+                    skip -= count
+                    continue
+            base = key * CHUNK_BITS
+            while word:
+                bit = word.bit_length() - 1
+                word ^= 1 << bit
+                if skip:
+                    skip -= 1
+                    continue
+                yield base + bit
+
+
+def price_bucket(price):
+    return max(bisect_right(PRICE_EDGES, price) - 1, 0)
+
+
+def parse_filters(params):
+    """
+    Translate query parameters into index filters the way ``ProductFilter`` reads them.
+
+    Returns None when the request uses anything the index cannot answer, or
+    a value ``ProductFilter`` would reject, so the caller falls back to the ORM.
+    """
+    unsupported = (set(ProductFilter.base_filters) - set(BITMAP_FILTERS)) | {'search', 'cursor', 'pagination'}
+    if any(params.get(name) for name in unsupported):
+        return None
+    if params.get('ordering', '-created_at') not in ('', '-created_at'):
+        return None
+
+    filters = {}
+    for name in ('category', 'min_price', 'max_price'):
+        value = (params.get(name) or '').strip()
+        if not value:
+            continue
+        try:
+            value = Decimal(value)
+        except InvalidOperation:
+            return None
+        if not value.is_finite():
+            return None
+        if name == 'category':
+            if value != value.to_integral_value():
+                return None
+            value = int(value)
+        filters[name] = value
+    for name in ('in_stock', 'is_active'):
+        value = BOOLEAN_VALUES.get(params.get(name))
+        if value is not None:
+            filters[name] = value
+    return filters
+
+
+class BitmapIndex(CatalogIndex):
+    """Bitsets over product slots for category, stock status, price bucket and active flag"""
+    label = 'bitmap index'
+    product_fields = ('id', 'category_id', 'is_active', 'price', 'stock_quantity', 'created_at', 'updated_at')
+
+    def reset(self):
+        self.slot_of = {}                   # product_id -> slot
+        self.slot_ids = []                  # slot -> product_id
+        self.slot_order = []                # slot -> (created_at, product_id)
+        self.slot_prices = []               # slot -> price
+        self.rows = {}                      # product_id -> (category_id, is_active, price, stock_quantity)
+        self.live = Bitset()
+        self.by_category = {}
+        self.by_stock = {key: Bitset() for key, condition in STOCK_STATUSES}
+        self.by_price = [Bitset() for edge in PRICE_EDGES]
+        self.by_active = {True: Bitset(), False: Bitset()}
+        # (category_id or None for all, is_active, stock status) -> products
+        self.stock_tally = Counter()
+        # Slots added out of (created_at, id) order; renumbered on the next read
+        self.unordered = False
+
+    def rebuild(self):
+        with self._lock:
+            super().rebuild()
+            # Product ids are read in id order, which is almost always creation order
+            self._ensure_ordered()
+
+    def add_row(self, product_id, category_id, is_active, price, stock_quantity, created_at, updated_at):
+        # Saved instances keep whatever was assigned, e.g. price='9.99'
+        price = Decimal(str(price))
+        stock_quantity = int(stock_quantity)
+        slot = self.slot_of.get(product_id)
+        if slot is None:
+            slot = len(self.slot_ids)
+            order = (created_at, product_id)
+            if self.slot_order and order < self.slot_order[-1]:
+                self.unordered = True
+            self.slot_of[product_id] = slot
+            self.slot_ids.append(product_id)
+            self.slot_order.append(order)
+            self.slot_prices.append(price)
+        else:
+            self.slot_prices[slot] = price
+        self.rows[product_id] = (category_id, bool(is_active), price, stock_quantity)
+        self._set_bits(slot, category_id, bool(is_active), price, stock_quantity)
+
+    def remove_row(self, product_id):
+        # The slot is kept so a product that is updated keeps its position
+        category_id, is_active, price, stock_quantity = self.rows.pop(product_id)
+        slot = self.slot_of[product_id]
+        self.live.discard(slot)
+        self.by_category[category_id].discard(slot)
+        if not self.by_category[category_id]:
+            del self.by_category[category_id]
+        self.by_stock[stock_status(stock_quantity)].discard(slot)
+        self.by_price[price_bucket(price)].discard(slot)
+        self.by_active[is_active].discard(slot)
+        self._tally(category_id, is_active, stock_quantity, -1)
+
+    def _set_bits(self, slot, category_id, is_active, price, stock_quantity):
+        self.live.add(slot)
+        self.by_category.setdefault(category_id, Bitset()).add(slot)
+        self.by_stock[stock_status(stock_quantity)].add(slot)
+        self.by_price[price_bucket(price)].add(slot)
+        self.by_active[is_active].add(slot)
+        self._tally(category_id, is_active, stock_quantity, 1)
+
+    def _tally(self, category_id, is_active, stock_quantity, step):
+        status = stock_status(stock_quantity)
+        self.stock_tally[category_id, is_active, status] += step
+        self.stock_tally[None, is_active, status] += step
+
+    def _ensure_ordered(self):
+        """Renumber once for however many rows arrived out of order since the last read"""
+        if self.unordered:
+            self._reslot()
+
+    def _reslot(self):
+        """Renumber every product in creation order, dropping the slots of deleted ones"""
+        orders = {product_id: self.slot_order[slot] for product_id, slot in self.slot_of.items()}
+        rows = self.rows
+        self.reset()
+        self.rows = rows
+        for product_id in sorted(rows, key=orders.__getitem__):
+            category_id, is_active, price, stock_quantity = rows[product_id]
+            slot = len(self.slot_ids)
+            self.slot_of[product_id] = slot
+            self.slot_ids.append(product_id)
+            self.slot_order.append(orders[product_id])
+            self.slot_prices.append(price)
+            self._set_bits(slot, category_id, is_active, price, stock_quantity)
+
+    # Querying
+
+    def select(self, params, active_only=True):
+        """
+        Return a ``BitmapSelection`` for the request's filters, newest first.
+
+        Returns None when ``params`` need the ORM (see ``parse_filters``).
+        """
+        filters = parse_filters(params)
+        if filters is None:
+            return None
+        self.ensure_ready()
+        with self._lock:
+            self._ensure_ordered()
+            result = self.live
+            if active_only:
+                result = result & self.by_active[True]
+            if 'is_active' in filters:
+                result = result & self.by_active[filters['is_active']]
+            if 'category' in filters:
+                result = result & self.by_category.get(filters['category'], Bitset())
+            if 'in_stock' in filters:
+                if filters['in_stock']:
+                    result = result - self.by_stock['out_of_stock']
+                else:
+                    result = result & self.by_stock['out_of_stock']
+            if 'min_price' in filters or 'max_price' in filters:
+                result = self._price_range(result, filters.get('min_price'), filters.get('max_price'))
+            return BitmapSelection(self, result)
+
+    def select_ids(self, product_ids):
+        """A ``BitmapSelection`` of the given products, e.g. search hits, for their facets"""
+        self.ensure_ready()
+        with self._lock:
+            self._ensure_ordered()
+            slot_of = self.slot_of
+            result = Bitset.from_positions(slot_of[product_id] for product_id in product_ids if product_id in slot_of)
+            return BitmapSelection(self, result & self.live)
+
+    def _price_range(self, result, min_price, max_price):
+        if max_price is not None and max_price < 0:
+            return Bitset()
+        low = price_bucket(min_price) if min_price is not None else 0
+        high = price_bucket(max_price) if max_price is not None else len(PRICE_EDGES) - 1
+        result = result & Bitset.union(self.by_price[low:high + 1])
+
+        # Buckets fully inside the range match as a whole; only the edge
+        # buckets need each product's exact price checked
+        edges = set()
+        if min_price is not None and min_price != PRICE_EDGES[low]:
+            edges.add(low)
+        if max_price is not None:
+            edges.add(high)
+        if not edges:
+            return result
+        rejected = Bitset()
+        for slot in (result & Bitset.union(self.by_price[bucket] for bucket in edges)).iter_descending():
+            price = self.slot_prices[slot]
+            if (min_price is not None and price < min_price) or (max_price is not None and price > max_price):
+                rejected.add(slot)
+        return result - rejected
+
+    def facets(self, bitset):
+        """The ``products.facets`` block for a selection, counted from the bitsets"""
+        with self._lock:
+            categories = []
+            for category_id, members in self.by_category.items():
+                count = len(bitset & members)
+                if count:
+                    categories.append({
+                        'id': category_id,
+                        'name': self.category_names.get(category_id),
+                        'count': count,
+                    })
+            price = []
+            for key, lower, upper, condition in price_buckets():
+                first = PRICE_EDGES.index(lower)
+                last = PRICE_EDGES.index(upper) if upper is not None else len(PRICE_EDGES)
+                members = Bitset.union(self.by_price[first:last])
+                price.append({'key': key, 'min': lower, 'max': upper, 'count': len(bitset & members)})
+            stock = [
+                {'key': key, 'count': len(bitset & self.by_stock[key])}
+                for key, condition in STOCK_STATUSES
+            ]
+        categories.sort(key=lambda item: (-item['count'], item['name']))
+        return {'categories': categories, 'price': price, 'stock_status': stock}
+
+    def stock_counts(self, category=None, active_only=True):
+        """
+        ``{stock status: products}``, for one category or the whole catalog.
+
+        Read from counters kept alongside the bitsets, so the cost does not
+        depend on how many products there are.
+        """
+        self.ensure_ready()
+        with self._lock:
+            counts = {}
+            for key, condition in STOCK_STATUSES:
+                counts[key] = self.stock_tally[category, True, key]
+                if not active_only:
+                    counts[key] += self.stock_tally[category, False, key]
+            return counts
+
+    def stats(self):
+        with self._lock:
+            return {
+                'products': len(self),
+                'slots': len(self.slot_ids),
+                'categories': len(self.by_category),
+                'chunks': sum(len(bitset.chunks) for bitset in self.by_category.values()),
+            }
+
+
+class BitmapSelection:
+    """
+    Lazy, newest-first sequence of the product ids in a bitset.
+
+    It supports ``len()`` and slicing, which is all ``Paginator`` needs, so a
+    page only resolves the slots it shows.
+    """
+
+    def __init__(self, index, bitset):
+        self.index = index
+        self.bitset = bitset
+        # Renumbering replaces the list, so this one stays valid for our slots
+        self.slot_ids = index.slot_ids
+
+    def __len__(self):
+        return len(self.bitset)
+
+    def __getitem__(self, item):
+        if not isinstance(item, slice):
+            raise TypeError('BitmapSelection only supports slicing')
+        start, stop, step = item.indices(len(self))
+        if step != 1 or stop <= start:
+            return []
+        product_ids = []
+        for slot in self.bitset.iter_descending(skip=start):
+            product_ids.append(self.slot_ids[slot])
+            if len(product_ids) == stop - start:
+                break
+        return product_ids
+
+    def __iter__(self):
+        return iter(self[:len(self)])
+
+    def facets(self):
+        index = self.index
+        with index._lock:
+            bitset = self.bitset
+            if index.slot_ids is not self.slot_ids:
+                # Renumbered since this selection was made: map its products to the new slots
+                slot_of = index.slot_of
+                product_ids = (self.slot_ids[slot] for slot in bitset.iter_descending())
+                bitset = Bitset.from_positions(slot_of[product_id] for product_id in product_ids if product_id in slot_of)
+            return index.facets(bitset)
+
+
+_index = register_index(BitmapIndex())
+
+
+def get_bitmap_index():
+    return _index
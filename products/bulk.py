@@ -0,0 +1,259 @@
+"""
+Batch product writes for ``POST`` / ``PATCH /api/products/bulk/``.
+
+A batch is validated item by item with ``ProductCreateUpdateSerializer``,
+but the queries the serializers would run per item are done once for the
+whole batch: categories are loaded with one ``in_bulk``, products to update
+with another, and unique slugs are allocated from the existing slugs that
+could collide (at most two queries) instead of one existence check per row.
+Valid items are then written with ``bulk_create`` / ``bulk_update`` in a
+single transaction, and ``products_bulk_updated`` is sent because neither
+fires ``post_save``. Invalid items are reported and not written.
+
+Updates write only the fields each item sets (one ``bulk_update`` per
+distinct set of fields), so an item that changes the price does not write
+back the stock it loaded over a concurrent ``reserve()`` or stock
+adjustment. Slugs taken by a concurrent create between allocation and
+insert are allocated again.
+"""
+import re
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.text import slugify
+from rest_framework import serializers
+
+from categories.models import Category
+from . import sharded_stock
+from .models import Product, stock_bucket_for
+from .rollups import product_state
+from .serializers import ProductCreateUpdateSerializer
+from .signals import products_bulk_updated
+
+DEFAULT_MAX_ITEMS = 1000
+WRITE_BATCH_SIZE = 500
+# Slug allocations tried before a batch is reported as conflicting
+SLUG_ATTEMPTS = 3
+
+CREATED, UPDATED, ERROR = 'created', 'updated', 'error'
+
+
+def bulk_max_items():
+    return getattr(settings, 'PRODUCT_BULK_MAX_ITEMS', DEFAULT_MAX_ITEMS)
+
+
+class PreloadedCategoryField(serializers.PrimaryKeyRelatedField):
+    """Resolves category ids from the ``categories`` dict in the serializer context"""
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            pk = int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        category = self.context['categories'].get(pk)
+        if category is None:
+            self.fail('does_not_exist', pk_value=data)
+        return category
+
+
+class BulkProductItemSerializer(ProductCreateUpdateSerializer):
+    category = PreloadedCategoryField(queryset=Category.objects.all())
+
+
+def category_ids(items):
+    ids = set()
+    for item in items:
+        if isinstance(item, dict):
+            try:
+                ids.add(int(item.get('category')))
+            except (TypeError, ValueError):
+                pass
+    return ids
+
+
+class SlugAllocator:
+    """
+    Hands out unique product slugs for a batch of names.
+
+    Mirrors ``Product.save()`` (``slugify(name)``), adding ``-2``, ``-3`` ...
+    when the slug is taken or repeated within the batch.
+    """
+    max_length = Product._meta.get_field('slug').max_length
+
+    def __init__(self, names):
+        bases = {self.base(name) for name in names}
+        self.taken = set(Product.objects.filter(slug__in=bases).order_by().values_list('slug', flat=True))
+        # Suffixed variants only matter for slugs that already collide
+        colliding = [base for base in bases if base in self.taken]
+        if colliding:
+            condition = Q()
+            for base in colliding:
+                condition |= Q(slug__startswith=f'{base}-')
+            suffixed = Product.objects.filter(condition).order_by().values_list('slug', flat=True)
+            self.taken.update(slug for slug in suffixed if re.search(r'-\d+$', slug))
+        self.next_suffix = {}
+
+    def base(self, name):
+        return slugify(name)[:self.max_length] or 'product'
+
+    def allocate(self, name):
+        base = self.base(name)
+        slug = base
+        suffix = self.next_suffix.get(base, 2)
+        while slug in self.taken:
+            tail = f'-{suffix}'
+            slug = f'{base[:self.max_length - len(tail)]}{tail}'
+            suffix += 1
+        self.next_suffix[base] = suffix
+        self.taken.add(slug)
+        return slug
+
+
+class BulkResult:
+    def __init__(self, size):
+        self.items = [None] * size
+
+    def error(self, position, errors):
+        self.items[position] = {'index': position, 'status': ERROR, 'errors': errors}
+
+    def success(self, position, outcome, product):
+        self.items[position] = {'index': position, 'status': outcome, 'id': product.pk, 'slug': product.slug}
+
+    def count(self, outcome):
+        return sum(1 for item in self.items if item['status'] == outcome)
+
+    def as_data(self):
+        return {
+            'created': self.count(CREATED),
+            'updated': self.count(UPDATED),
+            'errors': self.count(ERROR),
+            'results': self.items,
+        }
+
+
+def validate_items(items, context, instances=None, errors=None):
+    """
+    Validate every item; return ``(position, validated_data, instance)`` for
+    the valid ones and a ``BulkResult`` holding the errors.
+
+    With ``instances`` (position -> product) the items are partial updates and
+    positions without an instance are reported as not found. ``errors`` holds
+    positions already rejected by the caller.
+    """
+    errors = errors or {}
+    valid = []
+    result = BulkResult(len(items))
+    for position, item in enumerate(items):
+        if position in errors:
+            result.error(position, errors[position])
+            continue
+        instance = None
+        if instances is not None:
+            instance = instances.get(position)
+            if instance is None:
+                result.error(position, {'slug': ['Not found.']})
+                continue
+        serializer = BulkProductItemSerializer(
+            instance, data=item, partial=instance is not None, context=context
+        )
+        if serializer.is_valid():
+            valid.append((position, serializer.validated_data, instance))
+        else:
+            result.error(position, serializer.errors)
+    return valid, result
+
+
+def bulk_create_products(items, user, context):
+    """Create products from a list of item dicts; return a ``BulkResult``"""
+    context = {**context, 'categories': Category.objects.order_by().in_bulk(category_ids(items))}
+    valid, result = validate_items(items, context)
+
+    for attempt in range(SLUG_ATTEMPTS):
+        slugs = SlugAllocator([data['name'] for position, data, instance in valid])
+        products = [
+            Product(created_by=user, slug=slugs.allocate(data['name']),
+                    stock_bucket=stock_bucket_for(data['stock_quantity']), **data)
+            for position, data, instance in valid
+        ]
+        try:
+            with transaction.atomic():
+                Product.objects.bulk_create(products, batch_size=WRITE_BATCH_SIZE)
+                if any(product.pk is None for product in products):
+                    # MySQL does not return the ids of bulk inserted rows
+                    ids = dict(Product.objects.filter(slug__in=[p.slug for p in products]).values_list('slug', 'id'))
+                    for product in products:
+                        product.pk = ids[product.slug]
+            break
+        except IntegrityError:
+            # A concurrent create took one of the slugs after they were read
+            continue
+    else:
+        for position, data, instance in valid:
+            result.error(position, {'slug': ['Conflicting concurrent write; retry the request.']})
+        return result
+    if products:
+        products_bulk_updated.send(
+            sender=Product,
+            product_ids=[product.pk for product in products],
+            rollup_states={product.pk: (None, product_state(product)) for product in products},
+        )
+
+    for (position, data, instance), product in zip(valid, products):
+        result.success(position, CREATED, product)
+    return result
+
+
+def bulk_update_products(items, context):
+    """Partially update products identified by ``slug`` in each item; return a ``BulkResult``"""
+    context = {**context, 'categories': Category.objects.order_by().in_bulk(category_ids(items))}
+    slugs = [item.get('slug') if isinstance(item, dict) else None for item in items]
+    existing = Product.objects.in_bulk([slug for slug in slugs if isinstance(slug, str)], field_name='slug')
+
+    instances = {}
+    seen = set()
+    errors = {}
+    for position, slug in enumerate(slugs):
+        if not isinstance(slug, str) or not slug:
+            errors[position] = {'slug': ['This field is required.']}
+        elif slug in seen:
+            errors[position] = {'slug': ['Duplicate item for this product in the batch.']}
+        elif slug in existing:
+            instances[position] = existing[slug]
+        seen.add(slug)
+
+    valid, result = validate_items(items, context, instances, errors)
+
+    now = timezone.now()
+    products = []
+    # Field set -> the products whose items set exactly those fields
+    groups = {}
+    for position, data, product in valid:
+        for name, value in data.items():
+            setattr(product, name, value)
+        product.updated_at = now
+        fields = {'updated_at', *data}
+        if 'stock_quantity' in data:
+            product.stock_bucket = stock_bucket_for(data['stock_quantity'])
+            fields.add('stock_bucket')
+        groups.setdefault(frozenset(fields), []).append(product)
+        products.append(product)
+    with transaction.atomic():
+        for fields, group in groups.items():
+            Product.objects.bulk_update(group, sorted(fields), batch_size=WRITE_BATCH_SIZE)
+        for position, data, product in valid:
+            if 'stock_quantity' in data and product.stock_shards:
+                sharded_stock.set_total(product.pk, data['stock_quantity'])
+    if products:
+        products_bulk_updated.send(
+            sender=Product,
+            product_ids=[product.pk for product in products],
+            rollup_states={product.pk: (product._rollup_state, product_state(product)) for product in products},
+        )
+
+    for position, data, product in valid:
+        result.success(position, UPDATED, product)
+    return result
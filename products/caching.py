@@ -0,0 +1,153 @@
+"""
+Response cache for anonymous reads of the product and category catalog.
+
+Cached entries hold the serialized ``response.data`` of a view, so a hit
+skips both the queries and the serializers and still renders in whatever
+format the client asked for. Each entry also keeps a digest of that data and
+the time it was built, which ``products.conditional`` turns into the
+response's ETag and Last-Modified without touching the database. Keys include a catalog *generation* number that
+every product or category write bumps (see the receivers in
+``products.models``), which invalidates all entries at once without having
+to know which keys a write affected; stale generations simply expire.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import defaultdict
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from ecommerce_api import metrics
+
+GENERATION_KEY = 'catalog:generation'
+
+# Seconds to keep each endpoint's responses; endpoints missing here are not cached
+DEFAULT_TTLS = {
+    'products.list': 60,
+    'products.detail': 300,
+    'categories.list': 300,
+    'categories.detail': 300,
+    'categories.products': 120,
+    'categories.popular': 600,
+}
+
+_stats = defaultdict(lambda: {'hits': 0, 'misses': 0})
+_stats_lock = threading.Lock()
+
+
+def get_cache():
+    return caches[getattr(settings, 'CATALOG_CACHE_ALIAS', 'default')]
+
+
+def endpoint_ttl(endpoint):
+    ttls = {**DEFAULT_TTLS, **getattr(settings, 'CATALOG_CACHE_TTLS', {})}
+    return ttls.get(endpoint, 0)
+
+
+def catalog_generation():
+    cache = get_cache()
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        # Evicted or never set: start from a value no older entry can carry
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+        generation = cache.get(GENERATION_KEY)
+    return generation
+
+
+def bump_catalog_generation():
+    """Invalidate every cached catalog response"""
+    cache = get_cache()
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.add(GENERATION_KEY, int(time.time() * 1000), timeout=None)
+
+
+def normalized_params(query_params):
+    """Sorted ``(name, value)`` pairs without empty values, so equivalent URLs share a key"""
+    return sorted(
+        (name, value)
+        for name in query_params
+        for value in query_params.getlist(name)
+        if value != ''
+    )
+
+
+def response_cache_key(endpoint, request, view_kwargs):
+    # The host is part of the key because paginated responses contain absolute links
+    parts = [
+        request.get_host(),
+        repr(sorted(view_kwargs.items())),
+        repr(normalized_params(request.query_params)),
+    ]
+    digest = hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+    return f'catalog-response:{catalog_generation()}:{endpoint}:{digest}'
+
+
+def caches_response(endpoint, request):
+    """Whether ``cached_catalog_response`` serves this request from the cache"""
+    return bool(endpoint_ttl(endpoint)) and request.method in ('GET', 'HEAD') and not request.user.is_authenticated
+
+
+def content_digest(data):
+    """Digest of a response's serialized data"""
+    return hashlib.sha1(json.dumps(data, default=str, separators=(',', ':')).encode('utf-8')).hexdigest()
+
+
+def record(endpoint, outcome):
+    with _stats_lock:
+        _stats[endpoint][outcome] += 1
+    metrics.inc('catalog_cache_requests_total', endpoint=endpoint, result=outcome)
+
+
+def response_cache_stats():
+    """Hit and miss counts per endpoint for this process"""
+    with _stats_lock:
+        return {endpoint: dict(counts) for endpoint, counts in _stats.items()}
+
+
+def reset_response_cache_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def cached_catalog_response(endpoint):
+    """
+    Cache a viewset method's response for anonymous GET requests.
+
+    Only successful responses are stored, for ``endpoint_ttl(endpoint)``
+    seconds. Responses carry ``X-Cache: HIT`` or ``MISS``, and successful
+    ones a ``catalog_version`` attribute: the ``(content digest, built at)``
+    of their entry.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if not caches_response(endpoint, request):
+                return view_method(self, request, *args, **kwargs)
+
+            cache = get_cache()
+            key = response_cache_key(endpoint, request, kwargs)
+            entry = cache.get(key)
+            if entry is not None:
+                record(endpoint, 'hits')
+                response = Response(entry['data'], status=status.HTTP_200_OK)
+                response.catalog_version = (entry['digest'], entry['built_at'])
+                response['X-Cache'] = 'HIT'
+                return response
+
+            record(endpoint, 'misses')
+            response = view_method(self, request, *args, **kwargs)
+            if response.status_code == status.HTTP_200_OK:
+                entry = {'data': response.data, 'digest': content_digest(response.data), 'built_at': int(time.time())}
+                cache.set(key, entry, endpoint_ttl(endpoint))
+                response.catalog_version = (entry['digest'], entry['built_at'])
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,181 @@
+"""
+Compiled serializers for read-only list endpoints.
+
+``CompiledListSerializer`` inspects a DRF serializer once and turns it into a
+plan of ``(output key, values() column, converter)`` steps. Lists are then
+built from ``QuerySet.values()`` rows, skipping model instantiation, DRF's
+per-field ``get_attribute`` machinery and per-row URL building, while using
+the serializer's own field converters so the output is identical.
+
+Only plain model fields are compiled automatically. Fields whose value does
+not come straight from a column have to be declared:
+
+``related_strings``
+    ``StringRelatedField``s mapped to the lookup their target's ``__str__``
+    returns, e.g. ``{'category': 'category__name'}``.
+``media_fields``
+    ``SerializerMethodField``s returning the absolute URL of a file field
+    of the same name, or None when it is empty.
+
+Anything else raises ``ImproperlyConfigured`` when the plan is compiled.
+"""
+import re
+import threading
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.files.storage import FileSystemStorage
+from django.utils.encoding import filepath_to_uri
+from rest_framework import serializers
+
+from ecommerce_api.timing import timed
+
+# File names that FileSystemStorage.url() joins onto base_url verbatim
+PLAIN_MEDIA_NAME_RE = re.compile(r"^(?!\.{1,2}(/|$))(?!.*/\.{1,2}(/|$))[\w\-. /()~!*']+$")
+
+COLUMN, RELATED_STRING, MEDIA = 'column', 'related_string', 'media'
+
+
+def fast_converter(field):
+    """The field's ``to_representation``, or a builtin that returns the same value"""
+    field_type = type(field)
+    if field_type is serializers.IntegerField:
+        return int
+    if field_type in (serializers.CharField, serializers.SlugField):
+        return str
+    if field_type is serializers.BooleanField:
+        return bool
+    if field_type is serializers.ReadOnlyField:
+        return None
+    return field.to_representation
+
+
+class CompiledListSerializer:
+    """Serialize ``values()`` rows exactly like ``serializer_class(many=True)``"""
+
+    def __init__(self, serializer_class, related_strings=None, media_fields=()):
+        self.serializer_class = serializer_class
+        self.model = serializer_class.Meta.model
+        self.related_strings = dict(related_strings or {})
+        self.media_fields = tuple(media_fields)
+        self._plan = None
+        self._lock = threading.Lock()
+
+    @property
+    def plan(self):
+        if self._plan is None:
+            with self._lock:
+                if self._plan is None:
+                    self._plan = self.compile()
+        return self._plan
+
+    def steps(self, fields=None):
+        if fields is None:
+            return self.plan
+        return [step for step in self.plan if step[0] in fields]
+
+    def columns(self, fields=None, extra=()):
+        columns = []
+        for name, column, kind, converter in self.steps(fields):
+            if column not in columns:
+                columns.append(column)
+        for column in ('id',) + tuple(extra):
+            if column not in columns:
+                columns.append(column)
+        return columns
+
+    def compile(self):
+        plan = []
+        for name, field in self.serializer_class(context={}).fields.items():
+            if field.write_only:
+                continue
+            if name in self.related_strings:
+                if not isinstance(field, serializers.StringRelatedField):
+                    raise ImproperlyConfigured(f'{name} is not a StringRelatedField')
+                plan.append((name, self.related_strings[name], RELATED_STRING, str))
+            elif name in self.media_fields:
+                model_field = self._model_field(name)
+                plan.append((name, model_field.attname, MEDIA, model_field.storage))
+            elif isinstance(field, (serializers.SerializerMethodField, serializers.RelatedField,
+                                    serializers.ManyRelatedField, serializers.BaseSerializer)):
+                raise ImproperlyConfigured(
+                    f'{self.serializer_class.__name__}.{name} cannot be compiled; '
+                    f'declare it in related_strings or media_fields'
+                )
+            else:
+                model_field = self._model_field(field.source)
+                if model_field.is_relation:
+                    raise ImproperlyConfigured(f'{self.serializer_class.__name__}.{name} is a relation')
+                plan.append((name, model_field.attname, COLUMN, fast_converter(field)))
+        return plan
+
+    def _model_field(self, source):
+        try:
+            return self.model._meta.get_field(source)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(
+                f'{self.serializer_class.__name__} source {source!r} is not a field of {self.model.__name__}'
+            )
+
+    def values(self, queryset, fields=None, extra=()):
+        """
+        Narrow a queryset to the columns the plan reads.
+
+        ``fields`` limits the output to a sparse fieldset; ``extra`` adds
+        columns the caller needs besides the output, e.g. a cursor position.
+        """
+        return queryset.values(*self.columns(fields, extra))
+
+    def render(self, rows, request=None, fields=None):
+        """Build the output dicts for ``values()`` rows, in order"""
+        steps = []
+        for name, column, kind, converter in self.steps(fields):
+            if kind == MEDIA:
+                converter = media_url_builder(converter, request)
+            steps.append((name, column, kind, converter))
+
+        data = []
+        with timed('serialize'):
+            for row in rows:
+                item = {}
+                for name, column, kind, converter in steps:
+                    value = row[column]
+                    if kind == MEDIA:
+                        item[name] = converter(value) if value else None
+                    elif value is None or converter is None:
+                        item[name] = value
+                    else:
+                        item[name] = converter(value)
+                data.append(item)
+        return data
+
+
+def media_url_builder(storage, request):
+    """
+    Return a function turning a stored file name into what ``get_image`` returns.
+
+    For the file system storage the absolute base URL is built once per
+    request and names are appended to it; anything unusual goes through
+    ``storage.url()`` and ``request.build_absolute_uri()`` like the serializer.
+    """
+    if request is None:
+        return storage.url
+
+    def exact(name):
+        return request.build_absolute_uri(storage.url(name))
+
+    base_url = getattr(storage, 'base_url', None) if isinstance(storage, FileSystemStorage) else None
+    if not base_url or not base_url.startswith('/') or base_url.startswith('//') or not base_url.endswith('/'):
+        return exact
+    prefix = request.build_absolute_uri(base_url)
+
+    def fast(name):
+        if PLAIN_MEDIA_NAME_RE.match(name):
+            return prefix + filepath_to_uri(name).lstrip('/')
+        return exact(name)
+    return fast
+
+
+def rows_in_order(rows, product_ids):
+    """Order ``values()`` rows like ``product_ids``, dropping ids without a row"""
+    by_id = {row['id']: row for row in rows}
+    return [by_id[product_id] for product_id in product_ids if product_id in by_id]
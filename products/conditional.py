@@ -0,0 +1,127 @@
+"""
+Conditional GET (ETag / Last-Modified / 304) for catalog endpoints.
+
+Anonymous requests to endpoints with a response cache take their validators
+from the cached entry (see ``products.caching``): the ETag from a digest of
+its data and Last-Modified from when it was built. Revalidating against a
+cache hit runs no queries at all, and a miss needs none beyond building the
+response.
+
+Other requests (authenticated users, uncached endpoints) derive them from a
+fingerprint of the rows the response is built from, ``MAX(updated_at)`` and
+``COUNT(*)`` of the products and of the categories involved, so revalidating
+an unchanged list costs one or two aggregate queries and no serialization.
+Product and category soft deletes go through ``save()`` and bump
+``updated_at``; hard deletes change the counts, which only the ETag carries.
+"""
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date
+from rest_framework import status
+
+from .caching import caches_response, normalized_params
+
+# max-age granted to anonymous clients and shared caches, per endpoint
+DEFAULT_MAX_AGES = {
+    'products.list': 30,
+    'products.detail': 60,
+    'categories.list': 300,
+    'categories.detail': 300,
+    'categories.products': 60,
+    'categories.popular': 600,
+}
+
+
+def endpoint_max_age(endpoint):
+    max_ages = {**DEFAULT_MAX_AGES, **getattr(settings, 'CATALOG_HTTP_MAX_AGES', {})}
+    return max_ages.get(endpoint, 0)
+
+
+def queryset_fingerprint(queryset):
+    """``(MAX(updated_at), COUNT(*))`` of a queryset, ignoring its ordering"""
+    row = queryset.order_by().aggregate(last_modified=Max('updated_at'), count=Count('id'))
+    return row['last_modified'], row['count']
+
+
+def response_etag(endpoint, request, view_kwargs, version):
+    """A weak ETag for this request's representation of ``version`` of the content"""
+    renderer = getattr(request, 'accepted_renderer', None)
+    parts = [
+        endpoint,
+        request.get_host(),
+        repr(sorted(view_kwargs.items())),
+        repr(normalized_params(request.query_params)),
+        str(request.user.is_authenticated),
+        getattr(renderer, 'format', ''),
+        version,
+    ]
+    digest = hashlib.sha1('\n'.join(parts).encode('utf-8')).hexdigest()
+    return f'W/"{digest[:32]}"'
+
+
+def response_validators(endpoint, request, view_kwargs, querysets):
+    """Return the ``(etag, last_modified)`` of a response built from ``querysets``"""
+    fingerprints = [queryset_fingerprint(queryset) for queryset in querysets]
+    timestamps = [last_modified for last_modified, count in fingerprints if last_modified]
+    last_modified = int(max(timestamps).timestamp()) if timestamps else None
+    version = repr([(last.isoformat() if last else None, count) for last, count in fingerprints])
+    return response_etag(endpoint, request, view_kwargs, version), last_modified
+
+
+def patch_catalog_headers(response, endpoint, request, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    if request.user.is_authenticated:
+        # Authenticated users also see inactive rows: never share, always revalidate
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=endpoint_max_age(endpoint))
+    patch_vary_headers(response, ['Accept', 'Authorization', 'Cookie'])
+
+
+def conditional_catalog_response(endpoint):
+    """
+    Answer ``If-None-Match`` / ``If-Modified-Since`` for a viewset method.
+
+    Put it above ``cached_catalog_response``. When the response cache serves
+    the request, validators come from its entry; otherwise the viewset's
+    ``conditional_querysets(**kwargs)`` returns the querysets the response is
+    built from, or None to skip validation (e.g. for a 404). Successful
+    responses and 304s get ``ETag``, ``Last-Modified`` and the endpoint's
+    ``Cache-Control`` policy.
+    """
+    def decorator(view_method):
+        @wraps(view_method)
+        def wrapper(self, request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view_method(self, request, *args, **kwargs)
+            if caches_response(endpoint, request):
+                response = view_method(self, request, *args, **kwargs)
+                version = getattr(response, 'catalog_version', None)
+                if response.status_code != status.HTTP_200_OK or version is None:
+                    return response
+                digest, last_modified = version
+                etag = response_etag(endpoint, request, kwargs, digest)
+                response = get_conditional_response(request, etag=etag, last_modified=last_modified) or response
+                patch_catalog_headers(response, endpoint, request, etag, last_modified)
+                return response
+
+            querysets = self.conditional_querysets(**kwargs)
+            if querysets is None:
+                return view_method(self, request, *args, **kwargs)
+
+            etag, last_modified = response_validators(endpoint, request, kwargs, querysets)
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is None:
+                response = view_method(self, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+            patch_catalog_headers(response, endpoint, request, etag, last_modified)
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,84 @@
+"""
+Facet counts (category, price range, stock status) for product result sets.
+
+All three facets come out of one ``GROUP BY category`` query with conditional
+counts for each price bucket and stock status, instead of one ``COUNT`` query
+per facet value. Results the bitmap index can describe (filtered lists and
+search hits) are counted from its bitsets instead; see ``products.bitmaps``.
+"""
+from django.db.models import Count, Q
+
+from .models import IN_STOCK, LOW_STOCK, OUT_OF_STOCK
+
+# Upper bounds of the price buckets; the last bucket is open ended
+PRICE_BUCKETS = (25, 50, 100, 250, 500)
+
+# Keyed by Product.stock_bucket, which is kept in step with stock_quantity
+STOCK_STATUSES = (
+    (IN_STOCK, Q(stock_bucket=IN_STOCK)),
+    (LOW_STOCK, Q(stock_bucket=LOW_STOCK)),
+    (OUT_OF_STOCK, Q(stock_bucket=OUT_OF_STOCK)),
+)
+
+
+def wants_facets(request):
+    """Return True when the client asked for a facets block with ``?facets=true``"""
+    return request.query_params.get('facets', '').lower() in ('1', 'true', 'yes')
+
+
+def price_buckets():
+    """``(key, min, max, condition)`` for every price bucket"""
+    buckets = []
+    lower = 0
+    for upper in PRICE_BUCKETS:
+        buckets.append((f'{lower}-{upper}', lower, upper, Q(price__gte=lower, price__lt=upper)))
+        lower = upper
+    buckets.append((f'{lower}+', lower, None, Q(price__gte=lower)))
+    return buckets
+
+
+def facet_rows(queryset):
+    """Run the single aggregate query; one row per category"""
+    aggregates = {'total': Count('id')}
+    for position, (key, lower, upper, condition) in enumerate(price_buckets()):
+        aggregates[f'price_{position}'] = Count('id', filter=condition)
+    for key, condition in STOCK_STATUSES:
+        aggregates[key] = Count('id', filter=condition)
+    # order_by() so the list ordering does not leak into the GROUP BY
+    return queryset.order_by().values('category_id', 'category__name').annotate(**aggregates)
+
+
+def compute_facets(queryset):
+    """Return the facets block for every product in ``queryset``"""
+    return build_facets(facet_rows(queryset))
+
+
+def build_facets(rows):
+    categories = {}
+    buckets = price_buckets()
+    price_counts = [0] * len(buckets)
+    stock_counts = {key: 0 for key, condition in STOCK_STATUSES}
+
+    for row in rows:
+        category = categories.setdefault(row['category_id'], {
+            'id': row['category_id'],
+            'name': row['category__name'],
+            'count': 0,
+        })
+        category['count'] += row['total']
+        for position in range(len(buckets)):
+            price_counts[position] += row[f'price_{position}']
+        for key in stock_counts:
+            stock_counts[key] += row[key]
+
+    return {
+        'categories': sorted(categories.values(), key=lambda item: (-item['count'], item['name'])),
+        'price': [
+            {'key': key, 'min': lower, 'max': upper, 'count': price_counts[position]}
+            for position, (key, lower, upper, condition) in enumerate(buckets)
+        ],
+        'stock_status': [
+            {'key': key, 'count': stock_counts[key]}
+            for key, condition in STOCK_STATUSES
+        ],
+    }
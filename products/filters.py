@@ -1,5 +1,5 @@
 import django_filters
-from .models import Product
+from .models import STOCK_BUCKETS, Product
 
 
 class ProductFilter(django_filters.FilterSet):
@@ -12,6 +12,7 @@ class ProductFilter(django_filters.FilterSet):
     min_stock = django_filters.NumberFilter(field_name='stock_quantity', lookup_expr='gte')
     max_stock = django_filters.NumberFilter(field_name='stock_quantity', lookup_expr='lte')
     in_stock = django_filters.BooleanFilter(method='filter_in_stock')
+    stock_status = django_filters.ChoiceFilter(field_name='stock_bucket', choices=STOCK_BUCKETS)
 
     created_after = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
     created_before = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lte')
@@ -0,0 +1,306 @@
+"""
+Shared plumbing for the in-process catalog indexes (search, autocomplete, ...).
+
+Every worker keeps its own copy of each index. An index is built lazily on
+first use (or loaded from a snapshot), kept current by the product/category
+signal receivers in ``products.models``, and periodically catches up with
+rows written by other processes through ``updated_at``.
+
+Hard deletes leave no trace in ``updated_at``: a catch-up compares the
+table's ``COUNT``/``MAX(id)`` with the index and only diffs the ids when
+they disagree. Catch-ups after the first build run on a background thread,
+so searches keep reading the current index meanwhile, and the lock readers
+wait on is only held while changes are applied.
+"""
+import logging
+import os
+import pickle
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Count, Max
+
+from .utils import iter_keyset
+
+logger = logging.getLogger(__name__)
+
+_indexes = []
+
+
+def register_index(index):
+    _indexes.append(index)
+    return index
+
+
+def catalog_indexes():
+    """Every registered index, for the signal receivers to keep current"""
+    return list(_indexes)
+
+
+def refresh_interval():
+    return getattr(settings, 'CATALOG_INDEX_REFRESH_SECONDS', 30)
+
+
+def _later(current, value):
+    if value is None:
+        return current
+    if current is None or value > current:
+        return value
+    return current
+
+
+class CatalogIndex:
+    """
+    Base class for an index over product rows.
+
+    Subclasses declare the ``product_fields`` they need (starting with
+    ``'id'``, containing ``'category_id'`` and ending with ``'updated_at'``)
+    and implement ``reset``, ``add_row`` and ``remove_row``. The base class
+    tracks which products belong to which category, category names and the
+    ``updated_at`` watermark used to catch up.
+    """
+    label = 'catalog index'
+    product_fields = ('id', 'category_id', 'updated_at')
+    snapshot_version = 1
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._refreshing = False
+        self._category_position = self.product_fields.index('category_id')
+        self.clear()
+
+    def __len__(self):
+        return len(self.doc_category)
+
+    def clear(self):
+        with self._lock:
+            self.doc_category = {}
+            self.category_docs = defaultdict(set)
+            self.category_names = {}
+            self.watermark = None
+            self.category_watermark = None
+            self.built = False
+            self.checked_at = 0.0
+            self.reset()
+
+    # Hooks for subclasses
+
+    def reset(self):
+        """Drop all index structures"""
+
+    def add_row(self, *row):
+        """Index one product row; the product is known not to be indexed"""
+        raise NotImplementedError
+
+    def remove_row(self, product_id):
+        """Remove one indexed product"""
+        raise NotImplementedError
+
+    def category_renamed(self, category_id, old_name, new_name):
+        """Called before the products of a renamed category are re-read"""
+
+    def snapshot_path(self):
+        return None
+
+    def snapshot_state(self):
+        return {}
+
+    def restore_state(self, state):
+        pass
+
+    # Building and refreshing
+
+    def ensure_ready(self):
+        """
+        Build or load the index on first use; afterwards start a background
+        catch-up when the last one is older than the refresh interval.
+        """
+        with self._lock:
+            if not self.built:
+                if self.load_snapshot():
+                    self.catch_up()
+                else:
+                    self.rebuild()
+                return
+            if self._refreshing or time.monotonic() - self.checked_at <= refresh_interval():
+                return
+            self._refreshing = True
+        threading.Thread(target=self._refresh, name=f'{self.label} refresh', daemon=True).start()
+
+    def _refresh(self):
+        try:
+            self.catch_up()
+        except Exception:
+            logger.exception('Could not catch up %s', self.label)
+        finally:
+            # Retried after the next interval either way
+            self.checked_at = time.monotonic()
+            self._refreshing = False
+            connections.close_all()
+
+    def rebuild(self):
+        """Re-read every product and category from the database"""
+        from categories.models import Category
+        from products.models import Product
+
+        started = time.perf_counter()
+        with self._lock:
+            self.clear()
+            for category_id, name, updated_at in Category.objects.values_list('id', 'name', 'updated_at'):
+                self._set_category_name(category_id, name)
+                self.category_watermark = _later(self.category_watermark, updated_at)
+            for row in iter_keyset(Product.objects.all(), self.product_fields):
+                self._add(row)
+            self.built = True
+            self.checked_at = time.monotonic()
+        logger.info('Built %s over %d products in %.2fs',
+                    self.label, len(self), time.perf_counter() - started)
+
+    def catch_up(self):
+        """Pick up product and category changes made by other processes"""
+        from categories.models import Category
+        from products.models import Product
+
+        with self._lock:
+            categories = Category.objects.all()
+            if self.category_watermark is not None:
+                categories = categories.filter(updated_at__gte=self.category_watermark)
+            for category_id, name, updated_at in categories.values_list('id', 'name', 'updated_at'):
+                self.category_watermark = _later(self.category_watermark, updated_at)
+                if self._set_category_name(category_id, name):
+                    self.reindex_ids(list(self.category_docs.get(category_id, ())))
+
+            products = Product.objects.all()
+            if self.watermark is not None:
+                products = products.filter(updated_at__gte=self.watermark)
+            for row in iter_keyset(products, self.product_fields):
+                self._add(row)
+
+        # Hard deletes leave no trace in updated_at. Unless rows were deleted (or
+        # committed outside the watermark scan) the table holds as many rows as
+        # the index and its newest id is indexed; only otherwise are the ids
+        # diffed, outside the lock readers wait on
+        stored = Product.objects.order_by().aggregate(count=Count('id'), last=Max('id'))
+        with self._lock:
+            consistent = stored['count'] == len(self.doc_category) and (
+                stored['last'] is None or stored['last'] in self.doc_category
+            )
+        if not consistent:
+            ids = {product_id for (product_id,) in iter_keyset(Product.objects.all(), ('id',))}
+            with self._lock:
+                # Deleted rows, and rows committed outside the watermark scan; re-read
+                # rather than dropped, in case a signal indexed them since the walk
+                self.reindex_ids(list(set(self.doc_category) ^ ids))
+        self.checked_at = time.monotonic()
+
+    # Incremental maintenance
+
+    def index_product(self, product):
+        """Add or refresh a single product from a saved model instance"""
+        with self._lock:
+            if not self.built:
+                return
+            category = product.category
+            self._set_category_name(category.id, category.name)
+            self._add(tuple(getattr(product, field) for field in self.product_fields))
+
+    def remove_product(self, product_id):
+        with self._lock:
+            self._discard(product_id)
+
+    def reindex_ids(self, product_ids):
+        """Re-read the given products from the database, dropping any that are gone"""
+        from products.models import Product
+
+        with self._lock:
+            if not self.built or not product_ids:
+                return
+            seen = set()
+            for start in range(0, len(product_ids), 1000):
+                chunk = product_ids[start:start + 1000]
+                for row in Product.objects.filter(id__in=chunk).values_list(*self.product_fields):
+                    self._add(row)
+                    seen.add(row[0])
+            for product_id in set(product_ids) - seen:
+                self._discard(product_id)
+
+    def rename_category(self, category_id, name):
+        with self._lock:
+            if self.built and self._set_category_name(category_id, name):
+                self.reindex_ids(list(self.category_docs.get(category_id, ())))
+
+    def _set_category_name(self, category_id, name):
+        old_name = self.category_names.get(category_id)
+        if old_name == name:
+            return False
+        self.category_renamed(category_id, old_name, name)
+        self.category_names[category_id] = name
+        return True
+
+    def _add(self, row):
+        product_id = row[0]
+        if product_id in self.doc_category:
+            self._discard(product_id)
+        category_id = row[self._category_position]
+        self.doc_category[product_id] = category_id
+        self.category_docs[category_id].add(product_id)
+        self.add_row(*row)
+        self.watermark = _later(self.watermark, row[-1])
+
+    def _discard(self, product_id):
+        category_id = self.doc_category.pop(product_id, None)
+        if category_id is None:
+            return
+        self.category_docs[category_id].discard(product_id)
+        self.remove_row(product_id)
+
+    # Snapshots
+
+    def save_snapshot(self, path=None):
+        path = path or self.snapshot_path()
+        if not path:
+            return None
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._lock:
+            state = self.snapshot_state()
+            state.update({
+                'version': self.snapshot_version,
+                'doc_category': self.doc_category,
+                'category_names': self.category_names,
+                'watermark': self.watermark,
+                'category_watermark': self.category_watermark,
+            })
+            tmp_path = f'{path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'wb') as handle:
+                pickle.dump(state, handle, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        return path
+
+    def load_snapshot(self, path=None):
+        """Load a snapshot written by ``save_snapshot``; returns False if there is none"""
+        path = path or self.snapshot_path()
+        if not path or not os.path.exists(path):
+            return False
+        try:
+            with open(path, 'rb') as handle:
+                state = pickle.load(handle)
+        except (OSError, pickle.UnpicklingError, EOFError) as exc:
+            logger.warning('Ignoring unreadable %s snapshot %s: %s', self.label, path, exc)
+            return False
+        if state.get('version') != self.snapshot_version:
+            return False
+
+        with self._lock:
+            self.clear()
+            self.doc_category = state['doc_category']
+            self.category_names = state['category_names']
+            self.watermark = state['watermark']
+            self.category_watermark = state['category_watermark']
+            for product_id, category_id in self.doc_category.items():
+                self.category_docs[category_id].add(product_id)
+            self.restore_state(state)
+            self.built = True
+        return True
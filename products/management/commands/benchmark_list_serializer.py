@@ -0,0 +1,67 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from products.models import Product
+from products.views import ProductViewSet
+
+
+class Command(BaseCommand):
+    help = 'Compare the DRF and compiled product list serializers on the current catalog'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rows',
+            type=int,
+            default=1000,
+            help='Number of products to serialize per run (default: 1000)'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Runs per serializer; the fastest run is reported (default: 5)'
+        )
+
+    def handle(self, *args, **options):
+        compiled = ProductViewSet.compiled_list_serializer
+        serializer_class = compiled.serializer_class
+        host = next((host.lstrip('.') for host in settings.ALLOWED_HOSTS if host != '*'), 'localhost')
+        request = Request(RequestFactory().get('/api/products/', HTTP_HOST=host))
+        queryset = Product.objects.select_related('category', 'created_by').order_by('-created_at', '-id')
+        queryset = queryset[:options['rows']]
+
+        def drf():
+            return serializer_class(list(queryset), many=True, context={'request': request}).data
+
+        def fast():
+            return compiled.render(list(compiled.values(queryset)), request)
+
+        renderer = JSONRenderer()
+        drf_bytes = renderer.render(drf())
+        fast_bytes = renderer.render(fast())
+        if drf_bytes != fast_bytes:
+            raise CommandError('Compiled serializer output differs from the DRF serializer')
+        rows = len(drf())
+        if not rows:
+            raise CommandError('No products to serialize; generate some data first')
+
+        drf_time = self.best_of(drf, options['repeat'])
+        fast_time = self.best_of(fast, options['repeat'])
+
+        self.stdout.write(f'Serialized {rows} products ({len(drf_bytes)} bytes of identical JSON)')
+        self.stdout.write(f'  DRF serializer:      {drf_time * 1000:8.1f} ms  ({drf_time / rows * 1e6:.1f} µs/row)')
+        self.stdout.write(f'  Compiled serializer: {fast_time * 1000:8.1f} ms  ({fast_time / rows * 1e6:.1f} µs/row)')
+        self.stdout.write(self.style.SUCCESS(f'✅ Compiled serializer is {drf_time / fast_time:.1f}x faster'))
+
+    def best_of(self, run, repeat):
+        timings = []
+        for _ in range(max(repeat, 1)):
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
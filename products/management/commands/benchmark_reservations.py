@@ -0,0 +1,125 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DatabaseError, connection
+from django.db.models import Sum
+
+from categories.models import Category
+from products import sharded_stock
+from products.models import Product, StockReservation
+from products.reservations import ReservationError, reserve
+
+
+class Command(BaseCommand):
+    help = 'Measure stock reservation throughput with many buyers competing for one product'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=16,
+            help='Concurrent buyers (default: 16)'
+        )
+        parser.add_argument(
+            '--attempts',
+            type=int,
+            default=200,
+            help='Reservations each buyer attempts (default: 200)'
+        )
+        parser.add_argument(
+            '--stock',
+            type=int,
+            default=1000,
+            help='Units of the contended product; set below threads x attempts to measure sell-outs (default: 1000)'
+        )
+        parser.add_argument(
+            '--quantity',
+            type=int,
+            default=1,
+            help='Units per reservation (default: 1)'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=0,
+            help='Split the product into this many sharded stock counters (default: 0, no sharding)'
+        )
+
+    def handle(self, *args, **options):
+        if connection.vendor == 'sqlite':
+            self.stdout.write(self.style.WARNING('SQLite serializes all writers; numbers will not reflect MySQL'))
+
+        user = User.objects.create_user(username=f'reservation-bench-{int(time.time() * 1000)}')
+        category = Category.objects.create(name=f'Reservation benchmark {user.username}')
+        product = Product.objects.create(
+            name=f'Flash sale item {user.username}', description='Reservation benchmark product',
+            price='1.00', category=category, stock_quantity=options['stock'], created_by=user
+        )
+        if options['shards']:
+            sharded_stock.enable(product, options['shards'])
+        try:
+            results = self.run(product, user, options)
+            self.report(product, options, *results)
+        finally:
+            category.delete()
+            user.delete()
+
+    def run(self, product, user, options):
+        latencies = []
+        counts = {'reserved': 0, 'sold_out': 0, 'errors': 0}
+        lock = threading.Lock()
+        start = threading.Barrier(options['threads'])
+
+        def buyer(position):
+            own_latencies, own_counts = [], {key: 0 for key in counts}
+            start.wait()
+            try:
+                for attempt in range(options['attempts']):
+                    began = time.perf_counter()
+                    try:
+                        reserve(product.pk, user, options['quantity'], session=f'bench-{position}')
+                        own_counts['reserved'] += 1
+                    except ReservationError:
+                        own_counts['sold_out'] += 1
+                    except DatabaseError:
+                        own_counts['errors'] += 1
+                    own_latencies.append(time.perf_counter() - began)
+            finally:
+                connection.close()
+            with lock:
+                latencies.extend(own_latencies)
+                for key, value in own_counts.items():
+                    counts[key] += value
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+            list(pool.map(buyer, range(options['threads'])))
+        return counts, latencies, time.perf_counter() - started
+
+    def report(self, product, options, counts, latencies, elapsed):
+        product.refresh_from_db()
+        held = StockReservation.objects.filter(product=product).aggregate(units=Sum('quantity'))['units'] or 0
+        attempts = sum(counts.values())
+        latencies.sort()
+
+        mode = f"{options['shards']} stock shards" if options['shards'] else 'one stock row'
+        self.stdout.write(
+            f"{options['threads']} buyers ({mode}) made {attempts} attempts in {elapsed:.2f}s "
+            f"({attempts / elapsed:.0f} attempts/s, {counts['reserved'] / elapsed:.0f} reservations/s)"
+        )
+        self.stdout.write(
+            f"  reserved: {counts['reserved']}  sold out: {counts['sold_out']}  database errors: {counts['errors']}"
+        )
+        self.stdout.write(
+            f"  latency p50 {statistics.median(latencies) * 1000:.1f} ms, "
+            f"p99 {latencies[int(len(latencies) * 0.99) - 1] * 1000:.1f} ms, max {latencies[-1] * 1000:.1f} ms"
+        )
+        self.stdout.write(f"  stock left: {product.stock_quantity}, units held: {held}")
+
+        if product.stock_quantity + held != options['stock'] or product.stock_quantity < 0:
+            raise CommandError('Stock and holds do not add up: units were oversold or lost')
+        self.stdout.write(self.style.SUCCESS('✅ No units oversold'))
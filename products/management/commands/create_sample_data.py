@@ -1,11 +1,8 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth.models import User
-from django.utils.text import slugify
 import random
 from decimal import Decimal
-from categories.models import Category
-from products.models import Product
-from accounts.models import UserProfile
+from ecommerce_api.seeding import Seeder
 
 
 class Command(BaseCommand):
@@ -14,13 +11,15 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write(self.style.SUCCESS('Creating sample data...'))
         
-        categories = self.create_categories()
-        users = self.create_users()
-        products = self.create_products(categories, users)
+        seeder = Seeder(log=self.stdout.write)
+        categories = self.create_categories(seeder)
+        users = self.create_users(seeder)
+        products = self.create_products(seeder, categories, users)
+        seeder.finish()
         
         self.display_summary(categories, users, products)
 
-    def create_categories(self):
+    def create_categories(self, seeder):
         """Create sample categories"""
         categories_data = [
             {'name': 'Electronics', 'description': 'Electronic devices and gadgets'},
@@ -30,23 +29,9 @@ class Command(BaseCommand):
             {'name': 'Home & Garden', 'description': 'Home improvement and gardening'},
             {'name': 'Beauty', 'description': 'Beauty and personal care products'},
         ]
+        return seeder.ensure_categories([(cat_data['name'], cat_data['description']) for cat_data in categories_data])
 
-        categories = []
-        for cat_data in categories_data:
-            category, created = Category.objects.get_or_create(
-                name=cat_data['name'],
-                defaults={
-                    'description': cat_data['description'],
-                    'slug': slugify(cat_data['name']),
-                    'is_active': True
-                }
-            )
-            categories.append(category)
-            if created:
-                self.stdout.write(f'Created category: {category.name}')
-        return categories
-
-    def create_users(self):
+    def create_users(self, seeder):
         """Create sample users"""
         users_data = [
             {'username': 'john_doe', 'email': 'john@example.com', 'first_name': 'John', 'last_name': 'Doe'},
@@ -54,40 +39,16 @@ class Command(BaseCommand):
             {'username': 'bob_wilson', 'email': 'bob@example.com', 'first_name': 'Bob', 'last_name': 'Wilson'},
             {'username': 'alice_brown', 'email': 'alice@example.com', 'first_name': 'Alice', 'last_name': 'Brown'},
         ]
-
-        users = []
-        for user_data in users_data:
-            user, created = User.objects.get_or_create(
-                username=user_data['username'],
-                defaults={
-                    'email': user_data['email'],
-                    'first_name': user_data['first_name'],
-                    'last_name': user_data['last_name'],
-                    'is_active': True
-                }
-            )
-            if created:
-                user.set_password('password123')
-                user.save()
-                # Create user profile only if it doesn't exist
-                UserProfile.objects.get_or_create(user=user)
-                self.stdout.write(f'Created user: {user.username}')
-            else:
-                # Get or create profile for existing user
-                UserProfile.objects.get_or_create(user=user)
-                self.stdout.write(f'User already exists: {user.username}')
-            users.append(user)
+        users = seeder.ensure_users(users_data, password='password123')
 
         # Add admin user if exists
-        try:
-            admin_user = User.objects.get(username='admin')
+        admin_user = User.objects.filter(username='admin').first()
+        if admin_user is not None:
             users.append(admin_user)
-        except User.DoesNotExist:
-            pass
             
         return users
 
-    def create_products(self, categories, users):
+    def create_products(self, seeder, categories, users):
         """Create sample products"""
         products_data = [
             {'name': 'iPhone 15 Pro', 'description': 'Latest Apple smartphone with advanced features', 'price': '999.99', 'stock': 50},
@@ -102,28 +63,17 @@ class Command(BaseCommand):
             {'name': 'Moisturizing Face Cream', 'description': 'Anti-aging face cream with natural ingredients', 'price': '34.99', 'stock': 80},
         ]
 
-        products = []
-        for i, prod_data in enumerate(products_data):
-            category = categories[i % len(categories)]
-            creator = random.choice(users)
-            
-            product, created = Product.objects.get_or_create(
-                name=prod_data['name'],
-                defaults={
-                    'description': prod_data['description'],
-                    'price': Decimal(prod_data['price']),
-                    'category': category,
-                    'stock_quantity': prod_data['stock'],
-                    'is_active': True,
-                    'created_by': creator,
-                    'slug': slugify(prod_data['name'])
-                }
-            )
-            products.append(product)
-            if created:
-                self.stdout.write(f'Created product: {product.name}')
-
-        return products
+        return seeder.ensure_products([
+            {
+                'name': prod_data['name'],
+                'description': prod_data['description'],
+                'price': Decimal(prod_data['price']),
+                'category': categories[i % len(categories)],
+                'stock_quantity': prod_data['stock'],
+                'created_by': random.choice(users),
+            }
+            for i, prod_data in enumerate(products_data)
+        ])
 
     def display_summary(self, categories, users, products):
         """Display summary of created data"""
@@ -0,0 +1,38 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.reservations import expire_stale_holds
+
+
+class Command(BaseCommand):
+    help = 'Expire stock reservations past their TTL and return the held units to stock'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Holds expired per transaction (default: STOCK_RESERVATION_SWEEP_BATCH_SIZE)'
+        )
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep sweeping until interrupted instead of running once'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=15,
+            help='Seconds between sweeps with --loop (default: 15)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            expired = expire_stale_holds(options['batch_size'])
+            elapsed = time.perf_counter() - started
+            if expired or not options['loop']:
+                self.stdout.write(f'Expired {expired} reservations in {elapsed:.2f}s')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
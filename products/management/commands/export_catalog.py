@@ -0,0 +1,127 @@
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from products.export import CHUNK_WRITERS, export_shard, pk_ranges
+from products.models import Product
+from products.utils import init_pool_worker
+
+MANIFEST_NAME = 'manifest.json'
+
+
+class Command(BaseCommand):
+    help = 'Dump the product catalog to sharded NDJSON/CSV files in parallel, with a manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--output',
+            help='Directory for the shards and manifest (default: var/exports/<timestamp>)'
+        )
+        parser.add_argument(
+            '--format',
+            choices=sorted(CHUNK_WRITERS),
+            default='ndjson',
+            help='Shard file format (default: ndjson)'
+        )
+        parser.add_argument(
+            '--gzip',
+            action='store_true',
+            help='Compress each shard with gzip'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Processes dumping shards concurrently; 1 runs in this process (default: CPU count)'
+        )
+        parser.add_argument(
+            '--shards',
+            type=int,
+            help='Number of primary-key ranges to split the table into (default: 4 per worker)'
+        )
+        parser.add_argument(
+            '--active-only',
+            action='store_true',
+            help='Only export active products'
+        )
+        parser.add_argument(
+            '--fields',
+            help='Comma-separated product fields to export (default: all list fields)'
+        )
+
+    def handle(self, *args, **options):
+        from products.views import ProductViewSet
+
+        workers = max(options['workers'], 1)
+        shards = options['shards'] or workers * 4
+        output_format = options['format']
+        fields = self.parse_fields(options['fields'], ProductViewSet.compiled_list_serializer)
+        output = options['output'] or os.path.join(
+            'var', 'exports', timezone.now().strftime('%Y%m%d-%H%M%S')
+        )
+        os.makedirs(output, exist_ok=True)
+
+        queryset = Product.objects.all()
+        if options['active_only']:
+            queryset = queryset.filter(is_active=True)
+        ranges = pk_ranges(queryset, shards)
+
+        extension = f".{output_format}{'.gz' if options['gzip'] else ''}"
+        tasks = [
+            (os.path.join(output, f'products-{position:05d}{extension}'), low, high, output_format,
+             options['gzip'], options['active_only'], fields)
+            for position, (low, high) in enumerate(ranges)
+        ]
+
+        self.stdout.write(f'Exporting {len(tasks)} shards with {workers} worker(s) to {output}')
+        started = time.perf_counter()
+        entries = self.run(tasks, workers)
+        elapsed = time.perf_counter() - started
+
+        rows = sum(entry['rows'] for entry in entries)
+        manifest = {
+            'created_at': timezone.now().isoformat(),
+            'format': output_format,
+            'compression': 'gzip' if options['gzip'] else None,
+            'fields': list(fields) if fields else None,
+            'active_only': options['active_only'],
+            'rows': rows,
+            'seconds': round(elapsed, 3),
+            'shards': sorted(entries, key=lambda entry: entry['min_id']),
+        }
+        with open(os.path.join(output, MANIFEST_NAME), 'w', encoding='utf-8') as handle:
+            json.dump(manifest, handle, indent=2)
+
+        rate = rows / elapsed if elapsed else 0
+        self.stdout.write(f'Wrote {rows} products in {elapsed:.2f}s ({rate:.0f} rows/s)')
+        self.stdout.write(self.style.SUCCESS(f'✅ Catalog exported to {output}'))
+
+    def parse_fields(self, value, compiled):
+        if not value:
+            return None
+        available = [step[0] for step in compiled.plan]
+        fields = [name.strip() for name in value.split(',') if name.strip()]
+        unknown = [name for name in fields if name not in available]
+        if unknown:
+            raise CommandError(f"Unknown field(s): {', '.join(unknown)}")
+        return tuple(name for name in available if name in fields)
+
+    def run(self, tasks, workers):
+        if workers == 1 or len(tasks) <= 1:
+            return [export_shard(*task) for task in tasks]
+
+        # Forked workers must not share the parent's database connections
+        connections.close_all()
+        entries = []
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_pool_worker) as pool:
+            futures = [pool.submit(export_shard, *task) for task in tasks]
+            for future in as_completed(futures):
+                entry = future.result()
+                entries.append(entry)
+                self.stdout.write(f"  {entry['file']}: {entry['rows']} rows in {entry['seconds']:.2f}s")
+        return entries
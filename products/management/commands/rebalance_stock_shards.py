@@ -0,0 +1,33 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.sharded_stock import rebalance
+
+
+class Command(BaseCommand):
+    help = 'Even out sharded stock counters and write their totals back to Product.stock_quantity'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help='Keep rebalancing until interrupted instead of running once'
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=30,
+            help='Seconds between runs with --loop (default: 30)'
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            totals = rebalance()
+            elapsed = time.perf_counter() - started
+            if totals or not options['loop']:
+                self.stdout.write(f'Rebalanced {len(totals)} sharded products in {elapsed:.2f}s')
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,39 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from products.search import get_search_index
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the product search index from the database and save a snapshot for workers to load'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--no-snapshot',
+            action='store_true',
+            help='Rebuild and report statistics without writing the snapshot file'
+        )
+        parser.add_argument(
+            '--path',
+            help='Write the snapshot to this path instead of SEARCH_INDEX_PATH'
+        )
+
+    def handle(self, *args, **options):
+        index = get_search_index()
+        started = time.perf_counter()
+        index.rebuild()
+        elapsed = time.perf_counter() - started
+        stats = index.stats()
+
+        self.stdout.write(
+            f"Indexed {stats['products']} products ({stats['terms']} terms, "
+            f"{stats['categories']} categories) in {elapsed:.2f}s"
+        )
+
+        if not options['no_snapshot']:
+            path = index.save_snapshot(options['path'])
+            if path:
+                self.stdout.write(f'Snapshot written to {path}')
+
+        self.stdout.write(self.style.SUCCESS('✅ Search index rebuilt successfully!'))
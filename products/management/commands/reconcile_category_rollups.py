@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand
+
+from categories.models import Category
+from products.models import CategoryRollup, Product
+from products.rollups import COUNT_FIELDS, count_products, recount
+
+
+class Command(BaseCommand):
+    help = 'Recount every category rollup from the products and repair the rows that drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report the categories whose counts are wrong'
+        )
+
+    def handle(self, *args, **options):
+        fresh = count_products(Product.objects.all())
+        stored = {row.pop('category_id'): row for row in CategoryRollup.objects.values('category_id', *COUNT_FIELDS)}
+        zero = dict.fromkeys(COUNT_FIELDS, 0)
+
+        drifted = []
+        for category_id, name in Category.objects.order_by('name').values_list('id', 'name'):
+            expected = fresh.get(category_id, zero)
+            if stored.get(category_id) != expected:
+                drifted.append(category_id)
+                self.stdout.write(f'  {name}: {stored.get(category_id)} -> {expected}')
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('✅ All category rollups are up to date'))
+        elif options['dry_run']:
+            self.stdout.write(f'{len(drifted)} category rollup(s) out of date')
+        else:
+            recount(drifted)
+            self.stdout.write(self.style.SUCCESS(f'✅ Repaired {len(drifted)} category rollup(s)'))
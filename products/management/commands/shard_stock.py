@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from products import sharded_stock
+from products.models import Product
+
+
+class Command(BaseCommand):
+    help = "Split a hot product's stock across sharded counters, or fold the shards back"
+
+    def add_arguments(self, parser):
+        parser.add_argument('slug', help='Slug of the product')
+        parser.add_argument(
+            '--shards',
+            type=int,
+            default=8,
+            help='Number of counters; 0 folds the stock back into the product row (default: 8)'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            product = Product.objects.get(slug=options['slug'])
+        except Product.DoesNotExist:
+            raise CommandError(f"Product '{options['slug']}' does not exist")
+        if options['shards'] < 0:
+            raise CommandError('--shards cannot be negative')
+
+        if options['shards']:
+            sharded_stock.enable(product, options['shards'])
+            message = f"Stock of '{product.name}' split across {options['shards']} shards"
+        else:
+            sharded_stock.disable(product)
+            message = f"Stock of '{product.name}' folded back into the product row"
+        product.refresh_from_db()
+        self.stdout.write(self.style.SUCCESS(f'✅ {message} ({product.stock_quantity} units)'))
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:28
+
+import django.core.validators
+import django.db.models.deletion
+import products.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('products', '0006_stockreservation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_shards',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='product',
+            name='stock_quantity',
+            field=products.models.StockQuantityField(validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.CreateModel(
+            name='StockShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('index', models.PositiveSmallIntegerField()),
+                ('quantity', models.PositiveIntegerField(default=0)),
+                ('product', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_shard_rows', to='products.product')),
+            ],
+            options={
+                'verbose_name': 'Stock Shard',
+                'verbose_name_plural': 'Stock Shards',
+                'constraints': [models.UniqueConstraint(fields=('product', 'index'), name='unique_stock_shard')],
+            },
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:33
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+# Matches products.models.LOW_STOCK_THRESHOLD at the time of this migration
+LOW_STOCK_THRESHOLD = 10
+
+
+def fill_stock_bucket(apps, schema_editor):
+    Product = apps.get_model('products', 'Product')
+    Product.objects.filter(stock_quantity=0).update(stock_bucket='out_of_stock')
+    Product.objects.filter(stock_quantity__gt=0, stock_quantity__lt=LOW_STOCK_THRESHOLD).update(stock_bucket='low_stock')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0002_alter_category_options'),
+        ('products', '0007_stock_shards'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='stock_bucket',
+            field=models.CharField(choices=[('in_stock', 'In stock'), ('low_stock', 'Low stock'), ('out_of_stock', 'Out of stock')], default='in_stock', editable=False, max_length=12),
+        ),
+        migrations.RunPython(fill_stock_bucket, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['stock_bucket', 'category', 'created_at'], name='product_stock_bucket'),
+        ),
+    ]
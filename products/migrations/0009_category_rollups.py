@@ -0,0 +1,55 @@
+# Generated by Django 5.2.4 on 2026-10-16 22:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def fill_category_rollups(apps, schema_editor):
+    Category = apps.get_model('categories', 'Category')
+    CategoryRollup = apps.get_model('products', 'CategoryRollup')
+    Product = apps.get_model('products', 'Product')
+    active = Q(is_active=True)
+    rows = Product.objects.order_by().values('category_id').annotate(
+        total_products=Count('id'),
+        active_products=Count('id', filter=active),
+        in_stock_products=Count('id', filter=active & ~Q(stock_bucket='out_of_stock')),
+        out_of_stock_products=Count('id', filter=active & Q(stock_bucket='out_of_stock')),
+    )
+    counts = {row.pop('category_id'): row for row in rows}
+    CategoryRollup.objects.bulk_create([
+        CategoryRollup(category_id=category_id, **counts.get(category_id, {}))
+        for category_id in Category.objects.values_list('id', flat=True)
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('categories', '0002_alter_category_options'),
+        ('products', '0008_stock_bucket'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryRollup',
+            fields=[
+                ('category', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rollup', serialize=False, to='categories.category')),
+                ('total_products', models.PositiveIntegerField(default=0)),
+                ('active_products', models.PositiveIntegerField(default=0)),
+                ('in_stock_products', models.PositiveIntegerField(default=0)),
+                ('out_of_stock_products', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'verbose_name': 'Category Rollup',
+                'verbose_name_plural': 'Category Rollups',
+            },
+        ),
+        migrations.RunPython(fill_category_rollups, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['category', 'is_active', 'stock_bucket'], name='product_category_rollup'),
+        ),
+    ]
@@ -1,9 +1,81 @@
 from django.db import models
+from django.db.models import Case, Value, When
+from django.db.models.lookups import LessThan, LessThanOrEqual
+from django.db.models.query_utils import DeferredAttribute
 from django.contrib.auth.models import User
 from django.utils.text import slugify
 from django.core.validators import MinValueValidator
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from decimal import Decimal
 from categories.models import Category
+from .signals import products_bulk_updated
+
+# In stock, but fewer than this many left: the low_stock feed and facet
+LOW_STOCK_THRESHOLD = 10
+
+OUT_OF_STOCK = 'out_of_stock'
+LOW_STOCK = 'low_stock'
+IN_STOCK = 'in_stock'
+STOCK_BUCKETS = (
+    (IN_STOCK, 'In stock'),
+    (LOW_STOCK, 'Low stock'),
+    (OUT_OF_STOCK, 'Out of stock'),
+)
+
+
+def stock_bucket_for(stock_quantity):
+    """The ``Product.stock_bucket`` value for a stock quantity"""
+    # Forms assign the raw string, e.g. stock_quantity='5'
+    stock_quantity = int(stock_quantity or 0)
+    if not stock_quantity:
+        return OUT_OF_STOCK
+    if stock_quantity < LOW_STOCK_THRESHOLD:
+        return LOW_STOCK
+    return IN_STOCK
+
+
+def stock_update_values(quantity):
+    """
+    ``update()`` keyword arguments setting ``stock_quantity`` to ``quantity``
+    (a number or an expression over the current row) along with its bucket.
+
+    The bucket is listed first: MySQL evaluates ``SET`` assignments left to
+    right against the columns already assigned, other databases against the
+    old row, and both agree when the bucket is set before the quantity.
+    """
+    if not hasattr(quantity, 'resolve_expression'):
+        return {'stock_bucket': stock_bucket_for(quantity), 'stock_quantity': quantity}
+    bucket = Case(
+        When(LessThanOrEqual(quantity, 0), then=Value(OUT_OF_STOCK)),
+        When(LessThan(quantity, LOW_STOCK_THRESHOLD), then=Value(LOW_STOCK)),
+        default=Value(IN_STOCK),
+        output_field=models.CharField(),
+    )
+    return {'stock_bucket': bucket, 'stock_quantity': quantity}
+
+
+class StockQuantityDescriptor(DeferredAttribute):
+    """
+    ``Product.stock_quantity`` that notes assignments to loaded products, so
+    that ``save()`` spreads the new value over the stock shards of products
+    in sharded-counter mode (``stock_shards > 0``).
+
+    Reads return the column, which ``products.sharded_stock`` keeps equal to
+    the sum of the shards once each stock change commits.
+    """
+
+    def __set__(self, instance, value):
+        data = instance.__dict__
+        data[self.field.attname] = value
+        # Loaded from the database, so this is an assignment rather than __init__
+        if instance._state.db is not None:
+            data['_stock_assigned'] = True
+
+
+class StockQuantityField(models.PositiveIntegerField):
+    descriptor_class = StockQuantityDescriptor
+
 
 class Product(models.Model):
     name = models.CharField(max_length=200)
@@ -11,17 +83,34 @@ class Product(models.Model):
     description = models.TextField()
     price = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(Decimal('0.01'))])
     category = models.ForeignKey(Category, on_delete=models.CASCADE, related_name='products')
-    stock_quantity = models.PositiveIntegerField(validators=[MinValueValidator(0)])
+    stock_quantity = StockQuantityField(validators=[MinValueValidator(0)])
+    # Number of StockShard rows holding this product's stock (stock_quantity
+    # then caches their total); 0 keeps it in stock_quantity
+    stock_shards = models.PositiveSmallIntegerField(default=0)
+    # Denormalized from stock_quantity on every write, so the stock feeds and
+    # counts are index lookups instead of range scans
+    stock_bucket = models.CharField(max_length=12, choices=STOCK_BUCKETS, default=IN_STOCK, editable=False)
     image = models.ImageField(upload_to='products/', blank=True, null=True)
     is_active = models.BooleanField(default=True)
     created_by = models.ForeignKey(User, on_delete=models.CASCADE, related_name='products')
     created_at = models.DateTimeField(auto_now_add=True)
-    updated_at = models.DateTimeField(auto_now=True)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
 
     class Meta:
         verbose_name = 'Product'
         verbose_name_plural = 'Products'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['stock_bucket', 'category', 'created_at'], name='product_stock_bucket'),
+            # Covers the category rollup recount
+            models.Index(fields=['category', 'is_active', 'stock_bucket'], name='product_category_rollup'),
+            # One per ProductCursorPagination ordering, so keyset pages are index range scans
+            models.Index(fields=['created_at', 'id'], name='product_cursor_created'),
+            models.Index(fields=['updated_at', 'id'], name='product_cursor_updated'),
+            models.Index(fields=['name', 'id'], name='product_cursor_name'),
+            models.Index(fields=['price', 'id'], name='product_cursor_price'),
+            models.Index(fields=['stock_quantity', 'id'], name='product_cursor_stock'),
+        ]
 
     def __str__(self):
         return self.name
@@ -29,7 +118,29 @@ class Product(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        self.stock_bucket = stock_bucket_for(self.stock_quantity)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'stock_quantity' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'stock_bucket'}
         super().save(*args, **kwargs)
+        if self.__dict__.pop('_stock_assigned', False) and self.stock_shards and (
+                update_fields is None or 'stock_quantity' in update_fields):
+            from .sharded_stock import set_total
+            set_total(self.pk, self.__dict__['stock_quantity'])
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # The stored state the category rollup moves away from when this instance is saved
+        from .rollups import product_state
+        instance._rollup_state = product_state(instance)
+        return instance
+
+    def refresh_from_db(self, *args, **kwargs):
+        super().refresh_from_db(*args, **kwargs)
+        self.__dict__.pop('_stock_assigned', None)
+        from .rollups import product_state
+        self._rollup_state = product_state(self)
 
     @property
     def is_in_stock(self):
@@ -41,3 +152,149 @@ class Product(models.Model):
             return 'Out of Stock'
         else:
             return 'In Stock'
+
+
+class StockShard(models.Model):
+    """
+    One of ``product.stock_shards`` sub-counters splitting a hot product's stock.
+
+    Decrements land on a random shard, so concurrent buyers lock different
+    rows instead of queueing on the product row. See ``products.sharded_stock``.
+    """
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='stock_shard_rows')
+    index = models.PositiveSmallIntegerField()
+    quantity = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Stock Shard'
+        verbose_name_plural = 'Stock Shards'
+        constraints = [
+            models.UniqueConstraint(fields=['product', 'index'], name='unique_stock_shard'),
+        ]
+
+    def __str__(self):
+        return f'{self.product_id}[{self.index}] = {self.quantity}'
+
+
+class StockReservation(models.Model):
+    """
+    Units of a product held for a checkout session until ``expires_at``.
+
+    Reserving takes the units out of ``Product.stock_quantity`` straight
+    away; releasing or expiring a hold puts them back, confirming keeps them
+    sold. See ``products.reservations``.
+    """
+    HELD = 'held'
+    CONFIRMED = 'confirmed'
+    RELEASED = 'released'
+    EXPIRED = 'expired'
+    STATUS_CHOICES = [
+        (HELD, 'Held'),
+        (CONFIRMED, 'Confirmed'),
+        (RELEASED, 'Released'),
+        (EXPIRED, 'Expired'),
+    ]
+
+    product = models.ForeignKey(Product, on_delete=models.CASCADE, related_name='reservations')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stock_reservations')
+    session = models.CharField(max_length=64, blank=True)
+    quantity = models.PositiveIntegerField(validators=[MinValueValidator(1)])
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=HELD)
+    expires_at = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name = 'Stock Reservation'
+        verbose_name_plural = 'Stock Reservations'
+        ordering = ['-created_at']
+        indexes = [
+            # The sweeper's scan for stale holds
+            models.Index(fields=['status', 'expires_at'], name='reservation_status_expiry'),
+        ]
+
+    def __str__(self):
+        return f'{self.quantity} x {self.product_id} ({self.status})'
+
+
+class CategoryRollup(models.Model):
+    """
+    Product counts for one category, kept current by ``products.rollups``.
+
+    ``in_stock_products`` and ``out_of_stock_products`` only count active products.
+    """
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, primary_key=True, related_name='rollup')
+    total_products = models.PositiveIntegerField(default=0)
+    active_products = models.PositiveIntegerField(default=0)
+    in_stock_products = models.PositiveIntegerField(default=0)
+    out_of_stock_products = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        verbose_name = 'Category Rollup'
+        verbose_name_plural = 'Category Rollups'
+
+    def __str__(self):
+        return f'{self.category_id}: {self.active_products}/{self.total_products} active'
+
+
+@receiver(post_save, sender=Product)
+def index_saved_product(sender, instance, **kwargs):
+    from .indexing import catalog_indexes
+    for index in catalog_indexes():
+        index.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_deleted_product(sender, instance, **kwargs):
+    from .indexing import catalog_indexes
+    for index in catalog_indexes():
+        index.remove_product(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+def reindex_category_products(sender, instance, **kwargs):
+    from .indexing import catalog_indexes
+    for index in catalog_indexes():
+        index.rename_category(instance.pk, instance.name)
+
+
+@receiver(products_bulk_updated)
+def reindex_bulk_updated_products(sender, product_ids, **kwargs):
+    from .indexing import catalog_indexes
+    product_ids = list(product_ids)
+    for index in catalog_indexes():
+        index.reindex_ids(product_ids)
+
+
+@receiver(post_save, sender=Product)
+def roll_up_saved_product(sender, instance, created, update_fields=None, **kwargs):
+    from .rollups import product_saved
+    product_saved(instance, created, update_fields)
+
+
+@receiver(post_delete, sender=Product)
+def roll_up_deleted_product(sender, instance, **kwargs):
+    from .rollups import product_deleted
+    product_deleted(instance)
+
+
+@receiver(post_save, sender=Category)
+def create_category_rollup(sender, instance, created, **kwargs):
+    if created:
+        CategoryRollup.objects.get_or_create(category=instance)
+
+
+@receiver(products_bulk_updated)
+def roll_up_bulk_updated_products(sender, product_ids, category_ids=(), rollup_states=None, **kwargs):
+    from .rollups import products_changed
+    products_changed(product_ids, category_ids, rollup_states)
+
+
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(products_bulk_updated)
+def invalidate_catalog_cache(sender, **kwargs):
+    from .caching import bump_catalog_generation
+    bump_catalog_generation()
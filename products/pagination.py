@@ -0,0 +1,200 @@
+import json
+from base64 import b64decode, b64encode
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def wants_cursor_pagination(request):
+    """Return True when the client asked for keyset (cursor) pagination"""
+    params = request.query_params
+    return 'cursor' in params or params.get('pagination') == 'cursor'
+
+
+class ProductCursorPagination(BasePagination):
+    """
+    Keyset pagination for product listings.
+
+    Pages are addressed by an opaque cursor holding the ``(ordering field, id)``
+    position of the first/last row of the previous page, so every page is an
+    index range scan instead of an ``OFFSET`` scan, and no ``COUNT(*)`` is run.
+    The ``id`` tiebreaker keeps positions unique for non-unique ordering fields.
+    """
+    page_size = 20
+    page_size_query_param = 'page_size'
+    max_page_size = 100
+    cursor_query_param = 'cursor'
+    ordering_param = 'ordering'
+    # Each has a ``(field, id)`` index on Product; add one with any new field
+    ordering_fields = ['name', 'price', 'created_at', 'updated_at', 'stock_quantity']
+    default_ordering = '-created_at'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.ordering = self.get_ordering(request, view)
+
+        field_name = self.ordering.lstrip('-')
+        descending = self.ordering.startswith('-')
+        self.model_field = self._get_model_field(queryset.model, field_name)
+
+        cursor = self.decode_cursor(request)
+        self.reverse = bool(cursor and cursor['r'])
+        # Walking backwards is the same scan with the direction flipped
+        scan_descending = descending != self.reverse
+        prefix = '-' if scan_descending else ''
+        queryset = queryset.order_by(f'{prefix}{field_name}', f'{prefix}id')
+
+        if cursor is not None:
+            lookup = 'lt' if scan_descending else 'gt'
+            value = cursor['v']
+            queryset = queryset.filter(
+                Q(**{f'{field_name}__{lookup}': value}) |
+                Q(**{field_name: value, f'id__{lookup}': cursor['i']})
+            )
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+            self.has_previous, self.has_next = has_more, True
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_page_size(self, request):
+        if self.page_size_query_param:
+            try:
+                return _positive_int(
+                    request.query_params[self.page_size_query_param],
+                    strict=True,
+                    cutoff=self.max_page_size
+                )
+            except (KeyError, ValueError):
+                pass
+        return self.page_size
+
+    def get_ordering(self, request, view=None):
+        """Use the first valid ``?ordering=`` field, falling back to the default"""
+        requested = request.query_params.get(self.ordering_param, '')
+        for term in requested.split(','):
+            term = term.strip()
+            if term and term.lstrip('-') in self.ordering_fields:
+                return term
+        return getattr(view, 'cursor_ordering', self.default_ordering)
+
+    def _get_model_field(self, model, field_name):
+        try:
+            return model._meta.get_field(field_name)
+        except FieldDoesNotExist:
+            raise NotFound(self.invalid_cursor_message)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            payload = json.loads(b64decode(encoded.encode('ascii')).decode('utf-8'))
+            if payload['o'] != self.ordering:
+                raise ValueError('cursor was issued for a different ordering')
+            return {
+                'v': self.model_field.to_python(payload['v']),
+                'i': int(payload['i']),
+                'r': bool(payload.get('r')),
+            }
+        except (TypeError, ValueError, KeyError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def encode_cursor(self, item, reverse):
+        value = self._position_value(item, self.model_field.attname)
+        payload = {
+            'o': self.ordering,
+            'v': _cursor_value(value),
+            'i': self._position_value(item, 'id'),
+        }
+        if reverse:
+            payload['r'] = 1
+        encoded = b64encode(json.dumps(payload, separators=(',', ':')).encode('utf-8')).decode('ascii')
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def _position_value(self, item, attname):
+        if isinstance(item, dict):
+            return item[attname]
+        return getattr(item, attname)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('previous', self.get_previous_link()),
+            ('results', data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            'type': 'object',
+            'required': ['results'],
+            'properties': {
+                'next': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'previous': {'type': 'string', 'nullable': True, 'format': 'uri'},
+                'results': schema,
+            },
+        }
+
+
+def _cursor_value(value):
+    """Serialize an ordering value so that ``Field.to_python`` can read it back"""
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if isinstance(value, (int, str)):
+        return value
+    return str(value)
+
+
+class CursorPaginationMixin:
+    """
+    Let clients opt into keyset pagination with ``?pagination=cursor``.
+
+    Requests without it keep the default page-number pagination (and its
+    ``count``), so existing clients are unaffected. ``cursor_pagination_actions``
+    limits the opt-in to the actions that page over products.
+    """
+    cursor_pagination_class = ProductCursorPagination
+    cursor_pagination_actions = None
+
+    def use_cursor_pagination(self):
+        if self.cursor_pagination_class is None:
+            return False
+        if self.cursor_pagination_actions is not None and self.action not in self.cursor_pagination_actions:
+            return False
+        return wants_cursor_pagination(self.request)
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            if self.use_cursor_pagination():
+                self._paginator = self.cursor_pagination_class()
+            else:
+                return super().paginator
+        return self._paginator
@@ -0,0 +1,173 @@
+"""
+Stock reservations: hold units for a checkout session, then confirm or release.
+
+Every state change is a conditional statement rather than a read followed by
+a write, so concurrent buyers never oversell and never wait on a lock taken
+for a read:
+
+- reserving decrements ``stock_quantity`` only ``WHERE stock_quantity >= n``
+- confirming and releasing only match holds still in the ``held`` state
+  (confirming also requires the hold not to have expired)
+- ``expire_stale_holds`` locks a batch of expired holds, skipping rows other
+  sweepers hold, marks them expired and returns their units with one
+  ``UPDATE`` per batch.
+
+Products in sharded-counter mode take and return units through
+``products.sharded_stock`` and leave the product row alone.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import sharded_stock
+from .models import Product, StockReservation, stock_update_values
+from .rollups import stock_moves
+from .signals import products_bulk_updated
+
+DEFAULT_TTL_SECONDS = 600
+DEFAULT_MAX_TTL_SECONDS = 3600
+DEFAULT_SWEEP_BATCH_SIZE = 500
+
+
+class ReservationError(Exception):
+    """A reservation could not be made or changed; ``code`` says why"""
+
+    def __init__(self, code, message):
+        super().__init__(message)
+        self.code = code
+        self.message = message
+
+
+def reservation_ttl(requested=None):
+    """Seconds a new hold lasts: the requested TTL capped at the maximum, or the default"""
+    default = getattr(settings, 'STOCK_RESERVATION_TTL_SECONDS', DEFAULT_TTL_SECONDS)
+    maximum = getattr(settings, 'STOCK_RESERVATION_MAX_TTL_SECONDS', DEFAULT_MAX_TTL_SECONDS)
+    if requested is None:
+        return default
+    return max(1, min(int(requested), maximum))
+
+
+def add_stock(quantities):
+    """
+    Return units to products: ``{product_id: units}``, one ``UPDATE`` for all
+    of them. Return ``{product_id: (old state, new state)}`` for the products
+    whose ``stock_quantity`` column changed, as ``products_bulk_updated``
+    takes them in ``rollup_states``.
+    """
+    if not quantities:
+        return {}
+    quantities = dict(quantities)
+    for product_id, shards in sharded_stock.sharded_products(quantities).items():
+        sharded_stock.give(product_id, quantities.pop(product_id), shards)
+    if not quantities:
+        return {}
+    Product.objects.filter(id__in=quantities).update(
+        **stock_update_values(F('stock_quantity') + Case(
+            *[When(id=product_id, then=Value(units)) for product_id, units in quantities.items()],
+            default=Value(0),
+            output_field=IntegerField(),
+        )),
+        updated_at=timezone.now(),
+    )
+    return stock_moves(quantities)
+
+
+def reserve(product, user, quantity, session='', ttl=None):
+    """
+    Hold ``quantity`` units of ``product`` (a ``Product`` or its id).
+
+    Raises ``ReservationError('insufficient_stock')`` when fewer units are
+    available; nothing is written in that case.
+    """
+    product_id = getattr(product, 'pk', product)
+    now = timezone.now()
+    with transaction.atomic():
+        taken = Product.objects.filter(
+            id=product_id, is_active=True, stock_shards=0, stock_quantity__gte=quantity
+        ).update(**stock_update_values(F('stock_quantity') - quantity), updated_at=now)
+        sharded = False
+        if taken:
+            moves = stock_moves({product_id: -quantity})
+        else:
+            shards = Product.objects.filter(id=product_id, is_active=True).values_list('stock_shards', flat=True).first()
+            sharded = bool(shards)
+            if not sharded or not sharded_stock.take(product_id, quantity, shards):
+                raise ReservationError('insufficient_stock', 'Not enough stock to reserve')
+        hold = StockReservation.objects.create(
+            product_id=product_id,
+            user=user,
+            session=session,
+            quantity=quantity,
+            expires_at=now + timedelta(seconds=reservation_ttl(ttl)),
+        )
+    if not sharded:
+        products_bulk_updated.send(sender=Product, product_ids=[product_id], rollup_states=moves)
+    return hold
+
+
+def confirm(hold):
+    """Turn an unexpired hold into a sale; its units stay out of stock"""
+    now = timezone.now()
+    changed = StockReservation.objects.filter(
+        id=hold.id, status=StockReservation.HELD, expires_at__gt=now
+    ).update(status=StockReservation.CONFIRMED, updated_at=now)
+    if not changed:
+        raise ReservationError('not_held', 'Reservation is no longer held')
+    hold.refresh_from_db()
+    return hold
+
+
+def release(hold):
+    """Cancel a hold and put its units back in stock"""
+    now = timezone.now()
+    with transaction.atomic():
+        changed = StockReservation.objects.filter(
+            id=hold.id, status=StockReservation.HELD
+        ).update(status=StockReservation.RELEASED, updated_at=now)
+        if not changed:
+            raise ReservationError('not_held', 'Reservation is no longer held')
+        returned = add_stock({hold.product_id: hold.quantity})
+    if returned:
+        products_bulk_updated.send(sender=Product, product_ids=list(returned), rollup_states=returned)
+    hold.refresh_from_db()
+    return hold
+
+
+def expire_stale_holds(batch_size=None, now=None):
+    """
+    Expire held reservations past ``expires_at`` and return their units.
+
+    Works through at most ``batch_size`` holds per transaction and returns the
+    number expired. Rows locked by a concurrent sweeper, or by a confirm or
+    release in flight, are skipped and picked up on a later pass.
+    """
+    batch_size = batch_size or getattr(settings, 'STOCK_RESERVATION_SWEEP_BATCH_SIZE', DEFAULT_SWEEP_BATCH_SIZE)
+    now = now or timezone.now()
+    expired = 0
+    while True:
+        with transaction.atomic():
+            holds = list(
+                StockReservation.objects
+                .select_for_update(skip_locked=True)
+                .filter(status=StockReservation.HELD, expires_at__lte=now)
+                .order_by('expires_at')
+                .values_list('id', 'product_id', 'quantity')[:batch_size]
+            )
+            if not holds:
+                return expired
+            StockReservation.objects.filter(id__in=[hold_id for hold_id, product_id, quantity in holds]).update(
+                status=StockReservation.EXPIRED, updated_at=now
+            )
+            quantities = defaultdict(int)
+            for hold_id, product_id, quantity in holds:
+                quantities[product_id] += quantity
+            returned = add_stock(quantities)
+        if returned:
+            products_bulk_updated.send(sender=Product, product_ids=list(returned), rollup_states=returned)
+        expired += len(holds)
+        if len(holds) < batch_size:
+            return expired
@@ -0,0 +1,210 @@
+"""
+Per-category product counts kept in ``CategoryRollup`` rows.
+
+Category listings, stats, the popular feed and the admin read these rows
+instead of counting products per category. The counts follow product writes:
+
+- a product saved or deleted through the ORM moves its category's counts by
+  the difference between the state it was loaded with and the state it was
+  saved with, as ``F()`` increments (no product rows are read)
+- writes reported through ``products_bulk_updated`` pass the old and new
+  state of each product as ``rollup_states`` when the sender knows them
+  (stock moves, bulk creates and updates) and are applied the same way;
+  products whose state did not change cost nothing
+- the categories of products sent without states (admin actions, switching
+  sharded stock on or off) are recounted with one grouped query over the
+  ``(category, is_active, stock_bucket)`` index
+
+Concurrent recounts can leave a row briefly behind;
+``manage.py reconcile_category_rollups`` recounts every category and repairs
+any drift.
+"""
+from django.db import connection
+from django.db.models import Case, Count, F, Q, Value, When
+
+from .models import OUT_OF_STOCK, CategoryRollup, Product, stock_bucket_for
+
+STATE_FIELDS = ('category_id', 'is_active', 'stock_bucket')
+COUNT_FIELDS = ('total_products', 'active_products', 'in_stock_products', 'out_of_stock_products')
+
+COUNT_CONDITIONS = {
+    'total_products': Q(),
+    'active_products': Q(is_active=True),
+    'in_stock_products': Q(is_active=True) & ~Q(stock_bucket=OUT_OF_STOCK),
+    'out_of_stock_products': Q(is_active=True, stock_bucket=OUT_OF_STOCK),
+}
+
+# Category querysets annotated with these read the counts in the same query
+ROLLUP_ANNOTATIONS = {f'rollup_{name}': F(f'rollup__{name}') for name in COUNT_FIELDS}
+
+
+def with_rollups(queryset):
+    """Annotate a ``Category`` queryset with its rollup counts"""
+    return queryset.annotate(**ROLLUP_ANNOTATIONS)
+
+
+def rollup_counts(category):
+    """
+    ``{count field: value}`` for a category.
+
+    Uses the ``with_rollups`` annotations when present, then the rollup row,
+    and counts the products only when the category has no row yet.
+    """
+    counts = {name: getattr(category, f'rollup_{name}', None) for name in COUNT_FIELDS}
+    if None not in counts.values():
+        return counts
+    row = CategoryRollup.objects.filter(category_id=category.pk).values(*COUNT_FIELDS).first()
+    if row is not None:
+        return row
+    return count_products(Product.objects.filter(category_id=category.pk)).get(category.pk, dict.fromkeys(COUNT_FIELDS, 0))
+
+
+def count_products(queryset):
+    """``{category_id: counts}`` for the products in ``queryset``, in one query"""
+    aggregates = {name: Count('id', filter=condition) for name, condition in COUNT_CONDITIONS.items()}
+    rows = queryset.order_by().values('category_id').annotate(**aggregates)
+    return {row.pop('category_id'): row for row in rows}
+
+
+def recount(category_ids=None):
+    """
+    Recount the given categories (every category when None) from the products.
+
+    Categories without products get zeroed rows. Returns the number of rows written.
+    """
+    from categories.models import Category
+
+    categories = Category.objects.order_by()
+    products = Product.objects.all()
+    if category_ids is not None:
+        category_ids = {category_id for category_id in category_ids if category_id is not None}
+        if not category_ids:
+            return 0
+        categories = categories.filter(id__in=category_ids)
+        products = products.filter(category_id__in=category_ids)
+
+    counts = count_products(products)
+    rows = [
+        CategoryRollup(category_id=category_id, **counts.get(category_id, dict.fromkeys(COUNT_FIELDS, 0)))
+        for category_id in categories.values_list('id', flat=True)
+    ]
+    # MySQL's ON DUPLICATE KEY UPDATE takes no conflict target
+    unique_fields = ['category'] if connection.features.supports_update_conflicts_with_target else None
+    CategoryRollup.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=unique_fields, update_fields=list(COUNT_FIELDS)
+    )
+    return len(rows)
+
+
+def product_state(product):
+    """``(category_id, is_active, stock_bucket)`` of a product instance, or None if not loaded"""
+    data = product.__dict__
+    if any(name not in data for name in STATE_FIELDS):
+        return None
+    category_id, is_active, stock_bucket = (data[name] for name in STATE_FIELDS)
+    return category_id, bool(is_active), stock_bucket
+
+
+def contribution(state):
+    category_id, is_active, stock_bucket = state
+    return category_id, {
+        'total_products': 1,
+        'active_products': int(is_active),
+        'in_stock_products': int(is_active and stock_bucket != OUT_OF_STOCK),
+        'out_of_stock_products': int(is_active and stock_bucket == OUT_OF_STOCK),
+    }
+
+
+def moved(name, value):
+    if value > 0:
+        return F(name) + value
+    # Never below zero: MySQL rejects negative values in unsigned columns
+    return Case(When(**{f'{name}__gte': abs(value)}, then=F(name) - abs(value)), default=Value(0))
+
+
+def stock_change(category_id, is_active, old_quantity, new_quantity):
+    """``(old state, new state)`` of a product whose stock went from ``old_quantity`` to ``new_quantity``"""
+    is_active = bool(is_active)
+    return (category_id, is_active, stock_bucket_for(old_quantity)), (category_id, is_active, stock_bucket_for(new_quantity))
+
+
+def stock_moves(deltas):
+    """
+    ``{product_id: (old state, new state)}`` for products whose stock column
+    was just moved by ``deltas`` (``{product_id: units added}``). Read inside
+    the transaction that moved it, while the rows are still locked.
+    """
+    rows = Product.objects.filter(id__in=list(deltas)).order_by().values_list(
+        'id', 'category_id', 'is_active', 'stock_quantity'
+    )
+    return {
+        product_id: stock_change(category_id, is_active, quantity - deltas[product_id], quantity)
+        for product_id, category_id, is_active, quantity in rows
+    }
+
+
+def apply_changes(changes):
+    """
+    Move the counts for products going from state ``old`` to ``new`` (either
+    may be None), given as ``(old, new)`` pairs: one ``UPDATE`` per category
+    whose counts move, none when no state changed.
+    """
+    deltas = {}
+    for old, new in changes:
+        if old == new:
+            continue
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None:
+                continue
+            category_id, counts = contribution(state)
+            totals = deltas.setdefault(category_id, dict.fromkeys(COUNT_FIELDS, 0))
+            for name, value in counts.items():
+                totals[name] += sign * value
+
+    missing = []
+    for category_id, totals in deltas.items():
+        updates = {name: moved(name, value) for name, value in totals.items() if value}
+        if not updates:
+            continue
+        if not CategoryRollup.objects.filter(category_id=category_id).update(**updates):
+            missing.append(category_id)
+    if missing:
+        recount(missing)
+
+
+def product_saved(product, created, update_fields=None):
+    old = None if created else product.__dict__.get('_rollup_state')
+    new = product_state(product)
+    if old is not None and new is not None and update_fields is not None:
+        # Fields left out of update_fields keep their stored values
+        saved = {'category_id' if name == 'category' else name for name in update_fields}
+        new = tuple(value if name in saved else stored for name, value, stored in zip(STATE_FIELDS, new, old))
+    if new is None or (old is None and not created):
+        # Not enough is known about the change to apply it as a delta
+        recount({product.category_id} | ({old[0]} if old else set()))
+    else:
+        apply_changes([(old, new)])
+    product._rollup_state = new
+
+
+def product_deleted(product):
+    state = product.__dict__.get('_rollup_state') or product_state(product)
+    if state is None:
+        recount({product.category_id})
+    else:
+        apply_changes([(state, None)])
+
+
+def products_changed(product_ids, category_ids=(), rollup_states=None):
+    """
+    Follow a ``products_bulk_updated`` write. Products in ``rollup_states``
+    (``{product_id: (old state, new state)}``) move their categories' counts;
+    the categories of the others, plus ``category_ids`` they may have left,
+    are recounted.
+    """
+    rollup_states = rollup_states or {}
+    apply_changes(rollup_states.values())
+    unknown = [product_id for product_id in product_ids if product_id not in rollup_states]
+    if unknown:
+        current = Product.objects.filter(id__in=unknown).order_by().values_list('category_id', flat=True).distinct()
+        recount(set(current) | set(category_ids))
@@ -0,0 +1,5 @@
+from .autocomplete import AutocompleteIndex, get_autocomplete_index
+from .index import SearchIndex, get_search_index
+from .text import tokenize
+
+__all__ = ['AutocompleteIndex', 'SearchIndex', 'get_autocomplete_index', 'get_search_index', 'tokenize']
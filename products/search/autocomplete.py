@@ -0,0 +1,223 @@
+"""
+Prefix completion over product and category names.
+
+Names are stored in a trie keyed by their normalized text and by each of the
+first few word starts, so "shoes" completes "Trail Running Shoes". Every node
+caches the top ``TOP_K`` entries of its subtree, which makes a lookup a walk
+down ``len(prefix)`` nodes with no scanning or sorting at query time.
+"""
+import re
+from collections import defaultdict
+
+from ..indexing import CatalogIndex, register_index
+from .text import normalize
+
+TOP_K = 10
+
+# Also complete from the start of the 2nd, 3rd and 4th word of a name
+MAX_WORD_STARTS = 4
+
+SPACES_RE = re.compile(r'[^a-z0-9]+')
+
+
+def completion_key(text):
+    """Normalize text the same way for indexing and for lookups"""
+    return SPACES_RE.sub(' ', normalize(text)).strip()
+
+
+def completion_keys(text):
+    key = completion_key(text)
+    if not key:
+        return []
+    keys = [key]
+    position = key.find(' ')
+    while position != -1 and len(keys) < MAX_WORD_STARTS:
+        keys.append(key[position + 1:])
+        position = key.find(' ', position + 1)
+    return keys
+
+
+class _Node:
+    __slots__ = ('children', 'terminals', 'top')
+
+    def __init__(self):
+        self.children = {}
+        self.terminals = set()
+        self.top = []
+
+
+class PrefixTrie:
+    """Trie whose nodes cache their subtree's heaviest entries"""
+
+    def __init__(self, top_k=TOP_K):
+        self.top_k = top_k
+        self.root = _Node()
+        self.weights = {}
+
+    def rank(self, entry_id):
+        # Heaviest first, ties broken by id for a stable order
+        return (-self.weights[entry_id], entry_id)
+
+    def insert(self, key, entry_id, weight):
+        self.weights[entry_id] = weight
+        node = self.root
+        path = [node]
+        for char in key:
+            node = node.children.setdefault(char, _Node())
+            path.append(node)
+        node.terminals.add(entry_id)
+        for node in path:
+            self._offer(node, entry_id)
+
+    def remove(self, key, entry_id):
+        path = [self.root]
+        node = self.root
+        for char in key:
+            node = node.children.get(char)
+            if node is None:
+                return
+            path.append(node)
+        node.terminals.discard(entry_id)
+
+        # Recompute cached tops bottom-up and prune nodes that became empty
+        for depth in range(len(path) - 1, -1, -1):
+            node = path[depth]
+            if entry_id in node.top:
+                self._recompute(node)
+            if depth and not node.children and not node.terminals:
+                del path[depth - 1].children[key[depth - 1]]
+
+    def forget(self, entry_id):
+        self.weights.pop(entry_id, None)
+
+    def lookup(self, prefix, limit=TOP_K):
+        node = self.root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return []
+        return node.top[:limit]
+
+    def _offer(self, node, entry_id):
+        top = node.top
+        if entry_id in top:
+            top.sort(key=self.rank)
+            return
+        if len(top) < self.top_k:
+            top.append(entry_id)
+            top.sort(key=self.rank)
+        elif self.rank(entry_id) < self.rank(top[-1]):
+            top[-1] = entry_id
+            top.sort(key=self.rank)
+
+    def _recompute(self, node):
+        candidates = set(node.terminals)
+        for child in node.children.values():
+            candidates.update(child.top)
+        node.top = sorted(candidates, key=self.rank)[:self.top_k]
+
+
+class AutocompleteIndex(CatalogIndex):
+    """
+    Completions for active products weighted by stock, and for categories
+    weighted by their number of active products.
+    """
+    label = 'autocomplete index'
+    product_fields = ('id', 'name', 'slug', 'category_id', 'is_active', 'stock_quantity', 'updated_at')
+    _deferred = None
+
+    def reset(self):
+        self.products = PrefixTrie()
+        self.categories = PrefixTrie()
+        self.product_entries = {}           # product_id -> (name, slug, weight, category_id)
+        self.category_counts = defaultdict(int)
+        self.indexed_categories = {}        # category_id -> keys in the category trie
+
+    def rebuild(self):
+        # Category weights change with every product added, so rank
+        # categories once at the end instead of after every row
+        with self._lock:
+            self._deferred = set()
+            try:
+                super().rebuild()
+            finally:
+                deferred, self._deferred = self._deferred, None
+                for category_id in deferred:
+                    self._refresh_category(category_id)
+
+    def add_row(self, product_id, name, slug, category_id, is_active, stock_quantity, updated_at):
+        if not is_active:
+            return
+        weight = stock_quantity or 0
+        self.product_entries[product_id] = (name, slug, weight, category_id)
+        for key in completion_keys(name):
+            self.products.insert(key, product_id, weight)
+        self.category_counts[category_id] += 1
+        self._refresh_category(category_id)
+
+    def remove_row(self, product_id):
+        entry = self.product_entries.pop(product_id, None)
+        if entry is None:
+            return
+        name, slug, weight, category_id = entry
+        for key in completion_keys(name):
+            self.products.remove(key, product_id)
+        self.products.forget(product_id)
+        self._decrement_category(category_id)
+
+    def _decrement_category(self, category_id):
+        if category_id is None:
+            return
+        self.category_counts[category_id] -= 1
+        if self.category_counts[category_id] <= 0:
+            del self.category_counts[category_id]
+        self._refresh_category(category_id)
+
+    def category_renamed(self, category_id, old_name, new_name):
+        self._unindex_category(category_id)
+        self.category_names[category_id] = new_name
+        self._refresh_category(category_id)
+
+    def _refresh_category(self, category_id):
+        if self._deferred is not None:
+            self._deferred.add(category_id)
+            return
+        self._unindex_category(category_id)
+        count = self.category_counts.get(category_id, 0)
+        name = self.category_names.get(category_id)
+        if not count or not name:
+            return
+        keys = completion_keys(name)
+        for key in keys:
+            self.categories.insert(key, category_id, count)
+        self.indexed_categories[category_id] = keys
+
+    def _unindex_category(self, category_id):
+        for key in self.indexed_categories.pop(category_id, ()):
+            self.categories.remove(key, category_id)
+        self.categories.forget(category_id)
+
+    def complete(self, prefix, limit=TOP_K):
+        """Return the heaviest product and category completions for ``prefix``"""
+        self.ensure_ready()
+        key = completion_key(prefix)
+        if not key:
+            return {'products': [], 'categories': []}
+        limit = max(1, min(limit, TOP_K))
+        with self._lock:
+            products = []
+            for product_id in self.products.lookup(key, limit):
+                name, slug, weight, category_id = self.product_entries[product_id]
+                products.append({'id': product_id, 'name': name, 'slug': slug})
+            categories = [
+                {'id': category_id, 'name': self.category_names[category_id]}
+                for category_id in self.categories.lookup(key, limit)
+            ]
+        return {'products': products, 'categories': categories}
+
+
+_index = register_index(AutocompleteIndex())
+
+
+def get_autocomplete_index():
+    return _index
@@ -0,0 +1,128 @@
+"""
+Typo-tolerant word lookup using symmetric-delete candidate generation.
+
+Every vocabulary word is stored under all the strings obtained by deleting up
+to ``max_distance`` characters from its first ``prefix_length`` characters.
+A misspelled query word generates the same deletes, so candidates are found
+with a handful of dictionary probes instead of comparing against every word,
+and only those candidates are checked with a real edit distance.
+"""
+from collections import defaultdict
+from itertools import combinations
+
+
+class FuzzyMatcher:
+    """Symmetric-delete dictionary over the words of product and category names"""
+
+    def __init__(self, max_distance=2, prefix_length=7):
+        self.max_distance = max_distance
+        self.prefix_length = prefix_length
+        self.clear()
+
+    def clear(self):
+        self.word_counts = {}
+        self.deletes = defaultdict(set)
+
+    def __contains__(self, word):
+        return word in self.word_counts
+
+    def __len__(self):
+        return len(self.word_counts)
+
+    def add(self, word):
+        count = self.word_counts.get(word, 0)
+        self.word_counts[word] = count + 1
+        if not count:
+            for variant in self._variants(word):
+                self.deletes[variant].add(word)
+
+    def discard(self, word):
+        count = self.word_counts.get(word)
+        if count is None:
+            return
+        if count > 1:
+            self.word_counts[word] = count - 1
+            return
+        del self.word_counts[word]
+        for variant in self._variants(word):
+            bucket = self.deletes.get(variant)
+            if bucket is not None:
+                bucket.discard(word)
+                if not bucket:
+                    del self.deletes[variant]
+
+    def allowed_distance(self, word):
+        """Short words tolerate fewer typos, otherwise everything matches everything"""
+        if len(word) <= 3:
+            return 0
+        if len(word) <= 5:
+            return min(1, self.max_distance)
+        return self.max_distance
+
+    def lookup(self, word, limit=3):
+        """
+        Return up to ``limit`` ``(word, distance)`` pairs closest to ``word``.
+
+        Closer words come first; ties go to the word used in more names.
+        """
+        max_distance = self.allowed_distance(word)
+        if word in self.word_counts:
+            return [(word, 0)]
+        if not max_distance:
+            return []
+
+        candidates = set()
+        for variant in self._variants(word, max_distance):
+            bucket = self.deletes.get(variant)
+            if bucket:
+                candidates.update(bucket)
+
+        matches = []
+        for candidate in candidates:
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+            distance = edit_distance(word, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((candidate, distance))
+        matches.sort(key=lambda match: (match[1], -self.word_counts[match[0]], match[0]))
+        return matches[:limit]
+
+    def _variants(self, word, max_distance=None):
+        max_distance = self.max_distance if max_distance is None else max_distance
+        prefix = word[:self.prefix_length]
+        variants = {prefix}
+        for distance in range(1, min(max_distance, len(prefix) - 1) + 1):
+            for positions in combinations(range(len(prefix)), distance):
+                variants.add(''.join(
+                    ch for i, ch in enumerate(prefix) if i not in positions
+                ))
+        return variants
+
+
+def edit_distance(source, target, max_distance):
+    """
+    Optimal string alignment distance (Levenshtein plus adjacent swaps).
+
+    Gives up early and returns ``max_distance + 1`` once every cell of a row
+    exceeds ``max_distance``.
+    """
+    if source == target:
+        return 0
+    previous_previous = None
+    previous = list(range(len(target) + 1))
+    for i, source_char in enumerate(source, 1):
+        current = [i] + [0] * len(target)
+        for j, target_char in enumerate(target, 1):
+            cost = 0 if source_char == target_char else 1
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + cost,
+            )
+            if (previous_previous is not None and i > 1 and j > 1
+                    and source_char == target[j - 2] and source[i - 2] == target_char):
+                current[j] = min(current[j], previous_previous[j - 2] + 1)
+        if min(current) > max_distance:
+            return max_distance + 1
+        previous_previous, previous = previous, current
+    return previous[-1]
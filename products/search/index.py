@@ -0,0 +1,186 @@
+"""
+Inverted index over products with BM25 ranking.
+
+See ``products.indexing`` for how the index is built and kept current.
+"""
+import math
+from collections import defaultdict, namedtuple
+
+from django.conf import settings
+
+from ..indexing import CatalogIndex, register_index
+from .fuzzy import FuzzyMatcher
+from .text import STOP_WORDS, stem, tokenize, words
+
+# Matches in the name count more than matches in the category or description
+FIELD_WEIGHTS = {
+    'name': 3.0,
+    'category': 2.0,
+    'description': 1.0,
+}
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Near matches score as if the term were this much rarer per edit
+FUZZY_PENALTY = 0.5
+
+SearchResult = namedtuple('SearchResult', ['hits', 'suggestion'])
+
+
+class SearchIndex(CatalogIndex):
+    """Inverted index mapping stemmed terms to weighted term frequencies per product"""
+    label = 'search index'
+    product_fields = ('id', 'name', 'description', 'category_id', 'is_active', 'updated_at')
+    snapshot_version = 3
+
+    def reset(self):
+        self.postings = defaultdict(dict)   # term -> {product_id: weighted tf}
+        self.doc_terms = {}                 # product_id -> (term, ...)
+        self.doc_lengths = {}               # product_id -> weighted length
+        self.doc_active = {}                # product_id -> is_active
+        self.doc_words = {}                 # product_id -> words of the name
+        self.fuzzy = FuzzyMatcher()
+        self.total_length = 0.0
+
+    def add_row(self, product_id, name, description, category_id, is_active, updated_at):
+        weighted = defaultdict(float)
+        fields = (
+            ('name', name),
+            ('category', self.category_names.get(category_id, '')),
+            ('description', description),
+        )
+        for field, text in fields:
+            weight = FIELD_WEIGHTS[field]
+            for term in tokenize(text):
+                weighted[term] += weight
+
+        for term, tf in weighted.items():
+            self.postings[term][product_id] = tf
+        length = sum(weighted.values())
+        self.doc_terms[product_id] = tuple(weighted)
+        self.doc_lengths[product_id] = length
+        self.doc_active[product_id] = bool(is_active)
+        self.total_length += length
+
+        name_words = tuple(set(words(name)))
+        for word in name_words:
+            self.fuzzy.add(word)
+        self.doc_words[product_id] = name_words
+
+    def remove_row(self, product_id):
+        for term in self.doc_terms.pop(product_id):
+            postings = self.postings.get(term)
+            if postings is not None:
+                postings.pop(product_id, None)
+                if not postings:
+                    del self.postings[term]
+        self.total_length -= self.doc_lengths.pop(product_id)
+        self.doc_active.pop(product_id)
+        for word in self.doc_words.pop(product_id):
+            self.fuzzy.discard(word)
+
+    def category_renamed(self, category_id, old_name, new_name):
+        if old_name is not None:
+            for word in set(words(old_name)):
+                self.fuzzy.discard(word)
+        for word in set(words(new_name)):
+            self.fuzzy.add(word)
+
+    # Querying
+
+    def search(self, query, active_only=True, fuzzy=True):
+        """
+        Return a ``SearchResult`` with ``(product_id, score)`` hits, best first.
+
+        Only the posting lists of the query terms are visited, so the cost
+        depends on how many products match rather than on catalog size.
+        Words that are not in the index are replaced by their closest
+        spellings, whose matches rank below exact ones; when the query as
+        typed matches nothing, the corrected query is offered as
+        ``suggestion``.
+        """
+        self.ensure_ready()
+        query_words = list(dict.fromkeys(
+            word for word in words(query) if word not in STOP_WORDS
+        ))
+        with self._lock:
+            known = [(stem(word), 1.0) for word in query_words if stem(word) in self.postings]
+            unknown = [word for word in query_words if stem(word) not in self.postings]
+            if not fuzzy or not unknown:
+                return SearchResult(self._score(known, active_only), None)
+
+            corrections = {}
+            weighted_terms = list(known)
+            for word in unknown:
+                matches = self.fuzzy.lookup(word)
+                if matches:
+                    corrections[word] = matches[0][0]
+                for candidate, distance in matches:
+                    weighted_terms.append((stem(candidate), FUZZY_PENALTY ** distance))
+
+            suggestion = None
+            if corrections and not self._score(known, active_only):
+                suggestion = ' '.join(corrections.get(word, word) for word in query_words)
+            return SearchResult(self._score(weighted_terms, active_only), suggestion)
+
+    def _score(self, weighted_terms, active_only):
+        doc_count = len(self)
+        if not doc_count or not weighted_terms:
+            return []
+        avg_length = self.total_length / doc_count or 1.0
+        scores = defaultdict(float)
+        for term, weight in weighted_terms:
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            df = len(postings)
+            idf = weight * math.log(1 + (doc_count - df + 0.5) / (df + 0.5))
+            for product_id, tf in postings.items():
+                if active_only and not self.doc_active[product_id]:
+                    continue
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[product_id] / avg_length)
+                scores[product_id] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        # Ties go to the newest product, matching the default list ordering
+        return sorted(scores.items(), key=lambda item: (-item[1], -item[0]))
+
+    def stats(self):
+        with self._lock:
+            return {
+                'products': len(self),
+                'terms': len(self.postings),
+                'categories': len(self.category_names),
+                'words': len(self.fuzzy),
+            }
+
+    # Snapshots
+
+    def snapshot_path(self):
+        return getattr(settings, 'SEARCH_INDEX_PATH', None)
+
+    def snapshot_state(self):
+        return {
+            'postings': dict(self.postings),
+            'doc_terms': self.doc_terms,
+            'doc_lengths': self.doc_lengths,
+            'doc_active': self.doc_active,
+            'doc_words': self.doc_words,
+            'fuzzy': self.fuzzy,
+            'total_length': self.total_length,
+        }
+
+    def restore_state(self, state):
+        self.postings = defaultdict(dict, state['postings'])
+        self.doc_terms = state['doc_terms']
+        self.doc_lengths = state['doc_lengths']
+        self.doc_active = state['doc_active']
+        self.doc_words = state['doc_words']
+        self.fuzzy = state['fuzzy']
+        self.total_length = state['total_length']
+
+
+_index = register_index(SearchIndex())
+
+
+def get_search_index():
+    return _index
@@ -0,0 +1,92 @@
+"""
+Text analysis shared by the search index: tokenizing and light stemming.
+"""
+import re
+import unicodedata
+
+TOKEN_RE = re.compile(r'[a-z0-9]+')
+
+STOP_WORDS = frozenset([
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'in', 'is',
+    'it', 'of', 'on', 'or', 'the', 'to', 'with',
+])
+
+# (suffix, replacement, minimum stem length) tried in order, first match wins
+SUFFIX_RULES = (
+    ('ational', 'ate', 2),
+    ('ization', 'ize', 2),
+    ('fulness', 'ful', 2),
+    ('iveness', 'ive', 2),
+    ('ousness', 'ous', 2),
+    ('ement', '', 3),
+    ('ment', '', 3),
+    ('ness', '', 3),
+    ('ity', '', 3),
+    ('ingly', '', 3),
+    ('edly', '', 3),
+    ('ied', 'y', 2),
+    ('ing', '', 3),
+    ('er', '', 3),
+    ('ed', '', 3),
+    ('ly', '', 3),
+)
+
+VOWELS = 'aeiou'
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'Café' and 'cafe' index the same"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(ch for ch in text if not unicodedata.combining(ch)).lower()
+
+
+def stem(word):
+    """
+    Reduce an English word to a stem with a small suffix-stripping stemmer.
+
+    It is deliberately lighter than a full Porter stemmer: product names are
+    short and mostly nouns, so plural/verb suffixes cover nearly all variants.
+    """
+    if len(word) <= 3 or word.isdigit():
+        return word
+    word = _strip_plural(word)
+    for suffix, replacement, min_stem in SUFFIX_RULES:
+        if word.endswith(suffix):
+            base = word[:-len(suffix)]
+            if len(base) < min_stem:
+                continue
+            base += replacement
+            if suffix in ('ing', 'ed'):
+                base = _restore_e(base)
+            return base
+    return word
+
+
+def _strip_plural(word):
+    if word.endswith(('ss', 'us', 'is')) or not word.endswith('s'):
+        return word
+    if word.endswith('ies'):
+        return word[:-3] + 'y'
+    if word.endswith(('sses', 'xes', 'zes', 'ches', 'shes')):
+        return word[:-2]
+    return word[:-1]
+
+
+def _restore_e(base):
+    """'running' -> 'runn' -> 'run', 'gaming' -> 'gam' -> 'game'"""
+    if len(base) > 3 and base[-1] == base[-2] and base[-1] not in 'lsz' + VOWELS:
+        return base[:-1]
+    if (len(base) <= 4 and len(base) >= 3 and base[-3] not in VOWELS
+            and base[-2] in VOWELS and base[-1] not in VOWELS + 'wxy'):
+        return base + 'e'
+    return base
+
+
+def words(text):
+    """Split text into normalized words, keeping stop words"""
+    return TOKEN_RE.findall(normalize(text))
+
+
+def tokenize(text):
+    """Split text into stemmed index terms, dropping stop words"""
+    return [stem(word) for word in words(text) if word not in STOP_WORDS]
@@ -1,5 +1,5 @@
 from rest_framework import serializers
-from .models import Product
+from .models import Product, StockReservation
 from categories.serializers import CategorySerializer
 
 
@@ -77,3 +77,17 @@ class ProductCreateUpdateSerializer(serializers.ModelSerializer):
             'name', 'description', 'price', 'category', 'stock_quantity', 
             'image', 'is_active'
         ]
+
+
+class StockReservationSerializer(serializers.ModelSerializer):
+    product = serializers.SlugRelatedField(slug_field='slug', queryset=Product.objects.filter(is_active=True))
+    ttl = serializers.IntegerField(write_only=True, required=False, min_value=1,
+                                   help_text='Seconds to hold the units (capped by the server)')
+
+    class Meta:
+        model = StockReservation
+        fields = [
+            'id', 'product', 'quantity', 'session', 'status',
+            'expires_at', 'created_at', 'updated_at', 'ttl'
+        ]
+        read_only_fields = ['status', 'expires_at', 'created_at', 'updated_at']
@@ -0,0 +1,224 @@
+"""
+Sharded stock counters for hot products.
+
+A product with ``stock_shards = K`` keeps its stock in K ``StockShard`` rows
+instead of ``Product.stock_quantity``. Each decrement is a conditional
+``UPDATE`` on one randomly chosen shard holding enough units, so concurrent
+buyers mostly lock different rows; only when no single shard can cover a
+request are the shards locked together and drained in order.
+
+``Product.stock_quantity`` holds the total of the shards, so instances,
+listings, filters, exports and the catalog indexes all read one value. Once
+the transaction that took or gave units commits, ``sync_totals`` writes the
+new total back with ``updated_at`` in its own short transaction and sends
+``products_bulk_updated``, so caches, conditional GETs, rollups and indexes
+follow; the product row is locked only for that write, never for the
+buyer's transaction. ``rebalance`` evens the shards out and repairs any
+drifted totals, and is meant to run periodically
+(``manage.py rebalance_stock_shards --loop``).
+"""
+import random
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Sum, Value, When
+from django.utils import timezone
+
+from .models import Product, StockShard, stock_update_values
+from .rollups import stock_change
+from .signals import products_bulk_updated
+
+
+def split(total, shards):
+    """``total`` units spread as evenly as possible over ``shards`` counters"""
+    base, extra = divmod(total, shards)
+    return [base + (1 if index < extra else 0) for index in range(shards)]
+
+
+def total(product_id):
+    return StockShard.objects.filter(product_id=product_id).aggregate(total=Sum('quantity'))['total'] or 0
+
+
+def sharded_products(product_ids):
+    """``{product_id: shard count}`` for the sharded products among ``product_ids``"""
+    return dict(
+        Product.objects.filter(id__in=product_ids, stock_shards__gt=0)
+        .order_by().values_list('id', 'stock_shards')
+    )
+
+
+def enable(product, shards):
+    """Move a product's stock into ``shards`` counters"""
+    if shards < 1:
+        raise ValueError('shards must be at least 1')
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        if product.stock_shards:
+            quantity = total(product.pk)
+            StockShard.objects.filter(product=product).delete()
+        else:
+            quantity = product.stock_quantity
+        StockShard.objects.bulk_create([
+            StockShard(product=product, index=index, quantity=units)
+            for index, units in enumerate(split(quantity, shards))
+        ])
+        Product.objects.filter(pk=product.pk).update(
+            stock_shards=shards, **stock_update_values(quantity), updated_at=timezone.now()
+        )
+    products_bulk_updated.send(sender=Product, product_ids=[product.pk])
+
+
+def disable(product):
+    """Fold a product's shards back into ``stock_quantity``"""
+    with transaction.atomic():
+        product = Product.objects.select_for_update().get(pk=product.pk)
+        quantity = total(product.pk)
+        StockShard.objects.filter(product=product).delete()
+        Product.objects.filter(pk=product.pk).update(
+            stock_shards=0, **stock_update_values(quantity), updated_at=timezone.now()
+        )
+    products_bulk_updated.send(sender=Product, product_ids=[product.pk])
+
+
+def sync_totals(product_ids):
+    """
+    Write the shard totals of sharded products back to ``stock_quantity``,
+    bumping ``updated_at`` where it changed; return ``{product_id: total}``
+    for those.
+    """
+    totals = {}
+    rollup_states = {}
+    for product_id in product_ids:
+        with transaction.atomic():
+            row = (
+                Product.objects.select_for_update().filter(id=product_id, stock_shards__gt=0)
+                .values_list('stock_quantity', 'category_id', 'is_active').first()
+            )
+            if row is None:
+                continue
+            column, category_id, is_active = row
+            quantity = total(product_id)
+            if quantity == column:
+                continue
+            Product.objects.filter(id=product_id).update(**stock_update_values(quantity), updated_at=timezone.now())
+        totals[product_id] = quantity
+        rollup_states[product_id] = stock_change(category_id, is_active, column, quantity)
+    if rollup_states:
+        products_bulk_updated.send(sender=Product, product_ids=list(rollup_states), rollup_states=rollup_states)
+    return totals
+
+
+def sync_on_commit(product_id):
+    transaction.on_commit(lambda: sync_totals([product_id]))
+
+
+def take_from_shard(product_id, index, quantity):
+    return StockShard.objects.filter(
+        product_id=product_id, index=index, quantity__gte=quantity
+    ).update(quantity=F('quantity') - quantity)
+
+
+def take(product_id, quantity, shards):
+    """
+    Remove ``quantity`` units from a sharded product; return False if it has fewer.
+
+    Tries a random shard first, then the other shards that can cover the
+    request, and only then locks every shard to gather units from several.
+    The product's total is synced once the caller's transaction commits.
+    """
+    if take_from_shard(product_id, random.randrange(shards), quantity):
+        sync_on_commit(product_id)
+        return True
+    candidates = list(
+        StockShard.objects.filter(product_id=product_id, quantity__gte=quantity)
+        .values_list('index', flat=True)
+    )
+    random.shuffle(candidates)
+    for index in candidates:
+        if take_from_shard(product_id, index, quantity):
+            sync_on_commit(product_id)
+            return True
+    if total(product_id) < quantity:
+        return False
+
+    # No single shard holds enough: drain several under lock
+    with transaction.atomic():
+        rows = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('index'))
+        if sum(row.quantity for row in rows) < quantity:
+            return False
+        remaining = quantity
+        for row in sorted(rows, key=lambda row: -row.quantity):
+            taken = min(row.quantity, remaining)
+            row.quantity -= taken
+            remaining -= taken
+            if not remaining:
+                break
+        StockShard.objects.bulk_update(rows, ['quantity'])
+    sync_on_commit(product_id)
+    return True
+
+
+def give(product_id, quantity, shards):
+    """Add ``quantity`` units to a random shard; the total is synced on commit"""
+    StockShard.objects.filter(product_id=product_id, index=random.randrange(shards)).update(
+        quantity=F('quantity') + quantity
+    )
+    sync_on_commit(product_id)
+
+
+def set_total(product_id, quantity):
+    """Replace a sharded product's stock with ``quantity``, spread evenly"""
+    with transaction.atomic():
+        rows = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('index'))
+        for row, units in zip(rows, split(quantity, len(rows))):
+            row.quantity = units
+        StockShard.objects.bulk_update(rows, ['quantity'])
+
+
+def rebalance(product_ids=None):
+    """
+    Even out the shards of sharded products and write their totals to ``stock_quantity``.
+
+    Returns ``{product_id: total}``. Each product's shards are locked only
+    while that product is rebalanced.
+    """
+    products = Product.objects.filter(stock_shards__gt=0)
+    if product_ids is not None:
+        products = products.filter(id__in=product_ids)
+
+    totals = {}
+    cached = {}
+    rows = products.order_by('id').values_list('id', 'stock_shards', 'stock_quantity', 'category_id', 'is_active')
+    for product_id, shards, column, category_id, is_active in rows:
+        cached[product_id] = (column, category_id, is_active)
+        with transaction.atomic():
+            rows = list(StockShard.objects.select_for_update().filter(product_id=product_id).order_by('index'))
+            quantity = sum(row.quantity for row in rows)
+            if len(rows) != shards:
+                # The shard count was changed: rebuild the rows
+                StockShard.objects.filter(product_id=product_id).delete()
+                StockShard.objects.bulk_create([
+                    StockShard(product_id=product_id, index=index, quantity=units)
+                    for index, units in enumerate(split(quantity, shards))
+                ])
+            else:
+                for row, units in zip(rows, split(quantity, shards)):
+                    row.quantity = units
+                StockShard.objects.bulk_update(rows, ['quantity'])
+        totals[product_id] = quantity
+
+    # Only totals that moved are written, so idle products stay cached
+    changed = {product_id: quantity for product_id, quantity in totals.items() if quantity != cached[product_id][0]}
+    if changed:
+        Product.objects.filter(id__in=changed).update(
+            **stock_update_values(Case(
+                *[When(id=product_id, then=Value(quantity)) for product_id, quantity in changed.items()],
+                output_field=IntegerField(),
+            )),
+            updated_at=timezone.now(),
+        )
+        rollup_states = {
+            product_id: stock_change(cached[product_id][1], cached[product_id][2], cached[product_id][0], quantity)
+            for product_id, quantity in changed.items()
+        }
+        products_bulk_updated.send(sender=Product, product_ids=list(changed), rollup_states=rollup_states)
+    return totals
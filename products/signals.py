@@ -0,0 +1,11 @@
+from django.dispatch import Signal
+
+# Sent with ``product_ids`` after writes that bypass ``Product.save()`` and
+# therefore ``post_save``, such as ``queryset.update()`` in admin actions or
+# ``bulk_create``/``bulk_update``. Writes that can move products to another
+# category also pass ``category_ids``, the categories they were in before.
+# Senders that know how each product's ``(category_id, is_active,
+# stock_bucket)`` changed pass ``rollup_states``, ``{product_id: (old, new)}``
+# (``old`` is None for new products), so category rollups move by the
+# difference instead of recounting.
+products_bulk_updated = Signal()
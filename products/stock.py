@@ -0,0 +1,146 @@
+"""
+Atomic stock adjustments for ``POST /api/products/adjust_stock/``.
+
+A batch of ``{slug, delta}`` items becomes a single conditional ``UPDATE``:
+each product's new quantity is ``stock_quantity + delta`` (a ``CASE`` over
+the slugs), and the ``WHERE`` clause only matches rows holding at least
+``-delta`` units, so stock can never go below zero and concurrent
+adjustments add up instead of overwriting each other. Deltas and results
+are kept inside the column's range, so nothing reaches the database as an
+out-of-range value.
+
+The same statement stamps ``updated_at`` with the batch's timestamp, which is
+how the follow-up read tells applied rows from rows the guard rejected.
+Products in sharded-counter mode are left out of that statement and adjusted
+shard by shard through ``products.sharded_stock``.
+"""
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+from django.utils import timezone
+
+from . import sharded_stock
+from .models import Product, stock_update_values
+from .rollups import stock_change
+from .signals import products_bulk_updated
+
+# Largest value of a PositiveIntegerField on every database Django supports
+MAX_STOCK_QUANTITY = 2 ** 31 - 1
+
+
+class StockAdjustmentResult:
+    def __init__(self):
+        self.applied = []
+        self.rejected = []
+
+    def reject(self, position, item, error, stock_quantity=None):
+        entry = {'index': position, 'error': error}
+        if isinstance(item, dict):
+            entry.update({key: item[key] for key in ('slug', 'delta') if key in item})
+        if stock_quantity is not None:
+            entry['stock_quantity'] = stock_quantity
+        self.rejected.append(entry)
+
+    def as_data(self):
+        return {
+            'applied': sorted(self.applied, key=lambda entry: entry['index']),
+            'rejected': sorted(self.rejected, key=lambda entry: entry['index']),
+        }
+
+
+def parse_adjustments(items, result):
+    """Return ``{slug: (position, delta)}`` for well-formed items, rejecting the rest"""
+    adjustments = {}
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            result.reject(position, item, 'Expected an object with slug and delta')
+            continue
+        slug, delta = item.get('slug'), item.get('delta')
+        if not isinstance(slug, str) or not slug:
+            result.reject(position, item, 'slug field is required')
+        elif isinstance(delta, bool) or not isinstance(delta, int):
+            result.reject(position, item, 'delta must be an integer')
+        elif abs(delta) > MAX_STOCK_QUANTITY:
+            result.reject(position, item, f'delta must be between -{MAX_STOCK_QUANTITY} and {MAX_STOCK_QUANTITY}')
+        elif slug in adjustments:
+            result.reject(position, item, 'Duplicate item for this product in the batch')
+        else:
+            adjustments[slug] = (position, delta)
+    return adjustments
+
+
+def adjust_stock(items):
+    """Apply ``+/-`` stock deltas to many products at once; return a ``StockAdjustmentResult``"""
+    result = StockAdjustmentResult()
+    adjustments = parse_adjustments(items, result)
+    if not adjustments:
+        return result
+
+    new_quantity = Case(
+        *[When(slug=slug, then=F('stock_quantity') + Value(delta))
+          for slug, (position, delta) in adjustments.items()],
+        default=F('stock_quantity'),
+        output_field=IntegerField(),
+    )
+    # Compared as stock >= -delta rather than stock + delta >= 0: MySQL
+    # refuses negative intermediate values on an unsigned column
+    required = Case(
+        *[When(slug=slug, then=Value(max(-delta, 0)))
+          for slug, (position, delta) in adjustments.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    ceiling = Case(
+        *[When(slug=slug, then=Value(MAX_STOCK_QUANTITY - max(delta, 0)))
+          for slug, (position, delta) in adjustments.items()],
+        default=Value(MAX_STOCK_QUANTITY),
+        output_field=IntegerField(),
+    )
+
+    now = timezone.now()
+    with transaction.atomic():
+        Product.objects.filter(
+            slug__in=adjustments, stock_shards=0, stock_quantity__gte=required, stock_quantity__lte=ceiling
+        ).update(
+            **stock_update_values(new_quantity), updated_at=now
+        )
+        rows = Product.objects.filter(slug__in=adjustments).order_by().values_list(
+            'id', 'slug', 'stock_quantity', 'updated_at', 'stock_shards', 'category_id', 'is_active'
+        )
+        current = {slug: (product_id, quantity, updated_at, shards, category_id, is_active)
+                   for product_id, slug, quantity, updated_at, shards, category_id, is_active in rows}
+
+        sharded = {}
+        for slug, (product_id, quantity, updated_at, shards, category_id, is_active) in current.items():
+            if shards:
+                delta = adjustments[slug][1]
+                if delta >= 0:
+                    sharded_stock.give(product_id, delta, shards)
+                    applied = True
+                else:
+                    applied = sharded_stock.take(product_id, -delta, shards)
+                sharded[slug] = (applied, sharded_stock.total(product_id))
+
+    rollup_states = {}
+    for slug, (position, delta) in adjustments.items():
+        item = {'slug': slug, 'delta': delta}
+        if slug not in current:
+            result.reject(position, item, 'Not found')
+            continue
+        product_id, quantity, updated_at, shards, category_id, is_active = current[slug]
+        if slug in sharded:
+            applied, quantity = sharded[slug]
+            if applied:
+                result.applied.append({'index': position, **item, 'stock_quantity': quantity})
+            else:
+                result.reject(position, item, 'Insufficient stock', quantity)
+        elif updated_at == now:
+            rollup_states[product_id] = stock_change(category_id, is_active, quantity - delta, quantity)
+            result.applied.append({'index': position, **item, 'stock_quantity': quantity})
+        elif delta > 0:
+            result.reject(position, item, f'Stock cannot exceed {MAX_STOCK_QUANTITY}', quantity)
+        else:
+            result.reject(position, item, 'Insufficient stock', quantity)
+
+    if rollup_states:
+        products_bulk_updated.send(sender=Product, product_ids=list(rollup_states), rollup_states=rollup_states)
+    return result
@@ -0,0 +1,36 @@
+from django.db import connections
+
+
+def iter_keyset(queryset, fields, batch_size=2000):
+    """
+    Yield ``values_list`` tuples for ``fields`` in primary-key order.
+
+    Rows are read in ``id > last_id`` batches rather than one big ``SELECT``:
+    the MySQL drivers buffer whole result sets client side, so this is what
+    keeps memory flat when walking millions of products. ``fields`` must
+    start with ``'id'``.
+    """
+    if not fields or fields[0] != 'id':
+        raise ValueError("fields must start with 'id'")
+    queryset = queryset.order_by('id')
+    last_id = None
+    while True:
+        batch = queryset if last_id is None else queryset.filter(id__gt=last_id)
+        rows = list(batch.values_list(*fields)[:batch_size])
+        if not rows:
+            return
+        yield from rows
+        if len(rows) < batch_size:
+            return
+        last_id = rows[-1][0]
+
+
+def init_pool_worker():
+    """Give each process-pool worker its own database connections"""
+    import django
+    from django.apps import apps
+
+    if not apps.ready:
+        # Spawned rather than forked: Django has to be set up again
+        django.setup()
+    connections.close_all()
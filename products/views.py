@@ -1,18 +1,34 @@
-from rest_framework import viewsets, status, filters
+from rest_framework import mixins, viewsets, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly, IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
 from django.shortcuts import get_object_or_404
-from .models import Product
+from categories.models import Category
+from ecommerce_api.fieldsets import SparseFieldsetMixin
+from ecommerce_api.timing import ServerTimingMixin
+from .models import LOW_STOCK, OUT_OF_STOCK, Product, StockReservation
 from .serializers import (
-    ProductSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer
+    ProductSerializer, ProductDetailSerializer, ProductCreateUpdateSerializer,
+    StockReservationSerializer
 )
+from .bitmaps import get_bitmap_index
+from .bulk import ERROR, bulk_create_products, bulk_max_items, bulk_update_products
+from .caching import cached_catalog_response
+from .compiled_serializers import CompiledListSerializer, rows_in_order
+from .conditional import conditional_catalog_response
+from .export import CSVRenderer, NDJSONRenderer, stream_export
+from .facets import compute_facets, wants_facets
 from .filters import ProductFilter
+from .pagination import CursorPaginationMixin, wants_cursor_pagination
+from .reservations import ReservationError, confirm, release, reserve
+from .search import get_autocomplete_index, get_search_index
+from .stock import adjust_stock
 
+AUTOCOMPLETE_LIMIT = 8
 
-class ProductViewSet(viewsets.ModelViewSet):
+
+class ProductViewSet(ServerTimingMixin, SparseFieldsetMixin, CursorPaginationMixin, viewsets.ModelViewSet):
     """
     ViewSet for Product model providing full CRUD operations.
     
@@ -23,9 +39,26 @@ class ProductViewSet(viewsets.ModelViewSet):
     - PUT /api/products/{slug}/ - Update a product (authenticated)
     - PATCH /api/products/{slug}/ - Update a product (authenticated)
     - DELETE /api/products/{slug}/ - Delete a product (authenticated)
+    - POST /api/products/bulk/ - Create a batch of products (authenticated)
+    - PATCH /api/products/bulk/ - Update a batch of products by slug (authenticated)
+    - POST /api/products/adjust_stock/ - Apply stock deltas to many products at once (authenticated)
     - GET /api/products/search/ - Search products (public)
+    - GET /api/products/autocomplete/ - Complete product and category names (public)
+    - GET /api/products/export/ - Stream the whole filtered catalog as NDJSON or CSV (public)
     - GET /api/products/out-of-stock/ - Get out of stock products (public)
 
+    The list endpoint accepts ``?pagination=cursor`` (plus ``page_size`` and
+    ``ordering``) to switch to keyset pagination with next/previous cursors.
+    Plain page-number listings filtered by category, stock, price and active
+    flag are served from the in-memory bitmap index (``products.bitmaps``).
+    List and search responses include category, price and stock-status
+    counts for the whole result set under ``facets`` with ``?facets=true``.
+    Anonymous list and detail responses are cached (``products.caching``),
+    and both answer conditional requests with 304 (``products.conditional``).
+    List, retrieve, search and export accept ``?fields=`` / ``?exclude=`` to
+    return (and read) only some fields.
+    Search results are ranked in memory by the search index and keep
+    page-number pagination.
     """
     queryset = Product.objects.filter(is_active=True)
     serializer_class = ProductSerializer
@@ -36,6 +69,19 @@ class ProductViewSet(viewsets.ModelViewSet):
     ordering_fields = ['name', 'price', 'created_at', 'updated_at', 'stock_quantity']
     ordering = ['-created_at']
     lookup_field = 'slug'
+    cursor_pagination_actions = ['list']
+    sparse_fieldset_actions = ('list', 'retrieve', 'search', 'export', 'out_of_stock', 'low_stock')
+    sparse_field_columns = {
+        'image': ['image'],
+        'stock_status': ['stock_quantity'],
+        'is_in_stock': ['stock_quantity'],
+    }
+    # Builds list and search results from values() rows instead of model instances
+    compiled_list_serializer = CompiledListSerializer(
+        ProductSerializer,
+        related_strings={'category': 'category__name'},
+        media_fields=('image',),
+    )
 
     def get_permissions(self):
         """Set permissions based on action"""
@@ -56,6 +102,59 @@ class ProductViewSet(viewsets.ModelViewSet):
             queryset = queryset.filter(is_active=True)
         return queryset
 
+    @conditional_catalog_response('products.list')
+    @cached_catalog_response('products.list')
+    def list(self, request, *args, **kwargs):
+        selection = None
+        if not wants_cursor_pagination(request):
+            selection = get_bitmap_index().select(
+                request.query_params, active_only=not request.user.is_authenticated
+            )
+        if selection is None:
+            compiled = self.get_compiled_serializer()
+            if compiled is None:
+                response = super().list(request, *args, **kwargs)
+            else:
+                fields = self.get_sparse_fields()
+                extra = ()
+                if self.use_cursor_pagination():
+                    extra = (self.paginator.get_ordering(request, self).lstrip('-'),)
+                queryset = compiled.values(self.filter_queryset(self.get_queryset()), fields, extra)
+                page = self.paginate_queryset(queryset)
+                if page is not None:
+                    response = self.get_paginated_response(compiled.render(page, request, fields))
+                else:
+                    response = Response(compiled.render(queryset, request, fields))
+            if wants_facets(request) and isinstance(response.data, dict):
+                response.data['facets'] = compute_facets(self.filter_queryset(self.get_queryset()))
+            return response
+
+        # Common filter combinations are answered by the bitmap index, and
+        # only the products on the requested page are read from the database
+        page = self.paginate_queryset(selection)
+        if page is not None:
+            response = self.get_paginated_response(self.serialize_products(page))
+        else:
+            response = Response(self.serialize_products(selection))
+        if wants_facets(request) and isinstance(response.data, dict):
+            response.data['facets'] = selection.facets()
+        return response
+
+    @conditional_catalog_response('products.detail')
+    @cached_catalog_response('products.detail')
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def conditional_querysets(self, slug=None):
+        """Rows a GET response is built from, for ETag / Last-Modified"""
+        if self.action == 'retrieve':
+            # The nested category counts the category's active products
+            category_id = self.get_queryset().filter(slug=slug).values_list('category_id', flat=True).first()
+            if category_id is None:
+                return None
+            return [Product.objects.filter(category_id=category_id), Category.objects.filter(id=category_id)]
+        return [self.filter_queryset(self.get_queryset()), Category.objects.all()]
+
     def perform_create(self, serializer):
         """Create a new product and set the creator"""
         serializer.save(created_by=self.request.user)
@@ -71,7 +170,7 @@ class ProductViewSet(viewsets.ModelViewSet):
 
     @action(detail=False, methods=['get'])
     def search(self, request):
-        """Advanced search functionality"""
+        """Full-text search ranked by BM25 relevance, tolerant of typos"""
         query = request.query_params.get('q', '')
         if not query:
             return Response(
@@ -79,36 +178,138 @@ class ProductViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        queryset = self.get_queryset().filter(
-            Q(name__icontains=query) |
-            Q(description__icontains=query) |
-            Q(category__name__icontains=query)
-        )
+        result = get_search_index().search(query, active_only=not request.user.is_authenticated)
+        product_ids = [product_id for product_id, score in result.hits]
         
-        page = self.paginate_queryset(queryset)
+        page = self.paginate_queryset(product_ids)
         if page is not None:
-            serializer = self.get_serializer(page, many=True)
-            return self.get_paginated_response(serializer.data)
+            response = self.get_paginated_response(self.serialize_products(page))
+        else:
+            response = Response(self.serialize_products(product_ids))
         
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        if result.suggestion and isinstance(response.data, dict):
+            response.data['did_you_mean'] = result.suggestion
+        if wants_facets(request) and isinstance(response.data, dict):
+            response.data['facets'] = get_bitmap_index().select_ids(product_ids).facets()
+        return response
+
+    @action(detail=False, methods=['get'])
+    def autocomplete(self, request):
+        """Complete a name prefix with the best-stocked products and largest categories"""
+        query = request.query_params.get('q', '')
+        if not query:
+            return Response(
+                {'error': 'Search query parameter "q" is required'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            limit = int(request.query_params.get('limit', AUTOCOMPLETE_LIMIT))
+        except ValueError:
+            return Response(
+                {'error': 'limit must be an integer'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(get_autocomplete_index().complete(query, limit))
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """Create (POST) or update by slug (PATCH) up to PRODUCT_BULK_MAX_ITEMS products at once"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Request body must be a non-empty list of products'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_items = bulk_max_items()
+        if len(items) > max_items:
+            return Response(
+                {'error': f'At most {max_items} products can be sent in one request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        context = self.get_serializer_context()
+        if request.method == 'POST':
+            result = bulk_create_products(items, request.user, context)
+            success_status = status.HTTP_201_CREATED
+        else:
+            result = bulk_update_products(items, context)
+            success_status = status.HTTP_200_OK
+
+        failed = result.count(ERROR)
+        if not failed:
+            response_status = success_status
+        elif failed == len(items):
+            response_status = status.HTTP_400_BAD_REQUEST
+        else:
+            response_status = status.HTTP_207_MULTI_STATUS
+        return Response(result.as_data(), status=response_status)
+
+    @action(detail=False, methods=['get'], renderer_classes=[NDJSONRenderer, CSVRenderer])
+    def export(self, request):
+        """Stream every product matching the filters, NDJSON by default or CSV with ?format=csv"""
+        queryset = self.filter_queryset(self.get_queryset())
+        return stream_export(
+            self.compiled_list_serializer, queryset, request,
+            request.accepted_renderer, self.get_sparse_fields(),
+        )
+
+    def fetch_in_order(self, product_ids):
+        """Load products by id, keeping the order of ``product_ids``"""
+        products = self.project_queryset(self.get_queryset()).in_bulk(product_ids)
+        return [products[product_id] for product_id in product_ids if product_id in products]
+
+    def get_compiled_serializer(self):
+        """The compiled serializer, when the current action uses the class it compiles"""
+        compiled = self.compiled_list_serializer
+        if compiled is not None and self.get_serializer_class() is compiled.serializer_class:
+            return compiled
+        return None
+
+    def serialize_products(self, product_ids):
+        """Serialize products by id, in the order of ``product_ids``"""
+        product_ids = list(product_ids)
+        compiled = self.get_compiled_serializer()
+        if compiled is None:
+            return self.get_serializer(self.fetch_in_order(product_ids), many=True).data
+        fields = self.get_sparse_fields()
+        rows = compiled.values(self.get_queryset().filter(id__in=product_ids), fields)
+        return compiled.render(rows_in_order(rows, product_ids), self.request, fields)
+
+    def stock_feed(self, request, bucket):
+        """One stock bucket, paginated; takes the usual filters, e.g. ``?category=``"""
+        queryset = self.filter_queryset(self.get_queryset().filter(stock_bucket=bucket))
+        compiled = self.get_compiled_serializer()
+        fields = self.get_sparse_fields()
+        rows = compiled.values(queryset, fields)
+        page = self.paginate_queryset(rows)
+        if page is not None:
+            return self.get_paginated_response(compiled.render(page, request, fields))
+        return Response(compiled.render(rows, request, fields))
 
     @action(detail=False, methods=['get'])
     def out_of_stock(self, request):
         """Get products that are out of stock"""
-        out_of_stock_products = self.get_queryset().filter(stock_quantity=0)
-        serializer = self.get_serializer(out_of_stock_products, many=True)
-        return Response(serializer.data)
+        return self.stock_feed(request, OUT_OF_STOCK)
 
     @action(detail=False, methods=['get'])
     def low_stock(self, request):
         """Get products with low stock (less than 10 items)"""
-        low_stock_products = self.get_queryset().filter(
-            stock_quantity__lt=10, 
-            stock_quantity__gt=0
-        )
-        serializer = self.get_serializer(low_stock_products, many=True)
-        return Response(serializer.data)
+        return self.stock_feed(request, LOW_STOCK)
+
+    @action(detail=False, methods=['get'])
+    def stock_counts(self, request):
+        """Number of products per stock status, optionally for one ``?category=``"""
+        category = request.query_params.get('category')
+        if category is not None:
+            try:
+                category = int(category)
+            except ValueError:
+                return Response(
+                    {'error': 'category must be an integer'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+        counts = get_bitmap_index().stock_counts(category, active_only=not request.user.is_authenticated)
+        return Response({'category': category, 'counts': counts})
 
     @action(detail=True, methods=['post'])
     def update_stock(self, request, slug=None):
@@ -136,14 +337,35 @@ class ProductViewSet(viewsets.ModelViewSet):
             )
         
         product.stock_quantity = new_stock
-        product.save()
+        product.save(update_fields=['stock_quantity', 'updated_at'])
         
         serializer = self.get_serializer(product)
         return Response(serializer.data)
 
+    @action(detail=False, methods=['post'])
+    def adjust_stock(self, request):
+        """Add or remove stock for many products in one guarded UPDATE; stock never goes below zero"""
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'error': 'Request body must be a non-empty list of {"slug", "delta"} items'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        max_items = bulk_max_items()
+        if len(items) > max_items:
+            return Response(
+                {'error': f'At most {max_items} adjustments can be sent in one request'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
-
-
+        data = adjust_stock(items).as_data()
+        if not data['rejected']:
+            response_status = status.HTTP_200_OK
+        elif data['applied']:
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_409_CONFLICT
+        return Response(data, status=response_status)
 
     @action(detail=True, methods=['post'])
     def toggle_active(self, request, slug=None):
@@ -163,3 +385,58 @@ class ProductViewSet(viewsets.ModelViewSet):
             'message': f'Product {"activated" if product.is_active else "deactivated"} successfully',
             'product': serializer.data
         })
+
+
+class StockReservationViewSet(ServerTimingMixin, mixins.CreateModelMixin, mixins.RetrieveModelMixin,
+                              mixins.ListModelMixin, viewsets.GenericViewSet):
+    """
+    Stock holds for checkout (see ``products.reservations``).
+
+    Available actions:
+    - GET /api/reservations/ - List your reservations (authenticated)
+    - POST /api/reservations/ - Hold units of a product for a session (authenticated)
+    - GET /api/reservations/{id}/ - Retrieve a reservation (authenticated)
+    - POST /api/reservations/{id}/confirm/ - Turn a hold into a sale (authenticated)
+    - POST /api/reservations/{id}/release/ - Give the held units back (authenticated)
+
+    Holds expire after their TTL and are returned to stock by
+    ``manage.py expire_reservations``.
+    """
+    serializer_class = StockReservationSerializer
+    permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend, filters.OrderingFilter]
+    filterset_fields = ['status', 'session']
+    ordering_fields = ['created_at', 'expires_at']
+
+    def get_queryset(self):
+        return StockReservation.objects.filter(user=self.request.user).select_related('product')
+
+    def create(self, request, *args, **kwargs):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        try:
+            hold = reserve(
+                data['product'], request.user, data['quantity'],
+                session=data.get('session', ''), ttl=data.get('ttl')
+            )
+        except ReservationError as exc:
+            return Response({'error': exc.message}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(hold).data, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def confirm(self, request, pk=None):
+        """Confirm a hold that has not expired"""
+        return self.change_hold(confirm)
+
+    @action(detail=True, methods=['post'])
+    def release(self, request, pk=None):
+        """Release a hold and return its units to stock"""
+        return self.change_hold(release)
+
+    def change_hold(self, change):
+        try:
+            hold = change(self.get_object())
+        except ReservationError as exc:
+            return Response({'error': exc.message}, status=status.HTTP_409_CONFLICT)
+        return Response(self.get_serializer(hold).data)